@@ -0,0 +1,321 @@
+"""Benchmark suite of validation, auth, scoring and end-to-end serving.
+
+Microbenchmarks report the best time per call of several repeats. The
+end-to-end benchmark serves requests with `MainHTTPHandler` and an
+in-process fake store, keeping one connection per client thread, and
+reports throughput and latency percentiles.
+
+Results are written as JSON. With `--compare` the results are checked
+against a previous run and the script fails if any benchmark got slower
+by more than `--threshold`.
+
+Usage: python benchmarks/bench_suite.py [-n <number>] [-o <results.json>]
+           [-k <substring>] [--e2e-requests <n>] [--e2e-clients <n>]
+           [--compare <baseline.json> [--threshold <fraction>]]
+"""
+import hashlib
+import http.client
+import json
+import platform
+import sys
+import threading
+import time
+import timeit
+import typing as t
+from optparse import OptionParser
+
+from otus_scoring_api import codec, handlers, packing
+from otus_scoring_api.api import MainHTTPHandler, ThreadPoolHTTPServer
+from otus_scoring_api.classes import (
+    ArgumentsField,
+    BirthDayField,
+    CharField,
+    ClientIDsField,
+    ClientsInterestsRequest,
+    DateField,
+    EmailField,
+    GenderField,
+    MethodRequest,
+    OnlineScoreRequest,
+    PhoneField,
+)
+from otus_scoring_api.constants import SALT
+from otus_scoring_api.loadgen import percentile
+from otus_scoring_api.scoring import (
+    get_interests,
+    get_interests_many,
+    get_score,
+    score_key_in_store,
+)
+from otus_scoring_api.store import AbstractStore
+
+METHOD_BODY = {
+    "account": "horns&hoofs",
+    "login": "h&f",
+    "method": "online_score",
+    "token": hashlib.sha512(f"horns&hoofsh&f{SALT}".encode()).hexdigest(),
+    "arguments": {},
+}
+SCORE_ARGUMENTS = {
+    "phone": "79175002040",
+    "email": "stupnikov@otus.ru",
+    "first_name": "Stanislav",
+    "last_name": "Stupnikov",
+    "birthday": "01.01.1990",
+    "gender": 1,
+}
+INTERESTS_ARGUMENTS = {"client_ids": [1, 2, 3, 4], "date": "20.07.2017"}
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books"]
+CLIENTS = 100
+
+
+class FakeStore(AbstractStore):
+    """Dict-based store, with `cache` unset every cache lookup misses"""
+
+    def __init__(self, cache: bool = True):
+        super(FakeStore, self).__init__()
+        self.data = {
+            f"i:{cid}": packing.pack_interests(
+                INTERESTS[: cid % len(INTERESTS)]
+            )
+            for cid in range(CLIENTS)
+        }
+        self.cached: t.Optional[t.Dict[str, t.Any]] = {} if cache else None
+
+    def get(self, key: str) -> t.Any:
+        return self.data.get(key)
+
+    def set(self, key: str, value: t.Any) -> None:
+        self.data[key] = value
+
+    def cache_get(self, key: str) -> t.Any:
+        return self.cached.get(key) if self.cached is not None else None
+
+    def cache_set(self, key: str, value: t.Any, timeout: float) -> None:
+        if self.cached is not None:
+            self.cached[key] = value
+
+
+def score_kwargs() -> t.Dict[str, t.Any]:
+    args = OnlineScoreRequest(**SCORE_ARGUMENTS)
+    return handlers.score_arguments(args)
+
+
+def cold_check_auth(request: MethodRequest) -> bool:
+    handlers._verified_auth.clear()
+    return handlers.check_auth(request)
+
+
+def micro_cases() -> t.Dict[str, t.Callable[[], t.Any]]:
+    hit_store, miss_store = FakeStore(), FakeStore(cache=False)
+    kwargs = score_kwargs()
+    get_score(hit_store, **kwargs)
+    method_request = MethodRequest(**METHOD_BODY)
+    birthday = kwargs["birthday"]
+    cids = [str(cid) for cid in range(CLIENTS)]
+    return {
+        "MethodRequest": lambda: MethodRequest(**METHOD_BODY),
+        "OnlineScoreRequest": lambda: OnlineScoreRequest(**SCORE_ARGUMENTS),
+        "ClientsInterestsRequest": lambda: ClientsInterestsRequest(
+            **INTERESTS_ARGUMENTS
+        ),
+        "MethodRequest attrs": lambda req=method_request: (
+            req.is_admin,
+            req.method,
+            req.account,
+            req.login,
+            req.token,
+            req.arguments,
+        ),
+        "CharField.validate": lambda f=CharField(): f.validate("Stanislav"),
+        "ArgumentsField.validate": (
+            lambda f=ArgumentsField(): f.validate(SCORE_ARGUMENTS)
+        ),
+        "EmailField.validate": (
+            lambda f=EmailField(): f.validate("stupnikov@otus.ru")
+        ),
+        "PhoneField.validate": lambda f=PhoneField(): f.validate(
+            "79175002040"
+        ),
+        "DateField.validate": lambda f=DateField(): f.validate("20.07.2017"),
+        "BirthDayField.validate": (
+            lambda f=BirthDayField(): f.validate("01.01.1990")
+        ),
+        "GenderField.validate": lambda f=GenderField(): f.validate(1),
+        "ClientIDsField.validate": (
+            lambda f=ClientIDsField(): f.validate([1, 2, 3, 4])
+        ),
+        "check_auth": lambda: handlers.check_auth(method_request),
+        "check_auth cold": lambda: cold_check_auth(method_request),
+        "score_key_in_store": lambda: score_key_in_store(
+            "79175002040", birthday, "Stanislav", "Stupnikov"
+        ),
+        "get_score hit": lambda: get_score(hit_store, **kwargs),
+        "get_score miss": lambda: get_score(miss_store, **kwargs),
+        "get_interests": lambda: get_interests(hit_store, "5"),
+        f"get_interests_many {CLIENTS}": lambda: get_interests_many(
+            hit_store, cids, raw=True
+        ),
+    }
+
+
+def run_micro(
+    cases: t.Dict[str, t.Callable[[], t.Any]], number: int
+) -> t.Dict[str, t.Dict[str, float]]:
+    results = {}
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        results[name] = {"us_per_op": round(best / number * 1e6, 4)}
+        print(f"{name:<32} {best / number * 1e6:10.2f} us/op", file=sys.stderr)
+    return results
+
+
+def run_e2e(requests_number: int, clients: int) -> t.Dict[str, t.Any]:
+    handler_class = type(
+        "BenchHTTPHandler",
+        (MainHTTPHandler,),
+        {"store": FakeStore(), "max_requests": requests_number + 1},
+    )
+    server = ThreadPoolHTTPServer(("127.0.0.1", 0), handler_class, clients)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    interests_body = dict(
+        METHOD_BODY,
+        method="clients_interests",
+        arguments={"client_ids": list(range(10))},
+    )
+    bodies = [
+        json.dumps(dict(METHOD_BODY, arguments=SCORE_ARGUMENTS)),
+        json.dumps(interests_body),
+    ]
+    latencies: t.List[float] = []
+    errors = []
+
+    def client(n: int) -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        own = []
+        for i in range(n):
+            started = time.perf_counter()
+            conn.request("POST", "/method", bodies[i % len(bodies)])
+            resp = conn.getresponse()
+            resp.read()
+            own.append(time.perf_counter() - started)
+            if resp.status != 200:
+                errors.append(resp.status)
+        conn.close()
+        latencies.extend(own)
+
+    per_client = max(1, requests_number // clients)
+    threads = [
+        threading.Thread(target=client, args=(per_client,))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+
+    latencies.sort()
+    result = {
+        "requests": len(latencies),
+        "clients": clients,
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            name: round(percentile(latencies, p) * 1e3, 3)
+            for name, p in (("p50", 50), ("p95", 95), ("p99", 99))
+        },
+    }
+    result["latency_ms"]["max"] = round(latencies[-1] * 1e3, 3)
+    print(
+        f"{'MainHTTPHandler e2e':<32} {result['rps']:10.1f} req/s "
+        f"p50 {result['latency_ms']['p50']} ms "
+        f"p99 {result['latency_ms']['p99']} ms",
+        file=sys.stderr,
+    )
+    return result
+
+
+def compare(
+    results: t.Dict[str, t.Any], baseline: t.Dict[str, t.Any], threshold: float
+) -> t.List[str]:
+    """Return descriptions of the benchmarks slower than the baseline"""
+    regressions = []
+    for name, current in results["micro"].items():
+        previous = baseline.get("micro", {}).get(name)
+        if previous and current["us_per_op"] > previous["us_per_op"] * (
+            1 + threshold
+        ):
+            regressions.append(
+                f"{name}: {previous['us_per_op']} -> "
+                f"{current['us_per_op']} us/op"
+            )
+    previous = baseline.get("e2e")
+    current = results.get("e2e")
+    if (
+        previous
+        and current
+        and current["rps"] < previous["rps"] / (1 + threshold)
+    ):
+        regressions.append(f"e2e: {previous['rps']} -> {current['rps']} req/s")
+    return regressions
+
+
+def main():
+    op = OptionParser()
+    op.add_option("-n", "--number", action="store", type=int, default=20000)
+    op.add_option("-o", "--output", action="store", default=None)
+    op.add_option(
+        "-k",
+        "--keyword",
+        action="store",
+        default=None,
+        help="run only the microbenchmarks containing this substring",
+    )
+    op.add_option("--e2e-requests", action="store", type=int, default=4000)
+    op.add_option(
+        "--e2e-clients",
+        action="store",
+        type=int,
+        default=4,
+        help="number of concurrent clients, 0 to skip the e2e benchmark",
+    )
+    op.add_option("--compare", action="store", default=None)
+    op.add_option("--threshold", action="store", type=float, default=0.1)
+    (opts, args) = op.parse_args()
+
+    cases = micro_cases()
+    if opts.keyword:
+        cases = {k: v for k, v in cases.items() if opts.keyword in k}
+    results = {
+        "python": platform.python_version(),
+        "json_backend": codec.backend,
+        "timestamp": time.time(),
+        "micro": run_micro(cases, opts.number),
+    }
+    if opts.e2e_clients > 0 and not opts.keyword:
+        results["e2e"] = run_e2e(opts.e2e_requests, opts.e2e_clients)
+
+    data = json.dumps(results, indent=2)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(results, json.load(f), opts.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import socket
+import time
+import typing as t
+import uuid
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import parse_headers
+
+from otus_scoring_api import codec, metrics
+from otus_scoring_api.constants import (
+    BAD_REQUEST,
+    INTERNAL_ERROR,
+    NOT_FOUND,
+    OK,
+)
+from otus_scoring_api.handlers import (
+    async_batch_handler,
+    async_iter_response,
+    async_join_response,
+    async_method_handler,
+    make_response,
+)
+from otus_scoring_api.logs import AccessLog
+from otus_scoring_api.timing import PhaseTimer
+
+if t.TYPE_CHECKING:
+    from http.client import HTTPMessage
+
+    from otus_scoring_api.store import AbstractAsyncStore
+
+NOT_IMPLEMENTED = 501
+
+DEFAULT_KEEPALIVE_TIMEOUT: float = 5.0
+DEFAULT_KEEPALIVE_REQUESTS: int = 100
+# seconds to read a request, idle connections are closed sooner
+DEFAULT_REQUEST_TIMEOUT: float = 15.0
+
+
+class AsyncHTTPServer:
+    """Asyncio based counterpart of `HTTPServer` with `MainHTTPHandler`.
+
+    Connections are served by coroutines of a single event loop, so the
+    number of requests waiting for the store is not bound to a number of
+    threads. Like `MainHTTPHandler`, connections are kept alive for up to
+    `max_requests` requests and closed after `keepalive_timeout` seconds
+    without a request. A connection is closed as well when the body of a
+    request does not come within `request_timeout` seconds.
+    """
+
+    router = {"method": async_method_handler, "batch": async_batch_handler}
+    server_version = "OtusScoringAPI"
+
+    def __init__(
+        self,
+        store: AbstractAsyncStore,
+        stream_threshold: t.Optional[int] = None,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        max_requests: int = DEFAULT_KEEPALIVE_REQUESTS,
+        access_log: t.Optional[AccessLog] = None,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+    ):
+        self.store = store
+        self.access_log = access_log or AccessLog()
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.max_requests = max_requests
+        # keyword arguments of the route handlers, stored interests are
+        # written into responses without re-encoding
+        self.handler_options = {
+            "raw_interests": True,
+            "stream_threshold": stream_threshold,
+        }
+
+    @staticmethod
+    def get_request_id(headers: HTTPMessage) -> str:
+        return headers.get("HTTP_X_REQUEST_ID", uuid.uuid4().hex)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            for n in range(1, self.max_requests + 1):
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                command, path, version, headers = request
+                keep_alive = n < self.max_requests and wants_keep_alive(
+                    version, headers
+                )
+                if command == "POST":
+                    # without the length the next request cannot be found
+                    keep_alive = (
+                        keep_alive
+                        and str(headers.get("Content-Length", "")).isdigit()
+                    )
+                    if version == "HTTP/1.1" and (
+                        headers.get("Expect", "").lower() == "100-continue"
+                    ):
+                        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    code, body, timing = await self.do_POST(
+                        path, headers, reader, version == "HTTP/1.1"
+                    )
+                    content_type = "application/json"
+                elif command == "GET":
+                    code, body = self.do_GET(path)
+                    content_type, timing = metrics.CONTENT_TYPE, None
+                else:
+                    code, body, keep_alive = NOT_IMPLEMENTED, b"", False
+                    content_type, timing = "application/json", None
+                if isinstance(body, bytes):
+                    writer.write(
+                        self.response_head(
+                            code, len(body), keep_alive, content_type, timing
+                        )
+                        + body
+                    )
+                elif not await self.send_stream(
+                    writer, code, body, keep_alive, timing
+                ):
+                    keep_alive = False
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            # the body has not come, the connection cannot be reused
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(
+        self, reader: asyncio.StreamReader
+    ) -> t.Optional[t.Tuple[str, str, str, HTTPMessage]]:
+        """Read the request line and headers, None if there is no request"""
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout
+            )
+            request_line, _, raw_headers = head.partition(b"\r\n")
+            command, path, version = request_line.decode("latin-1").split(
+                " ", 2
+            )
+            headers = parse_headers(io.BytesIO(raw_headers))
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            asyncio.TimeoutError,
+            ConnectionError,
+            ValueError,
+        ):
+            return None
+        return command, path, version, headers
+
+    async def send_stream(
+        self,
+        writer: asyncio.StreamWriter,
+        code: int,
+        parts: t.AsyncIterator[bytes],
+        keep_alive: bool = False,
+        server_timing: t.Optional[str] = None,
+    ) -> bool:
+        """Send the response body with chunked transfer encoding.
+
+        Returns False if the transfer is broken because of an error.
+        """
+        writer.write(
+            self.response_head(
+                code, None, keep_alive, server_timing=server_timing
+            )
+        )
+        try:
+            async for part in parts:
+                if part:
+                    writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+                    await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # the status is sent already, so the error can only be reported
+            # by breaking the transfer without the last chunk
+            logging.exception("Error while streaming the response: %s" % e)
+            return False
+        return True
+
+    async def do_POST(
+        self,
+        path: str,
+        headers: HTTPMessage,
+        reader: asyncio.StreamReader,
+        chunked: bool = True,
+    ) -> t.Tuple[int, t.Union[bytes, t.AsyncIterator[bytes]], str]:
+        """Perform the request, return the code, body and `Server-Timing`.
+
+        Without `chunked` (HTTP/1.0 clients) a streamed response is
+        encoded as a whole.
+        """
+        timer = PhaseTimer()
+        response, code = {}, OK
+        context = {"request_id": self.get_request_id(headers), "path": path}
+        data_string = None
+        request = None
+        try:
+            data_string = await asyncio.wait_for(
+                reader.readexactly(int(headers["Content-Length"])),
+                self.request_timeout,
+            )
+            timer.mark("read")
+            request = codec.loads(data_string)
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            logging.info("cannot parse request, %s: %s", type(e), e)
+            code = BAD_REQUEST
+        timer.mark("parse")
+
+        if code == OK:
+            route = path.strip("/")
+            if route in self.router:
+                try:
+                    response, code = await self.router[route](
+                        {"body": request, "headers": headers, "timer": timer},
+                        context,
+                        self.store,
+                        **self.handler_options,
+                    )
+                except Exception as e:
+                    logging.exception("Unexpected error: %s" % e)
+                    code = INTERNAL_ERROR
+            else:
+                code = NOT_FOUND
+
+        body: t.Union[bytes, t.AsyncIterator[bytes]]
+        logged_body: t.Optional[bytes]
+        if isinstance(response, codec.RawJSONStream) and chunked:
+            body = async_iter_response(response, code)
+            logged_body = None
+        else:
+            if isinstance(response, codec.RawJSONStream):
+                code, body = await async_join_response(response, code)
+            else:
+                body = bytes(codec.dumps_raw(make_response(response, code)))
+            logged_body = body
+            timer.mark("serialize")
+        self.access_log.log(
+            context,
+            code,
+            time.perf_counter() - timer.started,
+            data_string,
+            logged_body,
+            timer.phases,
+        )
+        return code, body, timer.server_timing()
+
+    def do_GET(self, path: str) -> t.Tuple[int, bytes]:
+        if path.split("?", 1)[0] != "/metrics":
+            return NOT_FOUND, b""
+        return OK, metrics.render(self.store)
+
+    def response_head(
+        self,
+        code: int,
+        content_length: t.Optional[int] = None,
+        keep_alive: bool = False,
+        content_type: str = "application/json",
+        server_timing: t.Optional[str] = None,
+    ) -> bytes:
+        """Build the status line and headers, chunked without the length"""
+        try:
+            phrase = HTTPStatus(code).phrase
+        except ValueError:
+            phrase = ""
+        if content_length is None:
+            length = "Transfer-Encoding: chunked"
+        else:
+            length = f"Content-Length: {content_length}"
+        if keep_alive:
+            connection = (
+                f"Connection: keep-alive\r\n"
+                f"Keep-Alive: timeout={int(self.keepalive_timeout)}\r\n"
+            )
+        else:
+            connection = "Connection: close\r\n"
+        timing = ""
+        if server_timing is not None:
+            timing = f"Server-Timing: {server_timing}\r\n"
+        return (
+            f"HTTP/1.1 {code} {phrase}\r\n"
+            f"Server: {self.server_version}\r\n"
+            f"Date: {formatdate(usegmt=True)}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"{length}\r\n"
+            f"{connection}"
+            f"{timing}"
+            f"\r\n"
+        ).encode("latin-1")
+
+    async def start(
+        self,
+        host: t.Optional[str] = None,
+        port: t.Optional[int] = None,
+        sock: t.Optional[socket.socket] = None,
+    ) -> asyncio.AbstractServer:
+        if sock is not None:
+            # asyncio expects either an address or a socket
+            host = port = None
+        return await asyncio.start_server(
+            self.handle_connection, host, port, sock=sock
+        )
+
+    async def serve_forever(
+        self,
+        host: t.Optional[str] = None,
+        port: t.Optional[int] = None,
+        sock: t.Optional[socket.socket] = None,
+    ) -> None:
+        server = await self.start(host, port, sock)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.store.close()
+
+
+def wants_keep_alive(version: str, headers: HTTPMessage) -> bool:
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return version == "HTTP/1.1" and connection != "close"
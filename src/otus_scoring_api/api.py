@@ -1,51 +1,185 @@
-import json
+import asyncio
+import atexit
 import logging
+import socket
+import threading
+import time
+import typing as t
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from optparse import OptionParser
 
+from otus_scoring_api import codec, metrics
+from otus_scoring_api.aio import (
+    AsyncHTTPServer,
+    DEFAULT_KEEPALIVE_REQUESTS,
+    DEFAULT_KEEPALIVE_TIMEOUT,
+    DEFAULT_REQUEST_TIMEOUT,
+)
+from otus_scoring_api.breaker import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+)
+from otus_scoring_api.cache import DEFAULT_MAX_ENTRIES
 from otus_scoring_api.constants import (
     BAD_REQUEST,
-    ERRORS,
     INTERNAL_ERROR,
     NOT_FOUND,
     OK,
 )
-from otus_scoring_api.handlers import method_handler
-from otus_scoring_api.store import DEFAULT_REDIS_URL, RedisStore
+from otus_scoring_api.handlers import (
+    batch_handler,
+    iter_response,
+    join_response,
+    make_response,
+    method_handler,
+)
+from otus_scoring_api.logs import (
+    AccessLog,
+    DEFAULT_MAX_BODY_SIZE,
+    setup_logging,
+)
+from otus_scoring_api.prefork import PreforkServer
+from otus_scoring_api.scoring import interests_key_in_store
+from otus_scoring_api.store import (
+    AsyncRedisStore,
+    DEFAULT_REDIS_URL,
+    DEFAULT_TIMEOUT,
+    RedisStore,
+)
+from otus_scoring_api.timing import PhaseTimer, Profiler
+from otus_scoring_api.tracking import (
+    DEFAULT_FALLBACK_TIMEOUT,
+    DEFAULT_TRACKING_TIMEOUT,
+)
+
+DEFAULT_THREADS: int = 0
+DEFAULT_WORKERS: int = 0
+ENGINES = ("sync", "asyncio")
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
-    router = {"method": method_handler}
+    """Handler of the API requests.
+
+    Connections are kept alive between requests unless the client asks to
+    close them. A connection is closed after `max_requests` requests, when
+    no request comes within `keepalive_timeout` seconds, or when all the
+    workers of the server are busy, so idle clients do not hold workers
+    needed by the waiting ones. Reading a request may take up to `timeout`
+    seconds. Pipelined requests are served in order.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = DEFAULT_REQUEST_TIMEOUT
+    keepalive_timeout = DEFAULT_KEEPALIVE_TIMEOUT
+    max_requests = DEFAULT_KEEPALIVE_REQUESTS
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+    router = {"method": method_handler, "batch": batch_handler}
+    # keyword arguments of the route handlers, stored interests are written
+    # into responses without re-encoding
+    handler_options: t.Dict[str, t.Any] = {"raw_interests": True}
+    access_log = AccessLog()
+    # samples requests to be profiled, see `Profiler`
+    profiler: t.Optional[Profiler] = None
     store = None
 
     @staticmethod
     def get_request_id(headers):
         return headers.get("HTTP_X_REQUEST_ID", uuid.uuid4().hex)
 
+    def setup(self):
+        super(MainHTTPHandler, self).setup()
+        self.requests_handled = 0
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def wait_for_request(self) -> bool:
+        """Wait up to `keepalive_timeout` seconds for the next request"""
+        self.connection.settimeout(self.keepalive_timeout)
+        try:
+            # returns pipelined data at once, empty bytes on EOF
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def send_connection_headers(self):
+        self.requests_handled += 1
+        if self.requests_handled >= self.max_requests or getattr(
+            self.server, "saturated", False
+        ):
+            self.close_connection = True
+        if self.close_connection:
+            self.send_header("Connection", "close")
+            return
+        self.send_header("Connection", "keep-alive")
+        self.send_header(
+            "Keep-Alive",
+            f"timeout={int(self.keepalive_timeout)}, "
+            f"max={self.max_requests - self.requests_handled}",
+        )
+
+    def log_request(self, code="-", size="-"):
+        # requests are logged by `access_log`
+        pass
+
+    def log_message(self, format, *args):
+        logging.info("%s " + format, self.address_string(), *args)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(NOT_FOUND)
+            return
+        body = metrics.render(self.store)
+        self.send_response(OK)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_connection_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_POST(self):
+        profile = self.profiler.start() if self.profiler else None
+        timer = PhaseTimer()
         response, code = {}, OK
-        context = {"request_id": self.get_request_id(self.headers)}
+        context = {
+            "request_id": self.get_request_id(self.headers),
+            "path": self.path,
+        }
         data_string = None
         request = None
         try:
             data_string = self.rfile.read(int(self.headers["Content-Length"]))
-            request = json.loads(data_string)
+            timer.mark("read")
+            request = codec.loads(data_string)
         except Exception as e:
             logging.info("cannot parse request, %s: %s", type(e), e)
             code = BAD_REQUEST
+            if data_string is None:
+                # the body is not read, the next request cannot be found
+                self.close_connection = True
+        timer.mark("parse")
 
-        if request:
+        if code == OK:
             path = self.path.strip("/")
-            logging.info(
-                "%s: '%s' %s" % (self.path, data_string, context["request_id"])
-            )
             if path in self.router:
                 try:
                     response, code = self.router[path](
-                        {"body": request, "headers": self.headers},
+                        {
+                            "body": request,
+                            "headers": self.headers,
+                            "timer": timer,
+                        },
                         context,
                         self.store,
+                        **self.handler_options,
                     )
                 except Exception as e:
                     logging.exception("Unexpected error: %s" % e)
@@ -53,19 +187,248 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
             else:
                 code = NOT_FOUND
 
+        body = None
+        stream = isinstance(response, codec.RawJSONStream)
+        if stream and self.request_version == "HTTP/1.1":
+            self.send_stream(code, iter_response(response, code), timer)
+        else:
+            if stream:
+                # chunked transfer encoding is not supported by HTTP/1.0
+                code, body = join_response(response, code)
+            else:
+                body = codec.dumps_raw(make_response(response, code))
+            timer.mark("serialize")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Server-Timing", timer.server_timing())
+            self.send_connection_headers()
+            self.end_headers()
+            self.wfile.write(body)
+        self.access_log.log(
+            context,
+            code,
+            time.perf_counter() - timer.started,
+            data_string,
+            body,
+            timer.phases,
+        )
+        if profile is not None:
+            self.profiler.stop(profile, context["request_id"])
+
+    def send_stream(
+        self,
+        code: int,
+        parts: t.Iterator[bytes],
+        timer: t.Optional[PhaseTimer] = None,
+    ) -> None:
+        """Send the response body with chunked transfer encoding"""
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        if timer is not None:
+            # the batches fetched while streaming are not counted
+            self.send_header("Server-Timing", timer.server_timing())
+        self.send_connection_headers()
         self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
-        else:
-            r = {
-                "error": response or ERRORS.get(code, "Unknown Error"),
-                "code": code,
-            }
-        context.update(r)
-        logging.info(context)
-        self.wfile.write(json.dumps(r).encode("utf-8"))
+        try:
+            for part in parts:
+                if part:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception as e:
+            # the status is sent already, so the error can only be reported
+            # by breaking the transfer without the last chunk
+            logging.exception("Error while streaming the response: %s" % e)
+            self.close_connection = True
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTP server which handles connections in a bounded pool of threads.
+
+    The accept loop blocks while all workers are busy, so pending
+    connections wait in the listen backlog instead of piling up in memory.
+    Meanwhile the server is `saturated` and handlers stop keeping
+    connections alive.
+    """
+
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address,
+        handler_class,
+        threads: int,
+        bind_and_activate: bool = True,
+    ):
+        if threads < 1:
+            raise ValueError("number of threads must be positive")
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="worker"
+        )
+        self._slots = threading.BoundedSemaphore(threads)
+        self._threads = threads
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+        super(ThreadPoolHTTPServer, self).__init__(
+            server_address, handler_class, bind_and_activate
+        )
+
+    @property
+    def saturated(self) -> bool:
+        """Whether all the workers are busy"""
+        return self._busy >= self._threads
+
+    def _acquire_slot(self):
+        self._slots.acquire()
+        with self._busy_lock:
+            self._busy += 1
+
+    def _release_slot(self):
+        with self._busy_lock:
+            self._busy -= 1
+        self._slots.release()
+
+    def process_request(self, request, client_address):
+        self._acquire_slot()
+        try:
+            self._executor.submit(
+                self.process_request_thread, request, client_address
+            )
+        except RuntimeError:
+            # executor is already shut down
+            self._release_slot()
+            self.shutdown_request(request)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._release_slot()
+
+    def server_close(self):
+        super(ThreadPoolHTTPServer, self).server_close()
+        self._executor.shutdown(wait=True)
+
+
+def make_server(
+    port: int,
+    threads: int = DEFAULT_THREADS,
+    sock: t.Optional[socket.socket] = None,
+) -> HTTPServer:
+    """Create a server listening on `port` or on the already bound `sock`"""
+    address = ("0.0.0.0", port)
+    bind_and_activate = sock is None
+    if threads > 0:
+        server = ThreadPoolHTTPServer(
+            address, MainHTTPHandler, threads, bind_and_activate
+        )
+    else:
+        server = HTTPServer(address, MainHTTPHandler, bind_and_activate)
+    if sock is not None:
+        server.socket.close()
+        server.socket = sock
+        server.server_address = sock.getsockname()
+    return server
+
+
+async def serve_async(
+    port: int,
+    redis_url: str,
+    sock: t.Optional[socket.socket] = None,
+    stream_threshold: t.Optional[int] = None,
+    keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+    keepalive_requests: int = DEFAULT_KEEPALIVE_REQUESTS,
+    access_log: t.Optional[AccessLog] = None,
+    **store_options,
+) -> None:
+    # the async store is bound to the event loop, so create it inside
+    store = AsyncRedisStore(url=redis_url, **store_options)
+    server = AsyncHTTPServer(
+        store,
+        stream_threshold,
+        keepalive_timeout,
+        keepalive_requests,
+        access_log,
+    )
+    await server.serve_forever("0.0.0.0", port, sock)
+
+
+def store_options(opts) -> t.Dict[str, t.Any]:
+    return dict(
+        cache_max_entries=opts.cache_max_entries,
+        cache_max_bytes=opts.cache_max_bytes,
+        timeout=opts.redis_timeout,
+        connect_timeout=opts.redis_connect_timeout,
+        max_connections=opts.redis_max_connections,
+        pool_timeout=opts.redis_pool_timeout,
+        socket_keepalive=opts.redis_keepalive,
+        health_check_interval=opts.redis_health_check_interval,
+        breaker_failure_threshold=opts.redis_breaker_failures,
+        breaker_reset_timeout=opts.redis_breaker_reset_timeout,
+        breaker_slow_call_threshold=opts.redis_breaker_slow_call,
+        tracked_prefixes=(
+            (interests_key_in_store(""),) if opts.interests_cache else ()
+        ),
+        tracking_timeout=opts.interests_cache_timeout,
+        tracking_fallback_timeout=opts.interests_cache_fallback_timeout,
+        tracking_max_entries=opts.interests_cache_max_entries,
+    )
+
+
+def run_server(opts, sock: t.Optional[socket.socket] = None) -> None:
+    access_log = AccessLog(
+        opts.log_bodies, opts.log_body_size, opts.log_sample_rate
+    )
+    if opts.engine == "asyncio":
+        logging.info("Starting asyncio server at %s" % opts.port)
+        try:
+            asyncio.run(
+                serve_async(
+                    opts.port,
+                    opts.redis_url,
+                    sock,
+                    opts.stream_threshold,
+                    opts.keepalive_timeout,
+                    opts.keepalive_requests,
+                    access_log,
+                    **store_options(opts),
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    MainHTTPHandler.handler_options = dict(
+        MainHTTPHandler.handler_options,
+        stream_threshold=opts.stream_threshold,
+    )
+    MainHTTPHandler.access_log = access_log
+    if opts.profile_every:
+        MainHTTPHandler.profiler = Profiler(
+            opts.profile_every, opts.profile_dir
+        )
+    MainHTTPHandler.keepalive_timeout = opts.keepalive_timeout
+    # a single-threaded server cannot wait for the next request on one
+    # connection while others are waiting to be accepted
+    MainHTTPHandler.max_requests = (
+        opts.keepalive_requests if opts.threads > 0 else 1
+    )
+    MainHTTPHandler.store = RedisStore(
+        url=opts.redis_url, **store_options(opts)
+    )
+    server = make_server(opts.port, opts.threads, sock)
+    logging.info(
+        "Starting server at %s (threads: %s)" % (opts.port, opts.threads)
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
 
 
 def main():
@@ -75,21 +438,229 @@ def main():
     op.add_option(
         "-r", "--redis-url", action="store", default=DEFAULT_REDIS_URL
     )
+    op.add_option(
+        "-t",
+        "--threads",
+        action="store",
+        type=int,
+        default=DEFAULT_THREADS,
+        help="size of the worker thread pool, 0 to serve in the main thread",
+    )
+    op.add_option(
+        "-e",
+        "--engine",
+        action="store",
+        type="choice",
+        choices=ENGINES,
+        default=ENGINES[0],
+        help="serving engine: 'sync' (default) or 'asyncio'",
+    )
+    op.add_option(
+        "-w",
+        "--workers",
+        action="store",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="number of pre-forked worker processes, 0 to serve in-process",
+    )
+    op.add_option(
+        "--reuse-port",
+        action="store_true",
+        default=False,
+        help="bind a SO_REUSEPORT socket in every worker process",
+    )
+    op.add_option(
+        "--cache-max-entries",
+        action="store",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="max number of entries in the local score cache",
+    )
+    op.add_option(
+        "--cache-max-bytes",
+        action="store",
+        type=int,
+        default=None,
+        help="approximate max size of the local score cache in bytes",
+    )
+    op.add_option(
+        "--interests-cache",
+        action="store_true",
+        default=False,
+        help="cache interests locally, invalidated by redis client tracking",
+    )
+    op.add_option(
+        "--interests-cache-timeout",
+        action="store",
+        type=float,
+        default=DEFAULT_TRACKING_TIMEOUT,
+        help="seconds to keep cached interests for",
+    )
+    op.add_option(
+        "--interests-cache-fallback-timeout",
+        action="store",
+        type=float,
+        default=DEFAULT_FALLBACK_TIMEOUT,
+        help="seconds to keep cached interests for while invalidations "
+        "are not received",
+    )
+    op.add_option(
+        "--interests-cache-max-entries",
+        action="store",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="max number of entries in the local interests cache",
+    )
+    op.add_option(
+        "--redis-timeout",
+        action="store",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="redis socket read/write timeout in seconds",
+    )
+    op.add_option(
+        "--redis-connect-timeout",
+        action="store",
+        type=float,
+        default=None,
+        help="redis connect timeout in seconds, defaults to --redis-timeout",
+    )
+    op.add_option(
+        "--redis-max-connections",
+        action="store",
+        type=int,
+        default=None,
+        help="max number of connections in the redis pool",
+    )
+    op.add_option(
+        "--redis-pool-timeout",
+        action="store",
+        type=float,
+        default=None,
+        help="use a blocking pool waiting this many seconds for a connection",
+    )
+    op.add_option(
+        "--redis-keepalive",
+        action="store_true",
+        default=False,
+        help="enable TCP keepalive on redis connections",
+    )
+    op.add_option(
+        "--redis-health-check-interval",
+        action="store",
+        type=float,
+        default=0,
+        help="ping idle redis connections older than this many seconds",
+    )
+    op.add_option(
+        "--redis-breaker-failures",
+        action="store",
+        type=int,
+        default=DEFAULT_FAILURE_THRESHOLD,
+        help="open the redis circuit breaker after this many failed calls",
+    )
+    op.add_option(
+        "--redis-breaker-reset-timeout",
+        action="store",
+        type=float,
+        default=DEFAULT_RESET_TIMEOUT,
+        help="seconds before probing redis again with an open breaker",
+    )
+    op.add_option(
+        "--redis-breaker-slow-call",
+        action="store",
+        type=float,
+        default=None,
+        help="count redis calls slower than this many seconds as failures",
+    )
+    op.add_option(
+        "--keepalive-timeout",
+        action="store",
+        type=float,
+        default=DEFAULT_KEEPALIVE_TIMEOUT,
+        help="close connections idle for this many seconds",
+    )
+    op.add_option(
+        "--keepalive-requests",
+        action="store",
+        type=int,
+        default=DEFAULT_KEEPALIVE_REQUESTS,
+        help="close connections after this many requests, 1 disables "
+        "keep-alive",
+    )
+    op.add_option(
+        "--stream-threshold",
+        action="store",
+        type=int,
+        default=None,
+        help="stream interests of this many clients or more by batches",
+    )
+    op.add_option(
+        "--json-backend",
+        action="store",
+        type="choice",
+        choices=(codec.AUTO, *codec.BACKENDS),
+        default=codec.AUTO,
+        help="JSON library to use, the fastest installed one by default",
+    )
+    op.add_option(
+        "--log-bodies",
+        action="store_true",
+        default=False,
+        help="write request and response bodies to the access log",
+    )
+    op.add_option(
+        "--log-body-size",
+        action="store",
+        type=int,
+        default=DEFAULT_MAX_BODY_SIZE,
+        help="cut bodies in the access log to this many bytes",
+    )
+    op.add_option(
+        "--log-sample-rate",
+        action="store",
+        type=float,
+        default=1.0,
+        help="fraction of successful requests to write to the access log",
+    )
+    op.add_option(
+        "--profile-every",
+        action="store",
+        type=int,
+        default=0,
+        help="profile every N-th request with cProfile (sync engine only)",
+    )
+    op.add_option(
+        "--profile-dir",
+        action="store",
+        default=".",
+        help="directory to dump profiles of the sampled requests into",
+    )
     (opts, args) = op.parse_args()
-    logging.basicConfig(
-        filename=opts.log,
-        level=logging.INFO,
-        format="[%(asctime)s] %(levelname).1s %(message)s",
-        datefmt="%Y.%m.%d %H:%M:%S",
-    )
-    MainHTTPHandler.store = RedisStore(url=opts.redis_url)
-    server = HTTPServer(("0.0.0.0", opts.port), MainHTTPHandler)
-    logging.info("Starting server at %s" % opts.port)
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+    codec.use(opts.json_backend)
+    listener = setup_logging(opts.log)
+    atexit.register(listener.stop)
+    if opts.workers > 0:
+
+        def serve(sock: socket.socket) -> None:
+            # the listener thread is not inherited by the forked worker
+            worker_listener = setup_logging(opts.log)
+            try:
+                run_server(opts, sock)
+            finally:
+                worker_listener.stop()
+
+        supervisor = PreforkServer(
+            serve,
+            "0.0.0.0",
+            opts.port,
+            opts.workers,
+            reuse_port=opts.reuse_port,
+        )
+        logging.info("Starting %s workers at %s" % (opts.workers, opts.port))
+        supervisor.run()
+    else:
+        run_server(opts)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import typing as t
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_THRESHOLD: int = 5
+DEFAULT_RESET_TIMEOUT: float = 30.0
+
+_logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Circuit breaker guarding calls to an unreliable backend.
+
+    The circuit opens after `failure_threshold` consecutive failures.
+    Calls which take longer than `slow_call_threshold` seconds count as
+    failures too, so a degrading backend trips the breaker before it
+    starts timing out. While the circuit is open calls are rejected; after
+    `reset_timeout` seconds a single probe call is let through (half-open
+    state) and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        slow_call_threshold: t.Optional[float] = None,
+        name: str = "store",
+    ):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be positive")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._reset_timeout_passed():
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Check if a call may be performed now"""
+        with self._lock:
+            if self._state == OPEN and self._reset_timeout_passed():
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, duration: float = 0.0) -> None:
+        if (
+            self.slow_call_threshold is not None
+            and duration > self.slow_call_threshold
+        ):
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED
+                and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                self._set_state(OPEN)
+
+    def release(self) -> None:
+        """Let another probe through after the call was abandoned without
+        an outcome, e.g. cancelled
+        """
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+    def _reset_timeout_passed(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            _logger.warning(
+                "Circuit breaker '%s': %s -> %s", self.name, self._state, state
+            )
+        self._state = state
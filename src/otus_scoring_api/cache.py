@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import typing as t
+import weakref
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES: int = 100_000
+DEFAULT_SWEEP_INTERVAL: float = 60.0
+# number of entries checked for expiration per lock acquisition
+SWEEP_BATCH_SIZE: int = 1000
+# approximate size of the entry tuple and its slot in the ordered dict
+ENTRY_OVERHEAD: int = 128
+
+MISSING = object()
+
+
+def entry_size(key: t.Any, value: t.Any) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class LocalCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction.
+
+    The cache is bounded by a number of entries and, optionally, by an
+    approximate size of keys and values in bytes. Least recently used
+    entries are evicted first. Expired entries are dropped when read and
+    by `sweep`, which can be run periodically in a background thread.
+    """
+
+    def __init__(
+        self,
+        max_entries: t.Optional[int] = DEFAULT_MAX_ENTRIES,
+        max_bytes: t.Optional[int] = None,
+    ):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        # key -> (value, expiration time, size)
+        self._data: OrderedDict[
+            t.Any, t.Tuple[t.Any, float, int]
+        ] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._sweeper: t.Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: t.Any) -> bool:
+        return self.get(key, MISSING) is not MISSING
+
+    @property
+    def size(self) -> int:
+        """Approximate size of cached keys and values in bytes"""
+        return self._size
+
+    def get(self, key: t.Any, default: t.Any = None) -> t.Any:
+        with self._lock:
+            return self._get(key, default, time.monotonic())
+
+    def get_many(
+        self, keys: t.Iterable[t.Any], default: t.Any = None
+    ) -> t.List[t.Any]:
+        now = time.monotonic()
+        with self._lock:
+            return [self._get(key, default, now) for key in keys]
+
+    def set(self, key: t.Any, value: t.Any, timeout: float) -> None:
+        with self._lock:
+            self._set(key, value, time.monotonic() + timeout)
+            self._evict()
+
+    def set_many(
+        self, mapping: t.Mapping[t.Any, t.Any], timeout: float
+    ) -> None:
+        expires = time.monotonic() + timeout
+        with self._lock:
+            for key, value in mapping.items():
+                self._set(key, value, expires)
+            self._evict()
+
+    def delete(self, key: t.Any) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def sweep(self) -> int:
+        """Remove expired entries, return the number of removed ones"""
+        removed = 0
+        with self._lock:
+            keys = list(self._data)
+        for start in range(0, len(keys), SWEEP_BATCH_SIZE):
+            end = start + SWEEP_BATCH_SIZE
+            now = time.monotonic()
+            with self._lock:
+                for key in keys[start:end]:
+                    entry = self._data.get(key)
+                    if entry is not None and entry[1] < now:
+                        self._pop(key)
+                        removed += 1
+                        self.expirations += 1
+        return removed
+
+    def stats(self) -> t.Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def start_sweeper(self, interval: float = DEFAULT_SWEEP_INTERVAL) -> None:
+        """Run `sweep` every `interval` seconds in a daemon thread"""
+        if self._sweeper is not None:
+            return
+        self._stop_sweeper.clear()
+        self._sweeper = threading.Thread(
+            target=_sweep_forever,
+            args=(weakref.ref(self), self._stop_sweeper, interval),
+            name="cache-sweeper",
+            daemon=True,
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _get(self, key: t.Any, default: t.Any, now: float) -> t.Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[1] < now:
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _set(self, key: t.Any, value: t.Any, expires: float) -> None:
+        self._pop(key)
+        size = entry_size(key, value)
+        self._data[key] = (value, expires, size)
+        self._size += size
+
+    def _pop(self, key: t.Any) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+    def _evict(self) -> None:
+        while self._data and (
+            (
+                self._max_entries is not None
+                and len(self._data) > self._max_entries
+            )
+            or (self._max_bytes is not None and self._size > self._max_bytes)
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+
+def _sweep_forever(
+    cache_ref: weakref.ref, stop: threading.Event, interval: float
+) -> None:
+    # the thread holds only a weak reference, so it ends with the cache
+    while not stop.wait(interval):
+        cache = cache_ref()
+        if cache is None:
+            return
+        cache.sweep()
+        del cache
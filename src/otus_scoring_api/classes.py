@@ -1,7 +1,10 @@
+from __future__ import annotations
+
 import abc
 import decimal
+import time
 import typing as t
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 from otus_scoring_api.constants import ADMIN_LOGIN
 
@@ -50,6 +53,73 @@ class EmailField(CharField):
         return v
 
 
+PHONE_MIN: int = 70_000_000_000
+PHONE_MAX: int = 79_999_999_999
+
+# birthday bounds and the time they expire at (the next midnight)
+_birthday_bounds: t.Tuple[float, datetime, datetime] = (
+    0.0,
+    datetime.min,
+    datetime.min,
+)
+
+
+def is_phone(value: t.Union[str, int]) -> bool:
+    """Check that the phone number has 11 digits and starts with 7"""
+    if type(value) is int:
+        return PHONE_MIN <= value <= PHONE_MAX
+    if (
+        len(value) == 11
+        and value[0] == "7"
+        and value.isdigit()
+        and value.isascii()
+    ):
+        return True
+    # uncommon spellings accepted by Decimal, e.g. with the leading '+'
+    try:
+        dtp = decimal.Decimal(value).as_tuple()
+    except decimal.DecimalException:
+        return False
+    return (
+        dtp.sign == 0
+        and dtp.exponent == 0
+        and len(dtp.digits) == 11
+        and dtp.digits[0] == 7
+    )
+
+
+def parse_date(value: str) -> datetime:
+    """Parse the 'DD.MM.YYYY' date, raise `ValueError` if it is invalid"""
+    if (
+        len(value) == 10
+        and value[2] == "."
+        and value[5] == "."
+        and value.isascii()
+    ):
+        day, month, year = value[:2], value[3:5], value[6:]
+        if day.isdigit() and month.isdigit() and year.isdigit():
+            return datetime(int(year), int(month), int(day))
+    # single digit days and months etc.
+    return datetime.strptime(value, DateField._FORMAT)
+
+
+def birthday_bounds() -> t.Tuple[datetime, datetime]:
+    """Return the earliest (exclusive) and the latest date of birth"""
+    global _birthday_bounds
+    expires, earliest, latest = _birthday_bounds
+    if time.time() >= expires:
+        today = datetime.combine(date.today(), datetime.min.time())
+        try:
+            earliest = today.replace(year=today.year - 70)
+        except ValueError:
+            # February 29
+            earliest = today.replace(year=today.year - 70, day=28)
+        latest = today
+        expires = (today + timedelta(days=1)).timestamp()
+        _birthday_bounds = (expires, earliest, latest)
+    return earliest, latest
+
+
 class PhoneField(Field):
     def validate(
         self, value: t.Union[str, int, None]
@@ -61,13 +131,7 @@ class PhoneField(Field):
         if type(v) not in [str, int]:
             raise ValidationError("phone number must be str or int")
 
-        try:
-            dtp = decimal.Decimal(v).as_tuple()
-            assert dtp.sign == 0
-            assert dtp.exponent == 0
-            assert len(dtp.digits) == 11
-            assert dtp.digits[0] == 7
-        except (decimal.DecimalException, AssertionError):
+        if not is_phone(v):
             raise ValidationError(
                 "phone number must contain 11 digits and start with 7"
             )
@@ -79,44 +143,46 @@ class DateField(CharField):
     _FORMAT = "%d.%m.%Y"
 
     def validate(self, value: t.Optional[str]) -> t.Optional[str]:
+        self.parse(value)
+        return value
+
+    def parse(self, value: t.Optional[str]) -> t.Optional[datetime]:
+        """Validate the value and return it as a datetime"""
         v = super(DateField, self).validate(value)
         if v is None:
             return v
         try:
-            self.as_datetime(value)
-        except ValueError:
+            return parse_date(v)
+        except (TypeError, ValueError):
             raise ValidationError(
                 f"string '{value}' does not match with "
                 f"'DD.MM.YYYY' date format"
             )
-        else:
-            return value
 
     @classmethod
     def as_datetime(cls, value: t.Optional[str]) -> t.Optional[datetime]:
         if value is None:
             return None
-        return datetime.strptime(value, cls._FORMAT)
+        return parse_date(value)
 
 
 class BirthDayField(DateField):
-    def validate(self, value: t.Optional[str]) -> t.Optional[str]:
-        v = super(BirthDayField, self).validate(value)
-        if v is None:
-            return v
+    def parse(self, value: t.Optional[str]) -> t.Optional[datetime]:
+        dt = super(BirthDayField, self).parse(value)
+        if dt is None:
+            return dt
 
-        today = datetime.today()
-        dt = self.as_datetime(value)
-        if dt < today.replace(year=today.year - 70):
+        earliest, latest = birthday_bounds()
+        if dt <= earliest:
             raise ValidationError(
                 f"date of birth cannot be earlier than 70 years before now: "
                 f"'{value}'"
             )
-        elif dt > today:
+        elif dt > latest:
             raise ValidationError(
                 f"date of birth cannot be in future: '{value}'"
             )
-        return v
+        return dt
 
 
 class GenderField(Field):
@@ -131,31 +197,128 @@ class GenderField(Field):
 
 class ClientIDsField(Field):
     VALUE_TYPE: t.Type = list
+    # wider integers are decoded as floats by orjson, so they are rejected
+    # whatever the JSON backend is
+    MIN_ID: int = -(2**63)
+    MAX_ID: int = 2**63 - 1
 
     def validate(self, value: t.Optional[list]) -> t.Optional[list]:
         v = super(ClientIDsField, self).validate(value)
         if v is not None and not all([isinstance(_id, int) for _id in v]):
             raise ValidationError("client IDs must be of integer type")
+        if v is not None and not all(
+            [self.MIN_ID <= _id <= self.MAX_ID for _id in v]
+        ):
+            raise ValidationError("client IDs must be 64-bit integers")
         return v
 
 
-class BaseRequest(abc.ABC):
-    _fields: t.ClassVar[t.Dict[str, Field]] = {}
-    _field_values: t.Dict[str, t.Any]
+def compile_init(cls: t.Type[BaseRequest]) -> t.Callable[..., None]:
+    """Generate `__init__` validating the fields of `cls` into its slots"""
+    # plain type checks are inlined, other fields call their `validate`;
+    # on invalid data `cls.validate` is run to raise the same error as it
+    # would. Fields assigned after `__init__` are not validated.
+    env: t.Dict[str, t.Any] = {
+        "cls": cls,
+        "ValidationError": ValidationError,
+        "known": frozenset(cls._fields),
+    }
+    lines = [
+        "def __init__(self, **data):",
+        "    try:",
+        "        if not known.issuperset(data):",
+        "            raise ValidationError",
+    ]
+    parsed = []
+    for i, (name, field) in enumerate(cls._fields.items()):
+        lines.append(f"        if {name!r} in data:")
+        lines.append(f"            v = data[{name!r}]")
+        if isinstance(field, DateField):
+            # keep the parsed value, so it is never parsed again
+            env[f"parse_{i}"] = field.parse
+            parsed.append((name, i))
+            if field.nullable:
+                lines.append(f"            p_{i} = None")
+                lines.append("            if v is not None:")
+                lines.append(f"                p_{i} = parse_{i}(v)")
+            else:
+                lines.append(f"            p_{i} = parse_{i}(v)")
+        elif type(field).validate is Field.validate:
+            env[f"type_{i}"] = field.VALUE_TYPE
+            if not field.nullable:
+                lines.append("            if v is None:")
+                lines.append("                raise ValidationError")
+            lines.append(f"            if v and not isinstance(v, type_{i}):")
+            lines.append("                raise ValidationError")
+        else:
+            env[f"validate_{i}"] = field.validate
+            if field.nullable:
+                # nullable fields accept None as is
+                lines.append("            if v is not None:")
+                lines.append(f"                v = validate_{i}(v)")
+            else:
+                lines.append(f"            v = validate_{i}(v)")
+        lines.append("        else:")
+        if field.required:
+            lines.append("            raise ValidationError")
+        else:
+            lines.append("            v = None")
+            if isinstance(field, DateField):
+                lines.append(f"            p_{i} = None")
+        lines.append(f"        self.{name} = v")
+    items = ", ".join(f"{name!r}: p_{i}" for name, i in parsed)
+    lines.extend(
+        [
+            f"        self.parsed = {{{items}}}",
+            "    except ValidationError:",
+            "        cls.validate(data)",
+            "        raise",
+            "    self.check()",
+        ]
+    )
 
-    def __new__(cls, *args, **kwargs):
-        # update fields meta information if necessary
-        if not cls._fields:
-            cls._fields = {
-                k: v for k, v in cls.__dict__.items() if isinstance(v, Field)
-            }
+    exec("\n".join(lines), env)
+    init = env["__init__"]
+    init.__qualname__ = f"{cls.__qualname__}.__init__"
+    return init
 
-        obj = object.__new__(cls)
-        object.__setattr__(obj, "_field_values", cls.validate(kwargs))
-        return obj
+
+class RequestMeta(abc.ABCMeta):
+    """Turn `Field` attributes of the request class into slots.
+
+    Field instances are collected into the `_fields` class attribute and
+    `__init__` validating them is compiled once, at class creation. Parsed
+    values of date fields are available in the `parsed` dict of a request.
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        fields = {k: v for k, v in namespace.items() if isinstance(v, Field)}
+        for k in fields:
+            del namespace[k]
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + (
+            tuple(fields)
+        )
+        cls = super(RequestMeta, mcs).__new__(
+            mcs, name, bases, namespace, **kwargs
+        )
+
+        inherited: t.Dict[str, Field] = {}
+        for base in reversed(cls.__mro__[1:]):
+            inherited.update(base.__dict__.get("_fields", {}))
+        cls._fields = {**inherited, **fields}
+        if "__init__" not in namespace:
+            cls.__init__ = compile_init(cls)
+        return cls
+
+
+class BaseRequest(abc.ABC, metaclass=RequestMeta):
+    __slots__ = ("parsed",)
+    _fields: t.ClassVar[t.Dict[str, Field]] = {}
+    parsed: t.Dict[str, t.Any]
 
     @classmethod
     def validate(cls, data: t.Dict[str, t.Any]) -> t.Dict:
+        """Validate field values one by one, return them as a dict"""
         values = {}
 
         # check for required fields
@@ -176,37 +339,19 @@ class BaseRequest(abc.ABC):
 
         return values
 
+    def check(self) -> None:
+        """Validate the request as a whole, after its fields are set"""
+
     @property
     def non_empty_fields_lst(self) -> t.List[str]:
         return [
             k
-            for k, v in object.__getattribute__(self, "_field_values").items()
-            if v is not None and v != ""
+            for k in self._fields
+            if getattr(self, k) is not None and getattr(self, k) != ""
         ]
 
     def as_dict(self) -> t.Dict:
-        return object.__getattribute__(self, "_field_values")
-
-    def __getattribute__(self, item: str) -> t.Any:
-        # return field value instead of field instance
-        fields = object.__getattribute__(self, "_fields")
-        if item in fields.keys():
-            try:
-                return object.__getattribute__(self, "_field_values")[item]
-            except KeyError:
-                raise AttributeError()
-        else:
-            return object.__getattribute__(self, item)
-
-    def __setattr__(self, key, value):
-        # validate and set field value
-        field = object.__getattribute__(self, "_fields").get(key)
-        if not field:
-            object.__setattr__(self, key, value)
-            return
-        object.__getattribute__(self, "_field_values")[key] = field.validate(
-            value
-        )
+        return {k: getattr(self, k) for k in self._fields}
 
 
 class ClientsInterestsRequest(BaseRequest):
@@ -222,17 +367,10 @@ class OnlineScoreRequest(BaseRequest):
     birthday = BirthDayField(required=False, nullable=True)
     gender = GenderField(required=False, nullable=True)
 
-    @classmethod
-    def validate(cls, data: t.Dict[str, t.Any]) -> t.Dict:
-        values = super(OnlineScoreRequest, cls).validate(data)
-
-        has_phone_email_pair = all([values.get("phone"), values.get("email")])
-        has_names_pair = all(
-            [values.get("first_name"), values.get("last_name")]
-        )
-        has_gender_bday_pair = all(
-            [values.get("gender") is not None, values.get("birthday")]
-        )
+    def check(self) -> None:
+        has_phone_email_pair = all([self.phone, self.email])
+        has_names_pair = all([self.first_name, self.last_name])
+        has_gender_bday_pair = all([self.gender is not None, self.birthday])
         if not any(
             [
                 has_phone_email_pair,
@@ -246,8 +384,6 @@ class OnlineScoreRequest(BaseRequest):
                 "gender-birthday"
             )
 
-        return values
-
 
 class MethodRequest(BaseRequest):
     account = CharField(required=False, nullable=True)
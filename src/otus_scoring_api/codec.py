@@ -0,0 +1,169 @@
+"""JSON encoding and decoding with the fastest available backend.
+
+`orjson` or `ujson` is used when installed, the standard `json` module
+otherwise. `dumps` returns bytes with compact separators and non-ASCII
+characters written as UTF-8. The output of the backends is the same for
+the values the API sends, but not for all floats: exponents are written
+differently (`1e+20` by `json`, `1e20` by `orjson`), and NaN and infinity
+are written as `null` by `orjson`.
+
+`loads` falls back to `json` on documents rejected by a faster backend,
+such as NaN or numbers out of the double range, so all backends accept
+the same documents. They may decode them differently though: `orjson`
+turns integers wider than 64 bits into floats, so validation must not
+depend on it (see `ClientIDsField`).
+
+Callers should access the functions through the module (`codec.dumps`),
+so that switching the backend with `use` takes effect everywhere.
+"""
+from __future__ import annotations
+
+import json
+import typing as t
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+AUTO = "auto"
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def json_dumps(obj: t.Any) -> bytes:
+    return _encoder.encode(obj).encode("utf-8")
+
+
+def orjson_dumps(obj: t.Any) -> bytes:
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # e.g. integers wider than 64 bits
+        return json_dumps(obj)
+
+
+def ujson_dumps(obj: t.Any) -> bytes:
+    try:
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+    except (TypeError, OverflowError):
+        return json_dumps(obj)
+
+
+def orjson_loads(data: t.Union[str, bytes]) -> t.Any:
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def ujson_loads(data: t.Union[str, bytes]) -> t.Any:
+    try:
+        return ujson.loads(data)
+    except ValueError:
+        return json.loads(data)
+
+
+# backend name -> (dumps, loads), in the order of preference
+BACKENDS: t.Dict[str, t.Tuple[t.Callable[[t.Any], bytes], t.Callable]] = {}
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson_dumps, orjson_loads)
+if ujson is not None:
+    BACKENDS["ujson"] = (ujson_dumps, ujson_loads)
+BACKENDS["json"] = (json_dumps, json.loads)
+
+backend: str
+dumps: t.Callable[[t.Any], bytes]
+loads: t.Callable[[t.Union[str, bytes]], t.Any]
+
+
+class RawJSON:
+    """Already encoded JSON value, written into the output as is"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __eq__(self, other: t.Any) -> bool:
+        return isinstance(other, RawJSON) and self.data == other.data
+
+    def __repr__(self) -> str:
+        return self.data.decode("utf-8", "replace")
+
+
+class RawJSONStream:
+    """JSON value encoded by parts, e.g. as they are fetched by batches.
+
+    `parts` is an iterator or an async iterator of bytes.
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: t.Union[t.Iterator[bytes], t.AsyncIterator]):
+        self.parts = parts
+
+    def __repr__(self) -> str:
+        return "<streamed>"
+
+
+def dumps_raw(obj: t.Any) -> bytearray:
+    """Encode the object like `dumps`, splicing `RawJSON` values in as is"""
+    buf = bytearray()
+    write(buf, obj)
+    return buf
+
+
+def dumps_key(key: t.Any) -> bytes:
+    """Encode the object key the same way `dumps` does"""
+    if type(key) is str and key.isalnum() and key.isascii():
+        # nothing to escape, e.g. client IDs
+        return b'"%s"' % key.encode("ascii")
+    if isinstance(key, str):
+        return dumps(key)
+    return dumps({key: 0})[1:-3]
+
+
+def write(buf: bytearray, obj: t.Any) -> None:
+    """Append the encoded object to the buffer"""
+    if isinstance(obj, RawJSON):
+        buf += obj.data
+    elif isinstance(obj, dict):
+        buf += b"{"
+        for i, (key, value) in enumerate(obj.items()):
+            if i:
+                buf += b","
+            buf += dumps_key(key)
+            buf += b":"
+            write(buf, value)
+        buf += b"}"
+    elif isinstance(obj, (list, tuple)):
+        buf += b"["
+        for i, value in enumerate(obj):
+            if i:
+                buf += b","
+            write(buf, value)
+        buf += b"]"
+    else:
+        buf += dumps(obj)
+
+
+def use(name: str = AUTO) -> None:
+    """Switch to the backend with the given name or to the fastest one"""
+    global backend, dumps, loads
+    if name == AUTO:
+        name = next(iter(BACKENDS))
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available")
+    backend = name
+    dumps, loads = BACKENDS[name]
+
+
+use()
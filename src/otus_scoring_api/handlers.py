@@ -1,112 +1,582 @@
+from __future__ import annotations
+
 import datetime
 import hashlib
+import hmac
+import logging
+import time
 import typing as t
 
+from otus_scoring_api import codec, metrics
+from otus_scoring_api.cache import LocalCache
 from otus_scoring_api.classes import (
     ClientsInterestsRequest,
-    DateField,
     MethodRequest,
     OnlineScoreRequest,
     ValidationError,
 )
 from otus_scoring_api.constants import (
     ADMIN_SALT,
+    ERRORS,
     FORBIDDEN,
     INTERNAL_ERROR,
     INVALID_REQUEST,
     OK,
     SALT,
 )
-from otus_scoring_api.scoring import get_interests, get_score, ScoringError
+from otus_scoring_api.scoring import (
+    async_fetch_interests,
+    async_get_interests_many,
+    async_get_score,
+    async_get_scores_many,
+    async_stream_interests,
+    decode_interests,
+    fetch_interests,
+    get_interests_many,
+    get_score,
+    get_scores_many,
+    ScoringError,
+    stream_interests,
+)
+from otus_scoring_api.timing import NULL_TIMER
+
+if t.TYPE_CHECKING:
+    from otus_scoring_api.classes import BaseRequest
+    from otus_scoring_api.store import AbstractAsyncStore, AbstractStore
 
 SUPPORTED_METHODS = {
     "online_score": OnlineScoreRequest,
     "clients_interests": ClientsInterestsRequest,
 }
 
+HandlerResult = t.Tuple[t.Union[t.Dict, str, None], t.Optional[int]]
+
+MAX_BATCH_SIZE: int = 1000
+
+AUTH_CACHE_SIZE: int = 10_000
+AUTH_CACHE_TIMEOUT: float = 3600.0
+
+# (account, login, token) triples which have already passed the check
+_verified_auth = LocalCache(AUTH_CACHE_SIZE)
+# admin token digest and the time it expires at (the next hour boundary)
+_admin_digest: t.Tuple[float, bytes] = (0.0, b"")
+
+
+class MethodRequestError(Exception):
+    def __init__(self, response: t.Union[str, None], code: int):
+        super(MethodRequestError, self).__init__(response, code)
+        self.response = response
+        self.code = code
+
+
+def admin_digest() -> bytes:
+    """Return the admin token digest, recomputed once an hour"""
+    global _admin_digest
+    expires, digest = _admin_digest
+    if time.time() >= expires:
+        now = datetime.datetime.now()
+        digest = (
+            hashlib.sha512(
+                f"{now.strftime('%Y%m%d%H')}{ADMIN_SALT}".encode("utf-8")
+            )
+            .hexdigest()
+            .encode("ascii")
+        )
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        expires = (hour + datetime.timedelta(hours=1)).timestamp()
+        _admin_digest = (expires, digest)
+    return digest
+
 
 def check_auth(request: MethodRequest):
+    token = request.token
+    if not token:
+        return False
+    # JSON strings may hold lone surrogates, which are not valid UTF-8
+    token_bytes = token.encode("utf-8", "surrogatepass")
     if request.is_admin:
-        digest = hashlib.sha512(
-            f"{datetime.datetime.now().strftime('%Y%m%d%H')}"
-            f"{ADMIN_SALT}".encode("utf-8")
-        ).hexdigest()
-    else:
-        digest = hashlib.sha512(
-            f"{request.account}{request.login}{SALT}".encode("utf-8")
-        ).hexdigest()
-    if digest == request.token:
+        return hmac.compare_digest(admin_digest(), token_bytes)
+
+    key = (request.account, request.login, token)
+    if _verified_auth.get(key, False):
+        return True
+    digest = hashlib.sha512(
+        f"{request.account}{request.login}{SALT}".encode(
+            "utf-8", "surrogatepass"
+        )
+    ).hexdigest()
+    if hmac.compare_digest(digest.encode("ascii"), token_bytes):
+        _verified_auth.set(key, True, AUTH_CACHE_TIMEOUT)
         return True
     return False
 
 
-def method_handler(
-    request: t.Dict, ctx: t.Dict, store
-) -> t.Tuple[t.Union[t.Dict, str, None], t.Optional[int]]:
-    response, code = {}, OK
+def parse_method_request(
+    request: t.Dict,
+    ctx: t.Dict,
+    verified: t.Optional[t.Dict[t.Tuple, bool]] = None,
+) -> t.Tuple[MethodRequest, BaseRequest]:
+    """Validate the request body, check auth and parse method arguments.
+
+    Auth check results are memoized in the `verified` dict by credentials,
+    if it is given. Raises `MethodRequestError` with the response and code
+    to return. The phases are marked on the `PhaseTimer` of the request.
+    """
+    timer = request.get("timer", NULL_TIMER)
     # trying to parse request body
+    body = request.get("body", {})
     try:
-        parsed_request = MethodRequest(**request.get("body", {}))
+        if not isinstance(body, dict):
+            raise ValidationError("method request must be an object")
+        parsed_request = MethodRequest(**body)
     except ValidationError as e:
-        return str(e), INVALID_REQUEST
+        raise MethodRequestError(str(e), INVALID_REQUEST)
+    finally:
+        timer.mark("request")
+    if parsed_request.method in SUPPORTED_METHODS:
+        ctx["method"] = parsed_request.method
 
     # checking auth
-    if not check_auth(parsed_request):
-        return None, FORBIDDEN
+    if verified is None:
+        authorized = check_auth(parsed_request)
+    else:
+        key = (
+            parsed_request.account,
+            parsed_request.login,
+            parsed_request.token,
+        )
+        authorized = verified.get(key)
+        if authorized is None:
+            authorized = verified[key] = check_auth(parsed_request)
+    timer.mark("auth")
+    if not authorized:
+        raise MethodRequestError(None, FORBIDDEN)
 
     # method arguments processing
     method_class = SUPPORTED_METHODS.get(parsed_request.method)
     if not method_class:
-        return (
+        raise MethodRequestError(
             f"Method '{parsed_request.method}' unsupported",
             INVALID_REQUEST,
         )
     elif not parsed_request.arguments:
-        return "Method arguments required", INVALID_REQUEST
+        raise MethodRequestError("Method arguments required", INVALID_REQUEST)
 
     try:
         method_args = method_class(**parsed_request.arguments)
     except ValidationError as e:
-        return (
+        raise MethodRequestError(
             f"Wrong arguments for method '{parsed_request.method}': {str(e)}",
             INVALID_REQUEST,
         )
+    finally:
+        timer.mark("arguments")
 
-    # method performing
     if parsed_request.method == "online_score":
         ctx["has"] = method_args.non_empty_fields_lst
+    elif parsed_request.method == "clients_interests":
+        # `client_ids` is nullable
+        ctx["nclients"] = len(method_args.client_ids or ())
+        if not ctx["nclients"]:
+            raise MethodRequestError(
+                "clients_ids list cannot be empty", INVALID_REQUEST
+            )
+
+    return parsed_request, method_args
+
+
+def score_arguments(method_args: OnlineScoreRequest) -> t.Dict[str, t.Any]:
+    return dict(
+        phone=method_args.phone,
+        email=method_args.email,
+        birthday=method_args.parsed["birthday"],
+        gender=method_args.gender,
+        first_name=method_args.first_name,
+        last_name=method_args.last_name,
+    )
+
+
+def observe_method(ctx: t.Dict, code: int, started: float) -> None:
+    method = ctx.get("method", "-")
+    metrics.method_requests.labels(method, code).inc()
+    metrics.method_latency.labels(method).observe(
+        time.perf_counter() - started
+    )
+
+
+def observe_batch(
+    methods: t.List[str], results: t.List[HandlerResult]
+) -> None:
+    # items are performed by bulk calls, so their latency is not observed
+    for method, (_, code) in zip(methods, results):
+        metrics.method_requests.labels(method, code).inc()
+
+
+def method_handler(
+    request: t.Dict,
+    ctx: t.Dict,
+    store: AbstractStore,
+    raw_interests: bool = False,
+    stream_threshold: t.Optional[int] = None,
+) -> HandlerResult:
+    """Perform the method request.
+
+    With `raw_interests` set, `clients_interests` returns the stored JSON
+    wrapped in `RawJSON`, to be written with `codec.dumps_raw`. Interests
+    of `stream_threshold` or more clients are returned as `RawJSONStream`
+    fetching them by batches, see `iter_response`.
+    """
+    started = time.perf_counter()
+    response, code = {}, OK
+    try:
+        parsed_request, method_args = parse_method_request(request, ctx)
+    except MethodRequestError as e:
+        observe_method(ctx, e.code, started)
+        return e.response, e.code
+
+    # method performing
+    if parsed_request.method == "online_score":
         if parsed_request.is_admin:
             score = 42
         else:
             method_args = t.cast(OnlineScoreRequest, method_args)
-            score = get_score(
-                store=store,
-                phone=method_args.phone,
-                email=method_args.email,
-                birthday=DateField.as_datetime(method_args.birthday),
-                gender=method_args.gender,
-                first_name=method_args.first_name,
-                last_name=method_args.last_name,
-            )
+            score = get_score(store=store, **score_arguments(method_args))
         response = {"score": score}
 
     elif parsed_request.method == "clients_interests":
         method_args = t.cast(ClientsInterestsRequest, method_args)
-        ctx["nclients"] = len(method_args.client_ids)
-        if not ctx["nclients"]:
-            code = INVALID_REQUEST
-            response = "clients_ids list cannot be empty"
+        cids = [str(cid) for cid in method_args.client_ids]
+        try:
+            if stream_threshold is not None and len(cids) >= stream_threshold:
+                response = stream_interests(store, cids)
+            else:
+                response = get_interests_many(store, cids, raw=raw_interests)
+        except ScoringError as e:
+            code = INTERNAL_ERROR
+            response = str(e)
+    else:
+        code = INVALID_REQUEST
+        response = f"Method '{parsed_request.method}' unsupported"
+
+    request.get("timer", NULL_TIMER).mark("store")
+    observe_method(ctx, code, started)
+    return response, code
+
+
+async def async_method_handler(
+    request: t.Dict,
+    ctx: t.Dict,
+    store: AbstractAsyncStore,
+    raw_interests: bool = False,
+    stream_threshold: t.Optional[int] = None,
+) -> HandlerResult:
+    """Coroutine version of `method_handler` working with an async store"""
+    started = time.perf_counter()
+    response, code = {}, OK
+    try:
+        parsed_request, method_args = parse_method_request(request, ctx)
+    except MethodRequestError as e:
+        observe_method(ctx, e.code, started)
+        return e.response, e.code
+
+    # method performing
+    if parsed_request.method == "online_score":
+        if parsed_request.is_admin:
+            score = 42
         else:
-            try:
-                response = {
-                    str(cid): get_interests(store, str(cid))
-                    for cid in method_args.client_ids
-                }
-            except ScoringError as e:
-                code = INTERNAL_ERROR
-                response = str(e)
+            method_args = t.cast(OnlineScoreRequest, method_args)
+            score = await async_get_score(
+                store=store, **score_arguments(method_args)
+            )
+        response = {"score": score}
+
+    elif parsed_request.method == "clients_interests":
+        method_args = t.cast(ClientsInterestsRequest, method_args)
+        cids = [str(cid) for cid in method_args.client_ids]
+        try:
+            if stream_threshold is not None and len(cids) >= stream_threshold:
+                response = await async_stream_interests(store, cids)
+            else:
+                response = await async_get_interests_many(
+                    store, cids, raw=raw_interests
+                )
+        except ScoringError as e:
+            code = INTERNAL_ERROR
+            response = str(e)
     else:
         code = INVALID_REQUEST
         response = f"Method '{parsed_request.method}' unsupported"
 
+    request.get("timer", NULL_TIMER).mark("store")
+    observe_method(ctx, code, started)
     return response, code
+
+
+def parse_batch(
+    request: t.Dict, ctx: t.Dict
+) -> t.Tuple[
+    t.List[HandlerResult], t.List[t.Tuple], t.List[t.Tuple], t.List[str]
+]:
+    """Parse method requests of the batch.
+
+    Returns results of the requests which are already known (errors and
+    admin scores), lists of `(index, arguments)` of `online_score` and
+    `clients_interests` requests to be performed, and the methods of the
+    requests for metrics. Raises `MethodRequestError` if the batch itself
+    is invalid.
+    """
+    bodies = request.get("body")
+    if not isinstance(bodies, list) or not bodies:
+        raise MethodRequestError(
+            "batch must be a non-empty array of method requests",
+            INVALID_REQUEST,
+        )
+    if len(bodies) > MAX_BATCH_SIZE:
+        raise MethodRequestError(
+            f"batch cannot contain more than {MAX_BATCH_SIZE} requests",
+            INVALID_REQUEST,
+        )
+    ctx["nrequests"] = len(bodies)
+
+    results: t.List[HandlerResult] = [({}, OK)] * len(bodies)
+    scores, interests = [], []
+    verified: t.Dict[t.Tuple, bool] = {}
+    methods = ["-"] * len(bodies)
+    for i, body in enumerate(bodies):
+        # every item gets its own result, whatever is wrong with it
+        item_ctx: t.Dict[str, t.Any] = {}
+        try:
+            kind, value = parse_batch_item(body, request, verified, item_ctx)
+        except MethodRequestError as e:
+            results[i] = (e.response, e.code)
+            continue
+        except Exception as e:
+            logging.exception("Unexpected error in batch item %d: %s", i, e)
+            results[i] = (None, INTERNAL_ERROR)
+            continue
+        finally:
+            methods[i] = item_ctx.get("method", "-")
+        if kind == "online_score":
+            scores.append((i, value))
+        elif kind == "clients_interests":
+            interests.append((i, value))
+        else:
+            results[i] = (value, OK)
+
+    return results, scores, interests, methods
+
+
+def parse_batch_item(
+    body: t.Any,
+    request: t.Dict,
+    verified: t.Dict[t.Tuple, bool],
+    ctx: t.Dict,
+) -> t.Tuple[str, t.Any]:
+    """Parse a method request of the batch.
+
+    Returns the method and its arguments to be performed, or "result" and
+    the response which is already known.
+    """
+    if not isinstance(body, dict):
+        raise MethodRequestError(
+            "method request must be an object", INVALID_REQUEST
+        )
+    parsed_request, method_args = parse_method_request(
+        {"body": body, "headers": request.get("headers")}, ctx, verified
+    )
+    if parsed_request.method == "online_score":
+        if parsed_request.is_admin:
+            return "result", {"score": 42}
+        method_args = t.cast(OnlineScoreRequest, method_args)
+        return "online_score", score_arguments(method_args)
+    method_args = t.cast(ClientsInterestsRequest, method_args)
+    return "clients_interests", [str(cid) for cid in method_args.client_ids]
+
+
+def batch_cids(interests: t.List[t.Tuple]) -> t.List[str]:
+    return list(dict.fromkeys(cid for _, cids in interests for cid in cids))
+
+
+def set_errors(
+    results: t.List[HandlerResult],
+    items: t.List[t.Tuple],
+    error: t.Optional[str] = None,
+) -> None:
+    for i, _ in items:
+        results[i] = (error, INTERNAL_ERROR)
+
+
+def set_interests_results(
+    results: t.List[HandlerResult],
+    interests: t.List[t.Tuple],
+    values: t.Dict[str, t.Any],
+    raw: bool,
+) -> None:
+    for i, cids in interests:
+        cids = list(dict.fromkeys(cids))
+        try:
+            response = decode_interests(
+                cids, [values[cid] for cid in cids], raw
+            )
+        except ScoringError as e:
+            results[i] = (str(e), INTERNAL_ERROR)
+        except Exception as e:
+            logging.exception("Unexpected error in batch item %d: %s", i, e)
+            results[i] = (None, INTERNAL_ERROR)
+        else:
+            results[i] = (response, OK)
+
+
+def batch_handler(
+    request: t.Dict,
+    ctx: t.Dict,
+    store: AbstractStore,
+    raw_interests: bool = False,
+    **options,
+) -> HandlerResult:
+    """Perform a batch of method requests.
+
+    The request body is an array of method request bodies, the response
+    is an array of their response envelopes. Auth is checked once per
+    distinct credentials, store lookups of all the requests are made with
+    bulk calls.
+    """
+    timer = request.get("timer", NULL_TIMER)
+    try:
+        results, scores, interests, methods = parse_batch(request, ctx)
+    except MethodRequestError as e:
+        return e.response, e.code
+    finally:
+        timer.mark("request")
+
+    if scores:
+        try:
+            values = get_scores_many(store, [args for _, args in scores])
+        except Exception as e:
+            logging.exception("Unexpected error: %s" % e)
+            set_errors(results, scores)
+        else:
+            for (i, _), score in zip(scores, values):
+                results[i] = ({"score": score}, OK)
+
+    if interests:
+        cids = batch_cids(interests)
+        try:
+            values = dict(zip(cids, fetch_interests(store, cids)))
+        except ScoringError as e:
+            set_errors(results, interests, str(e))
+        except Exception as e:
+            logging.exception("Unexpected error: %s" % e)
+            set_errors(results, interests)
+        else:
+            set_interests_results(results, interests, values, raw_interests)
+
+    timer.mark("store")
+    observe_batch(methods, results)
+    return [make_response(*result) for result in results], OK
+
+
+async def async_batch_handler(
+    request: t.Dict,
+    ctx: t.Dict,
+    store: AbstractAsyncStore,
+    raw_interests: bool = False,
+    **options,
+) -> HandlerResult:
+    """Coroutine version of `batch_handler` working with an async store"""
+    timer = request.get("timer", NULL_TIMER)
+    try:
+        results, scores, interests, methods = parse_batch(request, ctx)
+    except MethodRequestError as e:
+        return e.response, e.code
+    finally:
+        timer.mark("request")
+
+    if scores:
+        try:
+            values = await async_get_scores_many(
+                store, [args for _, args in scores]
+            )
+        except Exception as e:
+            logging.exception("Unexpected error: %s" % e)
+            set_errors(results, scores)
+        else:
+            for (i, _), score in zip(scores, values):
+                results[i] = ({"score": score}, OK)
+
+    if interests:
+        cids = batch_cids(interests)
+        try:
+            values = dict(zip(cids, await async_fetch_interests(store, cids)))
+        except ScoringError as e:
+            set_errors(results, interests, str(e))
+        except Exception as e:
+            logging.exception("Unexpected error: %s" % e)
+            set_errors(results, interests)
+        else:
+            set_interests_results(results, interests, values, raw_interests)
+
+    timer.mark("store")
+    observe_batch(methods, results)
+    return [make_response(*result) for result in results], OK
+
+
+def make_response(
+    response: t.Union[t.Dict, str, None], code: int
+) -> t.Dict[str, t.Any]:
+    """Build the response body envelope sent to the client"""
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {
+        "error": response or ERRORS.get(code, "Unknown Error"),
+        "code": code,
+    }
+
+
+def iter_response(
+    response: codec.RawJSONStream, code: int
+) -> t.Iterator[bytes]:
+    """Encode the envelope of the streamed response by parts"""
+    yield b'{"response":'
+    yield from response.parts
+    yield b',"code":%d}' % code
+
+
+async def async_iter_response(
+    response: codec.RawJSONStream, code: int
+) -> t.AsyncIterator[bytes]:
+    yield b'{"response":'
+    async for part in response.parts:
+        yield part
+    yield b',"code":%d}' % code
+
+
+def join_response(
+    response: codec.RawJSONStream, code: int
+) -> t.Tuple[int, bytes]:
+    """Encode the whole streamed response for clients which cannot receive
+    it by chunks, return the code and body
+    """
+    error = None
+    try:
+        return code, b"".join(iter_response(response, code))
+    except ScoringError as e:
+        error = str(e)
+    except Exception as e:
+        logging.exception("Unexpected error: %s" % e)
+    return INTERNAL_ERROR, codec.dumps(make_response(error, INTERNAL_ERROR))
+
+
+async def async_join_response(
+    response: codec.RawJSONStream, code: int
+) -> t.Tuple[int, bytes]:
+    error = None
+    try:
+        return code, b"".join(
+            [part async for part in async_iter_response(response, code)]
+        )
+    except ScoringError as e:
+        error = str(e)
+    except Exception as e:
+        logging.exception("Unexpected error: %s" % e)
+    return INTERNAL_ERROR, codec.dumps(make_response(error, INTERNAL_ERROR))
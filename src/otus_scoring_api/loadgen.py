@@ -0,0 +1,387 @@
+"""Load generator of the scoring API.
+
+Sends a synthetic mix of `online_score` and `clients_interests` requests,
+or replays request bodies recorded one per line in a JSONL file, from a
+number of concurrent connections. With a target rate the requests are
+scheduled at even intervals and latency is measured from the scheduled
+time, so a stalled server is not hidden by the clients waiting for it.
+
+Reports throughput and latency percentiles per method and status code.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import http.client
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+import typing as t
+from optparse import OptionParser
+from urllib.parse import urlparse
+
+from otus_scoring_api.constants import ADMIN_LOGIN, ADMIN_SALT, SALT
+
+DEFAULT_URL = "http://127.0.0.1:8080"
+DEFAULT_CONCURRENCY: int = 8
+ERROR = "error"
+PERCENTILES = (50, 95, 99)
+
+# (path, body, method) of a request to be sent
+Request = t.Tuple[str, bytes, str]
+
+
+def user_token(account: str, login: str) -> str:
+    return hashlib.sha512(
+        f"{account}{login}{SALT}".encode("utf-8")
+    ).hexdigest()
+
+
+def admin_token() -> str:
+    hour = datetime.datetime.now().strftime("%Y%m%d%H")
+    return hashlib.sha512(f"{hour}{ADMIN_SALT}".encode("utf-8")).hexdigest()
+
+
+def synthetic_requests(
+    score_ratio: float = 0.5,
+    min_clients: int = 1,
+    max_clients: int = 10,
+    admin_share: float = 0.0,
+    max_client_id: int = 1_000_000,
+    account: str = "horns&hoofs",
+    login: str = "h&f",
+    seed: t.Optional[int] = None,
+) -> t.Iterator[Request]:
+    """Generate an endless mix of valid method requests"""
+    rng = random.Random(seed)
+    token = user_token(account, login)
+    admin = admin_token()
+    while True:
+        body: t.Dict[str, t.Any] = {"account": account}
+        if rng.random() < admin_share:
+            body.update(login=ADMIN_LOGIN, token=admin)
+        else:
+            body.update(login=login, token=token)
+        if rng.random() < score_ratio:
+            body["method"] = "online_score"
+            body["arguments"] = {
+                "phone": f"7{rng.randrange(10**10):010d}",
+                "email": f"user{rng.randrange(10**6)}@otus.ru",
+                "gender": rng.randrange(3),
+                "birthday": f"{rng.randrange(1, 29):02d}."
+                f"{rng.randrange(1, 13):02d}.{rng.randrange(1960, 2005)}",
+            }
+        else:
+            body["method"] = "clients_interests"
+            body["arguments"] = {
+                "client_ids": rng.sample(
+                    range(max_client_id),
+                    rng.randint(min_clients, max_clients),
+                )
+            }
+        yield "/method", json.dumps(body).encode("utf-8"), body["method"]
+
+
+def replay_requests(filename: str, loop: bool = True) -> t.Iterator[Request]:
+    """Read recorded requests, one JSON object per line.
+
+    A line is either a method request body or an object with `body` and
+    optional `path` keys. Blank lines are skipped.
+    """
+    requests = []
+    with open(filename, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            path = "/method"
+            if "body" in record:
+                path = record.get("path", path)
+                record = record["body"]
+            method = (
+                record.get("method", "-")
+                if isinstance(record, dict)
+                else path.strip("/")
+            )
+            requests.append((path, json.dumps(record).encode("utf-8"), method))
+    if not requests:
+        raise ValueError(f"no requests in {filename}")
+    return itertools.cycle(requests) if loop else iter(requests)
+
+
+class Results:
+    """Latencies by (method, status) collected by a single worker"""
+
+    def __init__(self):
+        self.latencies: t.Dict[t.Tuple[str, t.Any], t.List[float]] = {}
+
+    def add(self, method: str, status: t.Any, latency: float) -> None:
+        self.latencies.setdefault((method, status), []).append(latency)
+
+    def merge(self, other: Results) -> None:
+        for key, values in other.latencies.items():
+            self.latencies.setdefault(key, []).extend(values)
+
+    @property
+    def count(self) -> int:
+        return sum(len(v) for v in self.latencies.values())
+
+
+def percentile(values: t.Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    index = max(0, math.ceil(p * len(values) / 100) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(results: Results, elapsed: float) -> t.Dict[str, t.Any]:
+    rows = []
+    for (method, status), values in sorted(
+        results.latencies.items(), key=lambda item: str(item[0])
+    ):
+        values = sorted(values)
+        row = {
+            "method": method,
+            "status": status,
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 1),
+        }
+        for p in PERCENTILES:
+            row[f"p{p}"] = round(percentile(values, p) * 1e3, 3)
+        row["max"] = round(values[-1] * 1e3, 3)
+        rows.append(row)
+    return {
+        "requests": results.count,
+        "elapsed": round(elapsed, 3),
+        "rps": round(results.count / elapsed, 1) if elapsed else 0.0,
+        "results": rows,
+    }
+
+
+def format_report(summary: t.Dict[str, t.Any]) -> str:
+    lines = [
+        f"{summary['requests']} requests in {summary['elapsed']} s, "
+        f"{summary['rps']} req/s",
+        f"{'method':<20} {'status':>6} {'count':>8} {'req/s':>9} "
+        + " ".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+        + f" {'max':>9}  (ms)",
+    ]
+    for row in summary["results"]:
+        lines.append(
+            f"{row['method']:<20} {row['status']:>6} {row['count']:>8} "
+            f"{row['rps']:>9} "
+            + " ".join(f"{row[f'p{p}']:>9}" for p in PERCENTILES)
+            + f" {row['max']:>9}"
+        )
+    return "\n".join(lines)
+
+
+class LoadGenerator:
+    """Sends requests from `concurrency` threads, each with a keep-alive
+    connection.
+
+    Stops after `total` requests, `duration` seconds or when `requests`
+    is exhausted, whichever comes first. With `rate` set, requests are
+    sent at that many per second in total.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        requests: t.Iterator[Request],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: t.Optional[float] = None,
+        total: t.Optional[int] = None,
+        duration: t.Optional[float] = None,
+        timeout: float = 30.0,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 80
+        self.requests = requests
+        self.concurrency = concurrency
+        self.rate = rate
+        self.total = total
+        self.duration = duration
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sent = itertools.count()
+        self._started = 0.0
+
+    def next_request(self) -> t.Optional[t.Tuple[int, Request]]:
+        with self._lock:
+            n = next(self._sent)
+            if self.total is not None and n >= self.total:
+                return None
+            request = next(self.requests, None)
+        if request is None:
+            return None
+        return n, request
+
+    def run(self) -> t.Tuple[Results, float]:
+        results = [Results() for _ in range(self.concurrency)]
+        self._started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.worker, args=(r,), daemon=True)
+            for r in results
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - self._started
+        merged = Results()
+        for r in results:
+            merged.merge(r)
+        return merged, elapsed
+
+    def worker(self, results: Results) -> None:
+        # closed connections are reopened by the next `request`
+        conn = http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout
+        )
+        deadline = self._started + (self.duration or float("inf"))
+        while True:
+            item = self.next_request()
+            if item is None:
+                break
+            n, (path, body, method) = item
+            started = time.perf_counter()
+            if self.rate:
+                scheduled = self._started + n / self.rate
+                if scheduled >= deadline:
+                    break
+                if scheduled > started:
+                    time.sleep(scheduled - started)
+                started = scheduled
+            elif started >= deadline:
+                break
+            try:
+                conn.request(
+                    "POST",
+                    path,
+                    body,
+                    {"Content-Type": "application/json"},
+                )
+                response = conn.getresponse()
+                response.read()
+                status: t.Any = response.status
+                if response.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                status = ERROR
+                conn.close()
+            results.add(method, status, time.perf_counter() - started)
+        conn.close()
+
+
+def main():
+    op = OptionParser(usage="%prog [options] [url]")
+    op.add_option(
+        "-c",
+        "--concurrency",
+        action="store",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="number of concurrent connections",
+    )
+    op.add_option(
+        "-r",
+        "--rate",
+        action="store",
+        type=float,
+        default=None,
+        help="target requests per second, as fast as possible by default",
+    )
+    op.add_option(
+        "-n",
+        "--requests",
+        action="store",
+        type=int,
+        default=None,
+        help="number of requests to send",
+    )
+    op.add_option(
+        "-d",
+        "--duration",
+        action="store",
+        type=float,
+        default=None,
+        help="seconds to send requests for (10 without -n)",
+    )
+    op.add_option(
+        "--replay",
+        action="store",
+        default=None,
+        help="JSONL file of request bodies to send instead of a synthetic mix",
+    )
+    op.add_option(
+        "--score-ratio",
+        action="store",
+        type=float,
+        default=0.5,
+        help="share of online_score requests in the synthetic mix",
+    )
+    op.add_option("--min-clients", action="store", type=int, default=1)
+    op.add_option(
+        "--max-clients",
+        action="store",
+        type=int,
+        default=10,
+        help="max number of client IDs of clients_interests requests",
+    )
+    op.add_option(
+        "--admin-share",
+        action="store",
+        type=float,
+        default=0.0,
+        help="share of requests sent by the admin",
+    )
+    op.add_option("--seed", action="store", type=int, default=None)
+    op.add_option(
+        "--json",
+        action="store_true",
+        default=False,
+        help="print the report as JSON",
+    )
+    (opts, args) = op.parse_args()
+    url = args[0] if args else DEFAULT_URL
+
+    if opts.replay:
+        requests = replay_requests(opts.replay)
+    else:
+        requests = synthetic_requests(
+            opts.score_ratio,
+            opts.min_clients,
+            opts.max_clients,
+            opts.admin_share,
+            seed=opts.seed,
+        )
+    duration = opts.duration
+    if duration is None and opts.requests is None:
+        duration = 10.0
+    generator = LoadGenerator(
+        url,
+        requests,
+        opts.concurrency,
+        opts.rate,
+        opts.requests,
+        duration,
+    )
+    results, elapsed = generator.run()
+    summary = summarize(results, elapsed)
+    if opts.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_report(summary))
+    if not results.count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Logging which never makes request handling wait on disk.
+
+`setup_logging` routes all records through a queue. Records are
+formatted and written by a `QueueListener` thread, so the request thread
+only puts them into the queue. `AccessLog` writes one structured line per
+request, optionally with request and response bodies cut to a maximum
+size, and can log only a sample of successful requests.
+"""
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import queue
+import random
+import typing as t
+
+from otus_scoring_api import codec
+
+LOG_FORMAT = "[%(asctime)s] %(levelname).1s %(message)s"
+LOG_DATE_FORMAT = "%Y.%m.%d %H:%M:%S"
+
+DEFAULT_MAX_BODY_SIZE: int = 1024
+
+_access_logger = logging.getLogger("otus_scoring_api.access")
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler leaving the formatting to the listener thread.
+
+    `QueueHandler` formats records before putting them into the queue, so
+    that they could be pickled. The queue is only shared with a thread
+    here, so the record is passed as is.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    filename: t.Optional[str] = None, level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """Configure the root logger to write records in a background thread.
+
+    Returns the started listener, stop it to flush the remaining records.
+    A forked process has to set logging up again.
+    """
+    if filename:
+        handler: logging.Handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
+
+
+def truncate(data: t.Union[bytes, bytearray], size: int) -> str:
+    text = bytes(data[:size]).decode("utf-8", "replace")
+    if len(data) > size:
+        text += f"...({len(data)} bytes)"
+    return text
+
+
+class AccessRecord:
+    """Fields of the access log line, encoded when the line is written"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: t.Dict[str, t.Any]):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return codec.dumps(self.fields).decode("utf-8")
+
+
+class AccessLog:
+    """Writes a structured line per request to the access logger.
+
+    Requests failed with codes 400 and higher are always logged,
+    successful ones with the probability of `sample_rate`. Bodies are
+    logged only with `log_bodies` set and are cut to `max_body_size`.
+    """
+
+    def __init__(
+        self,
+        log_bodies: bool = False,
+        max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+        sample_rate: float = 1.0,
+        logger: logging.Logger = _access_logger,
+    ):
+        self.log_bodies = log_bodies
+        self.max_body_size = max_body_size
+        self.sample_rate = sample_rate
+        self.logger = logger
+
+    def log(
+        self,
+        context: t.Dict[str, t.Any],
+        code: int,
+        duration: float,
+        request_body: t.Optional[bytes] = None,
+        response_body: t.Optional[t.Union[bytes, bytearray]] = None,
+        timings: t.Optional[t.Dict[str, float]] = None,
+    ) -> None:
+        if code < 400 and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        fields = dict(context, code=code, duration=round(duration * 1e3, 3))
+        if request_body is not None:
+            fields["request_size"] = len(request_body)
+        if response_body is not None:
+            fields["response_size"] = len(response_body)
+        if timings:
+            fields["timings"] = {
+                k: round(v * 1e3, 3) for k, v in timings.items()
+            }
+        if self.log_bodies:
+            if request_body is not None:
+                fields["request"] = truncate(request_body, self.max_body_size)
+            if response_body is not None:
+                fields["response"] = truncate(
+                    response_body, self.max_body_size
+                )
+        self.logger.info("%s", AccessRecord(fields))
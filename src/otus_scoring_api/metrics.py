@@ -0,0 +1,281 @@
+"""Counters and histograms exposed in the Prometheus text format.
+
+Every labelled value is updated in place under its own lock, held only
+for the update itself. `render` takes a snapshot of the values one at a
+time, so it never blocks the handlers for longer than a single update.
+"""
+from __future__ import annotations
+
+import abc
+import bisect
+import math
+import threading
+import typing as t
+
+if t.TYPE_CHECKING:
+    from otus_scoring_api.breaker import CircuitBreaker
+    from otus_scoring_api.cache import LocalCache
+
+PREFIX = "scoring_api_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS: t.Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+_metrics: t.List[Metric] = []
+
+
+def escape(value: t.Any) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def format_labels(names: t.Sequence[str], values: t.Sequence[t.Any]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+    return "{%s}" % pairs
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: t.Sequence[float]):
+        self.buckets = buckets
+        # observations per bucket, the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> t.Tuple[t.List[int], float, int]:
+        with self._lock:
+            return self.counts[:], self.sum, self.count
+
+
+class Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: t.Sequence[str] = ()
+    ):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: t.Dict[t.Tuple, t.Any] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values: t.Any) -> t.Any:
+        """Return the value of the metric with the given label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}"
+                )
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self.make_value()
+        return child
+
+    @abc.abstractmethod
+    def make_value(self) -> t.Any:
+        ...
+
+    def collect(self) -> t.Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            yield from self.samples(values, child)
+
+    @abc.abstractmethod
+    def samples(self, values: t.Tuple, child: t.Any) -> t.Iterator[str]:
+        ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def make_value(self) -> CounterValue:
+        return CounterValue()
+
+    def samples(self, values: t.Tuple, child: CounterValue) -> t.Iterator[str]:
+        labels = format_labels(self.labelnames, values)
+        yield f"{self.name}{labels} {format_value(child.value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: t.Sequence[str] = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def make_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def samples(
+        self, values: t.Tuple, child: HistogramValue
+    ) -> t.Iterator[str]:
+        counts, total, count = child.snapshot()
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            labels = format_labels(names, values + (format_value(bound),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {format_value(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+def gauges(
+    name: str, documentation: str, values: t.Mapping[str, t.Any], label: str
+) -> t.Iterator[str]:
+    """Render a gauge with a sample per item of `values`"""
+    name = PREFIX + name
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    for key, value in values.items():
+        yield f'{name}{{{label}="{escape(key)}"}} {format_value(value)}'
+
+
+def breaker_samples(breaker: CircuitBreaker) -> t.Iterator[str]:
+    stats = breaker.stats()
+    state = stats.pop("state")
+    yield from gauges(
+        "breaker_state",
+        "Circuit breaker state, 1 for the current one",
+        {s: int(s == state) for s in ("closed", "open", "half-open")},
+        "state",
+    )
+    yield from gauges("breaker", "Circuit breaker counters", stats, "stat")
+
+
+def cache_samples(cache: LocalCache) -> t.Iterator[str]:
+    yield from gauges(
+        "local_cache", "Local cache statistics", cache.stats(), "stat"
+    )
+
+
+def render(store: t.Any = None) -> bytes:
+    """Render all the metrics, with the breaker and caches stats of `store`"""
+    lines: t.List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.collect())
+    breaker = getattr(store, "breaker", None)
+    if breaker is not None:
+        lines.extend(breaker_samples(breaker))
+    cache = getattr(store, "cache", None)
+    if cache is not None:
+        lines.extend(cache_samples(cache))
+    tracking = getattr(store, "tracking", None)
+    if tracking is not None:
+        lines.extend(
+            gauges(
+                "tracking_cache",
+                "Statistics of the local cache of tracked keys",
+                tracking.stats(),
+                "stat",
+            )
+        )
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+method_requests = Counter(
+    "method_requests_total",
+    "Method requests by method and response code",
+    ("method", "code"),
+)
+method_latency = Histogram(
+    "method_duration_seconds",
+    "Time spent performing method requests",
+    ("method",),
+)
+score_cache = Counter(
+    "score_cache_total",
+    "Score cache lookups by result",
+    ("result",),
+)
+score_cache_hits = score_cache.labels("hit")
+score_cache_misses = score_cache.labels("miss")
+interests_clients = Counter(
+    "interests_clients_total",
+    "Clients whose interests were fetched from the store",
+)
+interests_errors = Counter(
+    "interests_errors_total",
+    "Failed fetches of interests",
+)
+interests_latency = Histogram(
+    "interests_fetch_duration_seconds",
+    "Time spent fetching interests from the store",
+)
+store_latency = Histogram(
+    "store_call_duration_seconds",
+    "Time spent in store calls by command",
+    ("command",),
+)
+store_errors = Counter(
+    "store_errors_total",
+    "Failed store calls by command and error kind",
+    ("command", "kind"),
+)
@@ -0,0 +1,155 @@
+"""Compact storage format of scores and interests.
+
+A packed value starts with a header byte holding the format version in
+the high nibble and the value type in the low one. Header bytes are
+control characters other than JSON whitespace, so they never start a value
+written as text by the older releases: a JSON document or a number. Such
+values are still read, so stored data does not have to be migrated at once.
+
+Scores which are multiples of 0.5 (all the calculated ones) are packed
+into a single byte of half-points, others into a double. Interests are
+packed as a byte per interest: its index in `VOCABULARY`, or `ESCAPE`
+followed by the length and UTF-8 bytes of a name out of the vocabulary.
+Packed interests are decoded on read only as far as the caller needs:
+the raw JSON of a value is assembled from the precomputed JSON of the
+vocabulary names without building Python lists.
+"""
+from __future__ import annotations
+
+import functools
+import struct
+import typing as t
+
+from otus_scoring_api import codec
+
+VERSION: int = 1
+
+SCORE_HALVES: int = VERSION << 4 | 1
+SCORE_DOUBLE: int = VERSION << 4 | 2
+INTERESTS: int = VERSION << 4 | 3
+INTERESTS_HEADER: bytes = bytes([INTERESTS])
+HEADERS: t.FrozenSet[int] = frozenset((SCORE_HALVES, SCORE_DOUBLE, INTERESTS))
+
+# The index of a name is its ID in packed values, so the vocabulary is
+# append-only: names must never be removed or reordered.
+VOCABULARY: t.Tuple[str, ...] = (
+    "cars",
+    "pets",
+    "travel",
+    "hi-tech",
+    "sport",
+    "music",
+    "books",
+    "tv",
+    "cinema",
+    "geek",
+    "otus",
+)
+ESCAPE: int = 0xFF
+MAX_NAME_SIZE: int = 0xFF
+
+_ids: t.Dict[str, int] = {name: i for i, name in enumerate(VOCABULARY)}
+_json_names: t.Tuple[bytes, ...] = tuple(codec.dumps(n) for n in VOCABULARY)
+_double = struct.Struct("<d")
+
+assert len(VOCABULARY) <= ESCAPE, "interest IDs must fit into a byte"
+
+
+def is_packed(value: t.Any) -> bool:
+    return type(value) is bytes and bool(value) and value[0] in HEADERS
+
+
+def pack_score(score: float) -> bytes:
+    halves = float(score) * 2
+    if halves.is_integer() and 0 <= halves <= 0xFF:
+        return bytes((SCORE_HALVES, int(halves)))
+    return bytes((SCORE_DOUBLE,)) + _double.pack(score)
+
+
+def unpack_score(value: t.Union[bytes, str, float]) -> float:
+    """Decode a packed score, or a number written by the older releases"""
+    if type(value) is bytes and value:
+        header = value[0]
+        if header == SCORE_HALVES:
+            return value[1] / 2
+        if header == SCORE_DOUBLE:
+            return _double.unpack_from(value, 1)[0]
+    return float(value)
+
+
+def pack_interests(interests: t.Any) -> bytes:
+    """Pack a list of names of interests.
+
+    Values which cannot be packed (not a list of strings, or names longer
+    than `MAX_NAME_SIZE` bytes) are encoded as JSON, which is read as well.
+    """
+    if not isinstance(interests, (list, tuple)):
+        return codec.dumps(interests)
+    packed = bytearray(INTERESTS_HEADER)
+    for name in interests:
+        i = _ids.get(name) if type(name) is str else None
+        if i is not None:
+            packed.append(i)
+            continue
+        if not isinstance(name, str):
+            return codec.dumps(list(interests))
+        data = name.encode("utf-8")
+        if len(data) > MAX_NAME_SIZE:
+            return codec.dumps(list(interests))
+        packed.append(ESCAPE)
+        packed.append(len(data))
+        packed.extend(data)
+    return bytes(packed)
+
+
+@functools.lru_cache(maxsize=4096)
+def _unpack_names(packed: bytes) -> t.Tuple[str, ...]:
+    # IDs past the vocabulary may be written by a newer release
+    names = []
+    i, size = 1, len(packed)
+    while i < size:
+        id_ = packed[i]
+        if id_ == ESCAPE:
+            start = i + 2
+            if start > size or start + packed[i + 1] > size:
+                raise ValueError("truncated escape")
+            i = start + packed[i + 1]
+            names.append(packed[start:i].decode("utf-8"))
+        elif id_ < len(VOCABULARY):
+            names.append(VOCABULARY[id_])
+            i += 1
+        else:
+            raise ValueError(f"unknown interest id {id_}")
+    return tuple(names)
+
+
+@functools.lru_cache(maxsize=4096)
+def interests_json(packed: bytes) -> bytes:
+    """Return the JSON list of packed interests.
+
+    Clients share a few sets of interests, so the JSON of the recent ones
+    is cached by their packed value. Raises `ValueError` on malformed ones.
+    """
+    ids = packed[1:]
+    if ESCAPE not in ids and max(ids, default=0) < len(VOCABULARY):
+        return b"[%s]" % b",".join(_json_names[i] for i in ids)
+    return codec.dumps(list(_unpack_names(packed)))
+
+
+def unpack_interests(value: t.Union[bytes, str, None]) -> t.List[str]:
+    """Decode packed interests, or JSON written by the older releases"""
+    if not value:
+        return []
+    if type(value) is bytes and value[0] == INTERESTS:
+        return list(_unpack_names(value))
+    return codec.loads(value)
+
+
+def repack_interests(value: t.Union[bytes, str, None]) -> t.Optional[bytes]:
+    """Return the packed value of stored interests, `None` if it is packed
+    already or missing
+    """
+    if not value or is_packed(value):
+        return None
+    packed = pack_interests(codec.loads(value))
+    return packed if is_packed(packed) else None
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import typing as t
+
+DEFAULT_BACKLOG: int = 128
+RESTART_DELAY: float = 1.0
+# seconds to wait for workers to exit on SIGTERM before killing them
+DEFAULT_SHUTDOWN_TIMEOUT: float = 10.0
+
+
+def create_listen_socket(
+    host: str,
+    port: int,
+    reuse_port: bool = False,
+    listen: bool = True,
+    backlog: int = DEFAULT_BACKLOG,
+) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(backlog)
+    return sock
+
+
+class PreforkServer:
+    """Supervisor of pre-forked worker processes sharing one listen address.
+
+    With `reuse_port` disabled, children inherit the listening socket
+    created by the supervisor. Otherwise every child binds its own socket
+    with `SO_REUSEPORT` and the kernel balances connections between them.
+    The `serve` callable is run in each child after the fork, so it has to
+    create its own store connections. Crashed children are restarted.
+    On shutdown children get SIGTERM, and SIGKILL if they do not exit
+    within `shutdown_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        serve: t.Callable[[socket.socket], None],
+        host: str,
+        port: int,
+        workers: int,
+        reuse_port: bool = False,
+        shutdown_timeout: float = DEFAULT_SHUTDOWN_TIMEOUT,
+    ):
+        if workers < 1:
+            raise ValueError("number of workers must be positive")
+        self._serve = serve
+        self._host = host
+        self._port = port
+        self._workers = workers
+        self._reuse_port = reuse_port
+        self._shutdown_timeout = shutdown_timeout
+        self._socket: t.Optional[socket.socket] = None
+        self._children: t.Dict[int, float] = {}
+        self._stopping = threading.Event()
+
+    @property
+    def children(self) -> t.List[int]:
+        return list(self._children)
+
+    @property
+    def address(self) -> t.Tuple[str, int]:
+        if self._socket is not None:
+            return self._socket.getsockname()
+        return self._host, self._port
+
+    def bind(self) -> None:
+        # with SO_REUSEPORT the supervisor only holds the address: a
+        # listening socket would get its share of connections as well
+        self._socket = create_listen_socket(
+            self._host,
+            self._port,
+            reuse_port=self._reuse_port,
+            listen=not self._reuse_port,
+        )
+        # the port may be chosen by the kernel, children reuse the actual one
+        self._port = self._socket.getsockname()[1]
+
+    def run(self) -> None:
+        """Serve until SIGINT or SIGTERM is received"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stop())
+        self.supervise()
+
+    def supervise(self) -> None:
+        if self._socket is None:
+            self.bind()
+
+        # move objects created so far to the permanent generation,
+        # so the collector does not touch (and copy) their pages in children
+        gc.collect()
+        gc.freeze()
+
+        for _ in range(self._workers):
+            self._spawn()
+
+        while not self._stopping.is_set():
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if not pid:
+                self._stopping.wait(0.1)
+                continue
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping.is_set():
+                continue
+            logging.warning(
+                "Worker %s exited with status %s, restarting", pid, status
+            )
+            # do not spin if a worker crashes right after start
+            if time.monotonic() - started < RESTART_DELAY:
+                self._stopping.wait(RESTART_DELAY)
+            if not self._stopping.is_set():
+                self._spawn()
+
+        self._terminate_children()
+        self._socket.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            logging.info("Started worker %s", pid)
+            return
+
+        # child process, must never return into the supervisor code
+        code = 0
+        try:
+            # let the serving loop shut down gracefully
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, signal.default_int_handler)
+            if self._reuse_port:
+                self._socket.close()
+                self._socket = create_listen_socket(
+                    self._host, self._port, reuse_port=True
+                )
+            self._serve(self._socket)
+        except BaseException:
+            logging.exception("Worker %s failed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _terminate_children(self) -> None:
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self._shutdown_timeout
+        running = set(self._children)
+        while running:
+            running = {pid for pid in running if not reap(pid, os.WNOHANG)}
+            if not running or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        for pid in running:
+            logging.warning(
+                "Worker %s did not exit in %s s, killing it",
+                pid,
+                self._shutdown_timeout,
+            )
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            reap(pid)
+        self._children.clear()
+
+
+def reap(pid: int, options: int = 0) -> bool:
+    """Wait for the child process, return whether it has exited"""
+    try:
+        return os.waitpid(pid, options)[0] != 0
+    except ChildProcessError:
+        return True
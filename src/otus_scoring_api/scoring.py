@@ -1,53 +1,86 @@
 from __future__ import annotations
 
 import datetime
+import functools
 import hashlib
-import json
 import logging
+import time
 import typing as t
+import weakref
 
-from otus_scoring_api.store import StoreError
+from otus_scoring_api import codec, metrics, packing
+from otus_scoring_api.singleflight import (
+    AsyncSingleFlight,
+    FlightTimeout,
+    SingleFlight,
+)
+from otus_scoring_api.store import chunked, StoreError
 
 if t.TYPE_CHECKING:
-    from otus_scoring_api.store import AbstractStore
+    from otus_scoring_api.store import AbstractAsyncStore, AbstractStore
 
-_logger = logging.Logger(__name__)
+_logger = logging.getLogger(__name__)
 
 
 class ScoringError(Exception):
     ...
 
 
+# concurrent misses of the same score or interests key are coalesced per
+# store, see `flights`
+_flights: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_async_flights: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def flights(store: AbstractStore) -> SingleFlight:
+    """Return in-flight calls to the store"""
+    store_flights = _flights.get(store)
+    if store_flights is None:
+        store_flights = _flights.setdefault(store, SingleFlight())
+    return store_flights
+
+
+def async_flights(store: AbstractAsyncStore) -> AsyncSingleFlight:
+    store_flights = _async_flights.get(store)
+    if store_flights is None:
+        store_flights = _async_flights.setdefault(store, AsyncSingleFlight())
+    return store_flights
+
+
+# prefix of the binary score keys, see `score_key_in_store`
+SCORE_KEY_PREFIX: bytes = b"s:"
+
+
 def score_key_in_store(
     phone: t.Union[str, int],
     birthday: t.Optional[datetime.datetime] = None,
     first_name: t.Optional[str] = None,
     last_name: t.Optional[str] = None,
-) -> str:
+) -> bytes:
+    """Return the key of the cached score.
+
+    The key holds the raw md5 digest of the person's data, 18 bytes instead
+    of 36 with the hex digest and the "uid:" prefix of the older releases.
+    """
     key_parts = [
         first_name or "",
         last_name or "",
         str(phone) or "",
         birthday.strftime("%Y%m%d") if birthday is not None else "",
     ]
-    return "uid:" + hashlib.md5("".join(key_parts).encode("utf-8")).hexdigest()
+    digest = hashlib.md5("".join(key_parts).encode("utf-8")).digest()
+    return SCORE_KEY_PREFIX + digest
 
 
-def get_score(
-    store: AbstractStore,
+def calculate_score(
     phone: t.Union[str, int],
     email: str,
     birthday: t.Optional[datetime.datetime] = None,
     gender: t.Optional[int] = None,
     first_name: t.Optional[str] = None,
     last_name: t.Optional[str] = None,
-) -> int:
-    key = score_key_in_store(phone, birthday, first_name, last_name)
-    # try get from cache,
-    # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        return score
+) -> float:
+    score = 0
     if phone:
         score += 1.5
     if email:
@@ -56,22 +89,397 @@ def get_score(
         score += 1.5
     if first_name and last_name:
         score += 0.5
+    return score
+
+
+SCORE_CACHE_TIMEOUT: float = 60 * 60
+
+
+def get_score(
+    store: AbstractStore,
+    phone: t.Union[str, int],
+    email: str,
+    birthday: t.Optional[datetime.datetime] = None,
+    gender: t.Optional[int] = None,
+    first_name: t.Optional[str] = None,
+    last_name: t.Optional[str] = None,
+) -> int:
+    key = score_key_in_store(phone, birthday, first_name, last_name)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    cached = store.cache_get(key)
+    if cached:
+        metrics.score_cache_hits.inc()
+        return packing.unpack_score(cached)
+    metrics.score_cache_misses.inc()
+    args = (phone, email, birthday, gender, first_name, last_name)
+    try:
+        return flights(store).do(key, calculate_and_cache, store, key, *args)
+    except FlightTimeout:
+        # the score does not depend on the store, so calculate it here
+        return calculate_score(*args)
+
+
+def calculate_and_cache(store: AbstractStore, key: bytes, *args) -> float:
+    score = calculate_score(*args)
     # cache for 60 minutes
-    store.cache_set(key, score, 60 * 60)
+    store.cache_set(key, packing.pack_score(score), SCORE_CACHE_TIMEOUT)
     return score
 
 
+async def async_get_score(
+    store: AbstractAsyncStore,
+    phone: t.Union[str, int],
+    email: str,
+    birthday: t.Optional[datetime.datetime] = None,
+    gender: t.Optional[int] = None,
+    first_name: t.Optional[str] = None,
+    last_name: t.Optional[str] = None,
+) -> int:
+    key = score_key_in_store(phone, birthday, first_name, last_name)
+    cached = await store.cache_get(key)
+    if cached:
+        metrics.score_cache_hits.inc()
+        return packing.unpack_score(cached)
+    metrics.score_cache_misses.inc()
+    args = (phone, email, birthday, gender, first_name, last_name)
+    try:
+        return await async_flights(store).do(
+            key, async_calculate_and_cache, store, key, *args
+        )
+    except FlightTimeout:
+        return calculate_score(*args)
+
+
+async def async_calculate_and_cache(
+    store: AbstractAsyncStore, key: bytes, *args
+) -> float:
+    score = calculate_score(*args)
+    await store.cache_set(key, packing.pack_score(score), SCORE_CACHE_TIMEOUT)
+    return score
+
+
+def get_scores_many(
+    store: AbstractStore, arguments: t.Sequence[t.Dict[str, t.Any]]
+) -> t.List[float]:
+    """Get scores for many sets of `get_score` arguments at once.
+
+    Cached scores are read with a single bulk request, the missed ones are
+    calculated and cached with another one.
+    """
+    keys = [score_cache_key(args) for args in arguments]
+    scores, missed = collect_scores(
+        keys, arguments, store.cache_get_many(keys)
+    )
+    if missed:
+        store.cache_set_many(missed, SCORE_CACHE_TIMEOUT)
+    return scores
+
+
+async def async_get_scores_many(
+    store: AbstractAsyncStore, arguments: t.Sequence[t.Dict[str, t.Any]]
+) -> t.List[float]:
+    keys = [score_cache_key(args) for args in arguments]
+    scores, missed = collect_scores(
+        keys, arguments, await store.cache_get_many(keys)
+    )
+    if missed:
+        await store.cache_set_many(missed, SCORE_CACHE_TIMEOUT)
+    return scores
+
+
+def score_cache_key(arguments: t.Dict[str, t.Any]) -> bytes:
+    return score_key_in_store(
+        arguments["phone"],
+        arguments.get("birthday"),
+        arguments.get("first_name"),
+        arguments.get("last_name"),
+    )
+
+
+def collect_scores(
+    keys: t.Sequence[bytes],
+    arguments: t.Sequence[t.Dict[str, t.Any]],
+    cached: t.Sequence[t.Any],
+) -> t.Tuple[t.List[float], t.Dict[bytes, bytes]]:
+    """Return scores and the packed calculated ones to be cached by keys"""
+    scores, missed = [], {}
+    for key, args, value in zip(keys, arguments, cached):
+        if value:
+            scores.append(packing.unpack_score(value))
+            continue
+        score = missed.get(key)
+        if score is None:
+            score = missed[key] = calculate_score(**args)
+        scores.append(score)
+    metrics.score_cache_hits.inc(len(scores) - len(missed))
+    metrics.score_cache_misses.inc(len(missed))
+    return scores, {key: packing.pack_score(s) for key, s in missed.items()}
+
+
 def interests_key_in_store(cid: str) -> str:
     return "i:%s" % cid
 
 
+def set_interests(
+    store: AbstractStore, cid: str, interests: t.Sequence[str]
+) -> None:
+    """Store interests of the client in the packed format"""
+    store.set(interests_key_in_store(cid), packing.pack_interests(interests))
+
+
+def migrate_interests(
+    store: AbstractStore,
+    cids: t.Iterable[str],
+    batch_size: t.Optional[int] = None,
+) -> int:
+    """Pack interests of the clients stored as JSON by the older releases.
+
+    Values are read and written back by batches without a transaction, so
+    writers of the JSON format must be stopped first. Returns the number
+    of rewritten values.
+    """
+    migrated = 0
+    for batch in chunked(list(cids), batch_size):
+        keys = [interests_key_in_store(cid) for cid in batch]
+        packed = {}
+        for key, value in zip(keys, store.get_many(keys)):
+            try:
+                repacked = packing.repack_interests(value)
+            except ValueError:
+                _logger.warning(
+                    "Malformed interests in %s are not packed", key
+                )
+                continue
+            if repacked is not None:
+                packed[key] = repacked
+        if packed:
+            store.set_many(packed)
+            migrated += len(packed)
+    return migrated
+
+
+def raw_interests(value: t.Union[bytes, str, None]) -> bytes:
+    """Return the stored interests as JSON to be written into a response.
+
+    Only packed interests, written and checked by `packing`, are converted
+    without decoding. Values of any other format are decoded and encoded
+    again, so a malformed value is never copied into a response.
+    """
+    if not value:
+        return b"[]"
+    if type(value) is bytes and value[0] == packing.INTERESTS:
+        return packing.interests_json(value)
+    return reencode_interests(value)
+
+
+@functools.lru_cache(maxsize=4096)
+def reencode_interests(value: t.Union[bytes, str]) -> bytes:
+    # clients share a few sets of interests, unpacked ones included
+    return codec.dumps(codec.loads(value))
+
+
+def raw_interests_items(
+    cids: t.Iterable[str], values: t.Iterable[t.Union[bytes, str, None]]
+) -> bytes:
+    """Encode the stored interests as members of a JSON object"""
+    parts = []
+    header, interests_json = packing.INTERESTS_HEADER, packing.interests_json
+    for cid, value in zip(cids, values):
+        # packed values are checked inline, it is the hot loop
+        if type(value) is bytes and value.startswith(header):
+            try:
+                value = interests_json(value)
+            except ValueError as e:
+                raise ScoringError(
+                    f"Malformed interests of {cid} in store: {e}"
+                )
+        else:
+            value = checked_raw_interests(cid, value)
+        parts.append(b"%s:%s" % (codec.dumps_key(cid), value))
+    return b",".join(parts)
+
+
+def checked_raw_interests(cid: str, value: t.Any) -> bytes:
+    try:
+        return raw_interests(value)
+    except ValueError as e:
+        raise ScoringError(f"Malformed interests of {cid} in store: {e}")
+
+
+def checked_interests(cid: str, value: t.Any) -> t.List[str]:
+    try:
+        return packing.unpack_interests(value)
+    except ValueError as e:
+        raise ScoringError(f"Malformed interests of {cid} in store: {e}")
+
+
+def raw_interests_many(
+    cids: t.Iterable[str], values: t.Iterable[t.Union[bytes, str, None]]
+) -> codec.RawJSON:
+    """Assemble the JSON object of the stored interests by client IDs"""
+    return codec.RawJSON(b"{%s}" % raw_interests_items(cids, values))
+
+
 def get_interests(
     store: AbstractStore,
     cid: str,
 ) -> t.List[str]:
+    key = interests_key_in_store(cid)
+    started = time.perf_counter()
     try:
-        r = store.get(interests_key_in_store(cid))
-    except StoreError as e:
+        r = flights(store).do(key, store.get, key)
+    except (StoreError, FlightTimeout) as e:
+        metrics.interests_errors.labels().inc()
         raise ScoringError(f"Can't get interests for {cid} from store: {e}")
+    observe_interests(1, started)
+
+    return checked_interests(cid, r)
+
+
+def get_interests_many(
+    store: AbstractStore,
+    cids: t.Iterable[str],
+    raw: bool = False,
+) -> t.Union[t.Dict[str, t.List[str]], codec.RawJSON]:
+    """Get interests of all the clients with a single bulk store request.
+
+    With `raw` set the stored JSON is not decoded, the whole result is
+    returned as a `RawJSON` object instead of a dict.
+    """
+    cids = list(dict.fromkeys(cids))
+    return decode_interests(cids, fetch_interests(store, cids), raw)
+
+
+def fetch_interests(
+    store: AbstractStore, cids: t.Sequence[str]
+) -> t.List[t.Any]:
+    """Get stored interests of the clients as is.
+
+    Clients which are being fetched by concurrent requests are not
+    requested again, their interests are shared.
+    """
+    started = time.perf_counter()
+    try:
+        values = flights(store).do_many(
+            [interests_key_in_store(cid) for cid in cids], store.get_many
+        )
+    except (StoreError, FlightTimeout) as e:
+        metrics.interests_errors.labels().inc()
+        raise ScoringError(
+            f"Can't get interests for {len(cids)} clients from store: {e}"
+        )
+    observe_interests(len(cids), started)
+    return values
+
+
+def observe_interests(nclients: int, started: float) -> None:
+    metrics.interests_clients.labels().inc(nclients)
+    metrics.interests_latency.labels().observe(time.perf_counter() - started)
+
+
+def decode_interests(
+    cids: t.Sequence[str], values: t.Sequence[t.Any], raw: bool = False
+) -> t.Union[t.Dict[str, t.List[str]], codec.RawJSON]:
+    if raw:
+        return raw_interests_many(cids, values)
+    return {cid: checked_interests(cid, r) for cid, r in zip(cids, values)}
+
+
+def stream_interests(
+    store: AbstractStore,
+    cids: t.Iterable[str],
+    batch_size: t.Optional[int] = None,
+) -> codec.RawJSONStream:
+    """Get interests of the clients by batches, as a stream of raw JSON.
+
+    The first batch is fetched right away, so an unavailable store is
+    reported with `ScoringError` before anything is sent to the client.
+    """
+    batches = chunked(list(dict.fromkeys(cids)), batch_size)
+    first = fetch_raw_interests(store, next(batches, []))
+    return codec.RawJSONStream(iter_interests(store, batches, first))
+
+
+def fetch_raw_interests(store: AbstractStore, cids: t.Sequence[str]) -> bytes:
+    return raw_interests_items(cids, fetch_interests(store, cids))
+
+
+def iter_interests(
+    store: AbstractStore, batches: t.Iterator[t.Sequence[str]], first: bytes
+) -> t.Iterator[bytes]:
+    yield b"{%s" % first
+    for batch in batches:
+        yield b",%s" % fetch_raw_interests(store, batch)
+    yield b"}"
+
+
+async def async_get_interests(
+    store: AbstractAsyncStore,
+    cid: str,
+) -> t.List[str]:
+    key = interests_key_in_store(cid)
+    started = time.perf_counter()
+    try:
+        r = await async_flights(store).do(key, store.get, key)
+    except (StoreError, FlightTimeout) as e:
+        metrics.interests_errors.labels().inc()
+        raise ScoringError(f"Can't get interests for {cid} from store: {e}")
+    observe_interests(1, started)
+
+    return checked_interests(cid, r)
+
+
+async def async_get_interests_many(
+    store: AbstractAsyncStore,
+    cids: t.Iterable[str],
+    raw: bool = False,
+) -> t.Union[t.Dict[str, t.List[str]], codec.RawJSON]:
+    cids = list(dict.fromkeys(cids))
+    return decode_interests(
+        cids, await async_fetch_interests(store, cids), raw
+    )
+
+
+async def async_fetch_interests(
+    store: AbstractAsyncStore, cids: t.Sequence[str]
+) -> t.List[t.Any]:
+    started = time.perf_counter()
+    try:
+        values = await async_flights(store).do_many(
+            [interests_key_in_store(cid) for cid in cids], store.get_many
+        )
+    except (StoreError, FlightTimeout) as e:
+        metrics.interests_errors.labels().inc()
+        raise ScoringError(
+            f"Can't get interests for {len(cids)} clients from store: {e}"
+        )
+    observe_interests(len(cids), started)
+    return values
+
+
+async def async_stream_interests(
+    store: AbstractAsyncStore,
+    cids: t.Iterable[str],
+    batch_size: t.Optional[int] = None,
+) -> codec.RawJSONStream:
+    batches = chunked(list(dict.fromkeys(cids)), batch_size)
+    first = await async_fetch_raw_interests(store, next(batches, []))
+    return codec.RawJSONStream(async_iter_interests(store, batches, first))
+
+
+async def async_fetch_raw_interests(
+    store: AbstractAsyncStore, cids: t.Sequence[str]
+) -> bytes:
+    return raw_interests_items(cids, await async_fetch_interests(store, cids))
+
 
-    return json.loads(r) if r else []
+async def async_iter_interests(
+    store: AbstractAsyncStore,
+    batches: t.Iterator[t.Sequence[str]],
+    first: bytes,
+) -> t.AsyncIterator[bytes]:
+    yield b"{%s" % first
+    for batch in batches:
+        yield b",%s" % await async_fetch_raw_interests(store, batch)
+    yield b"}"
@@ -0,0 +1,216 @@
+"""Coalescing of concurrent identical calls.
+
+The first caller asking for a key performs the call; callers asking for
+the same key while it is in flight wait for its outcome instead of
+repeating it. Errors of the call are raised in every waiter. If the
+coroutine performing the call is cancelled, its waiters are not: they
+perform the call again. Nothing is cached: a key asked for after the
+call is done is fetched again.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import typing as t
+
+DEFAULT_TIMEOUT: float = 10.0
+
+
+class FlightTimeout(TimeoutError):
+    """The in-flight call of another caller did not finish in time"""
+
+
+class Flight:
+    """Keys fetched by one call and their outcome.
+
+    `done` of threaded flights is a lock held until the call is over, it is
+    much cheaper to create than an event.
+    """
+
+    __slots__ = ("done", "values", "error", "abandoned")
+
+    def __init__(self, done: t.Any):
+        self.done = done
+        self.values: t.Dict[t.Hashable, t.Any] = {}
+        self.error: t.Optional[BaseException] = None
+        # the caller has been cancelled before the call was over
+        self.abandoned = False
+
+    def wait(self, timeout: t.Optional[float] = None) -> bool:
+        if not self.done.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        self.done.release()
+        return True
+
+    def value(self, key: t.Hashable) -> t.Any:
+        if self.error is not None:
+            raise self.error
+        return self.values[key]
+
+
+class SingleFlight:
+    """Coalesces calls of concurrent threads"""
+
+    def __init__(self, timeout: t.Optional[float] = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights: t.Dict[t.Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def do(
+        self, key: t.Hashable, func: t.Callable[..., t.Any], *args
+    ) -> t.Any:
+        """Return `func(*args)`, shared by concurrent callers of the key"""
+        with self._lock:
+            source = self._flights.get(key)
+            if source is None:
+                flight = self._flights[key] = self._start()
+        if source is not None:
+            return self._wait([source])[0].value(key)
+        try:
+            value = flight.values[key] = func(*args)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(flight, [key])
+        return value
+
+    def do_many(
+        self,
+        keys: t.Sequence[t.Hashable],
+        func: t.Callable[[t.List[t.Hashable]], t.Sequence[t.Any]],
+    ) -> t.List[t.Any]:
+        """Return values of `keys`.
+
+        `func` is called with the keys which are not in flight and must
+        return their values in the same order. The other keys are waited
+        for, `FlightTimeout` is raised if they take longer than `timeout`.
+        """
+        flight = self._start()
+        with self._lock:
+            if self._flights.keys().isdisjoint(keys):
+                # nothing is in flight, the common case
+                own = list(dict.fromkeys(keys))
+                self._flights.update(dict.fromkeys(own, flight))
+                sources = (
+                    None if len(own) == len(keys) else [flight] * len(keys)
+                )
+            else:
+                own, sources = [], []
+                for key in keys:
+                    source = self._flights.get(key)
+                    if source is None:
+                        source = self._flights[key] = flight
+                        own.append(key)
+                    sources.append(source)
+
+        if own:
+            try:
+                values = func(own)
+                flight.values = dict(zip(own, values))
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                self._finish(flight, own)
+            if sources is None:
+                return list(values)
+        else:
+            self._finish(flight, own)
+
+        self._wait([s for s in dict.fromkeys(sources) if s is not flight])
+        return [source.value(key) for key, source in zip(keys, sources)]
+
+    def _start(self) -> Flight:
+        done = threading.Lock()
+        done.acquire()
+        return Flight(done)
+
+    def _finish(self, flight: Flight, keys: t.Sequence[t.Hashable]) -> None:
+        with self._lock:
+            if len(self._flights) == len(keys):
+                self._flights.clear()
+            else:
+                for key in keys:
+                    del self._flights[key]
+        flight.done.release()
+
+    def _wait(self, flights: t.Sequence[Flight]) -> t.Sequence[Flight]:
+        started = time.monotonic()
+        for flight in flights:
+            remaining = None
+            if self.timeout is not None:
+                remaining = max(started + self.timeout - time.monotonic(), 0)
+            if not flight.wait(remaining):
+                raise FlightTimeout("coalesced call timed out")
+        return flights
+
+
+class AsyncSingleFlight:
+    """Coalesces calls of concurrent coroutines of one event loop"""
+
+    def __init__(self, timeout: t.Optional[float] = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._flights: t.Dict[t.Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self, key: t.Hashable, func: t.Callable[..., t.Awaitable], *args
+    ) -> t.Any:
+        async def call(_):
+            return [await func(*args)]
+
+        return (await self.do_many([key], call))[0]
+
+    async def do_many(
+        self,
+        keys: t.Sequence[t.Hashable],
+        func: t.Callable[[t.List[t.Hashable]], t.Awaitable[t.Sequence]],
+    ) -> t.List[t.Any]:
+        """Coroutine version of `SingleFlight.do_many`"""
+        flight = Flight(asyncio.Event())
+        own, sources = [], []
+        for key in keys:
+            source = self._flights.get(key)
+            if source is None:
+                source = self._flights[key] = flight
+                own.append(key)
+            sources.append(source)
+
+        if own:
+            try:
+                flight.values = dict(zip(own, await func(own)))
+            except Exception as e:
+                flight.error = e
+                raise
+            except BaseException:
+                flight.abandoned = True
+                raise
+            finally:
+                for key in own:
+                    del self._flights[key]
+                flight.done.set()
+
+        waited = [
+            s.done.wait() for s in dict.fromkeys(sources) if s is not flight
+        ]
+        if waited:
+            try:
+                await asyncio.wait_for(asyncio.gather(*waited), self.timeout)
+            except asyncio.TimeoutError:
+                raise FlightTimeout("coalesced call timed out")
+        retried = [k for k, s in zip(keys, sources) if s.abandoned]
+        if retried:
+            # the first waiter to get here performs the call again
+            values = dict(zip(retried, await self.do_many(retried, func)))
+            return [
+                values[key] if source.abandoned else source.value(key)
+                for key, source in zip(keys, sources)
+            ]
+        return [source.value(key) for key, source in zip(keys, sources)]
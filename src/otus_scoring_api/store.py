@@ -1,20 +1,55 @@
+from __future__ import annotations
+
 import abc
+import asyncio
+import contextlib
 import time
+import types
 import typing as t
 from urllib.parse import urlparse
 
 import redis
+import redis.asyncio
+import redis.asyncio.retry
 from redis.backoff import ExponentialBackoff
 from redis.exceptions import ConnectionError as RedisConnectionError
-from redis.exceptions import RedisError
+from redis.exceptions import MaxConnectionsError, RedisError
+from redis.exceptions import TimeoutError as RedisTimeoutError
 from redis.retry import Retry
 
-if t.TYPE_CHECKING:
-    from urllib.parse import ParseResult
+from otus_scoring_api import metrics
+from otus_scoring_api.breaker import (
+    CircuitBreaker,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+)
+from otus_scoring_api.cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_SWEEP_INTERVAL,
+    LocalCache,
+    MISSING,
+)
+from otus_scoring_api.tracking import (
+    DEFAULT_FALLBACK_TIMEOUT,
+    DEFAULT_TRACKING_TIMEOUT,
+    TrackingCache,
+)
 
 DEFAULT_TIMEOUT: float = 30.0
 DEFAULT_RETRY_ATTEMPTS: int = 5
 DEFAULT_CACHE_TIMEOUT: float = 30.0
+# max number of keys requested with a single MGET command
+DEFAULT_BATCH_SIZE: int = 1000
+
+
+def chunked(
+    items: t.Sequence, size: t.Optional[int] = None
+) -> t.Iterator[t.Sequence]:
+    """Split `items` into chunks of `size` (`DEFAULT_BATCH_SIZE` by default)"""
+    size = size or DEFAULT_BATCH_SIZE
+    for start in range(0, len(items), size):
+        end = start + size
+        yield items[start:end]
 
 
 class StoreError(Exception):
@@ -25,6 +60,33 @@ class StoreConnectionError(StoreError):
     ...
 
 
+def raise_store_error(e: RedisError) -> t.NoReturn:
+    if isinstance(e, RedisConnectionError):
+        raise StoreConnectionError(str(e)) from e
+    raise StoreError(str(e)) from e
+
+
+def is_pool_exhausted(e: RedisError) -> bool:
+    # raised by a pool without a free connection, before reaching redis:
+    # a non-blocking one above `max_connections`, a blocking one after
+    # waiting for `pool_timeout`
+    return isinstance(e, MaxConnectionsError) or (
+        isinstance(e, RedisConnectionError)
+        and str(e) == "No connection available."
+    )
+
+
+def command_name(func: t.Callable) -> str:
+    # redis client methods are named after the commands, pipelines are
+    # sent with `execute`
+    name = getattr(func, "__name__", "call")
+    return "pipeline" if name == "execute" else name
+
+
+def observe_error(func: t.Callable, kind: str) -> None:
+    metrics.store_errors.labels(command_name(func), kind).inc()
+
+
 class AbstractStore(abc.ABC):
     def __init__(
         self,
@@ -52,67 +114,636 @@ class AbstractStore(abc.ABC):
     def cache_set(self, key: str, value: t.Any, timeout: float) -> None:
         ...
 
+    def get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        """Get values of `keys` in the same order, `None` for missing ones"""
+        return [self.get(key) for key in keys]
+
+    def set_many(self, mapping: t.Mapping[str, t.Any]) -> None:
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def cache_get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        return [self.cache_get(key) for key in keys]
+
+    def cache_set_many(
+        self, mapping: t.Mapping[str, t.Any], timeout: float
+    ) -> None:
+        for key, value in mapping.items():
+            self.cache_set(key, value, timeout)
+
+    def make_pipeline(self, transaction: bool = False) -> StorePipeline:
+        return StorePipeline(self)
+
+    @contextlib.contextmanager
+    def pipeline(self, transaction: bool = False) -> t.Iterator[StorePipeline]:
+        """Queue `get`/`set` commands and execute them at once on exit.
+
+        Results are available in the `results` attribute of the pipeline
+        after the context is left. Nothing is executed if the block raises.
+        """
+        pipe = self.make_pipeline(transaction)
+        yield pipe
+        pipe.execute()
+
+
+class StorePipeline:
+    """Commands queued to be executed in a batch by the store"""
+
+    def __init__(self, store: AbstractStore):
+        self._store = store
+        self._commands: t.List[t.Tuple[str, tuple]] = []
+        self.results: t.List[t.Any] = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def get(self, key: str) -> StorePipeline:
+        self._commands.append(("get", (key,)))
+        return self
+
+    def set(self, key: str, value: t.Any) -> StorePipeline:
+        self._commands.append(("set", (key, value)))
+        return self
+
+    def execute(self) -> t.List[t.Any]:
+        commands, self._commands = self._commands, []
+        self.results = [
+            getattr(self._store, name)(*args) for name, args in commands
+        ]
+        return self.results
+
+
+class AbstractAsyncStore(abc.ABC):
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        retry_attempts: int = DEFAULT_RETRY_ATTEMPTS,
+        *args,
+        **kwargs,
+    ):
+        self._timeout = timeout
+        self._retry_attempts = retry_attempts
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> t.Any:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: t.Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def cache_get(self, key: str) -> t.Any:
+        ...
+
+    @abc.abstractmethod
+    async def cache_set(self, key: str, value: t.Any, timeout: float) -> None:
+        ...
+
+    async def get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        """Get values of `keys` in the same order, `None` for missing ones"""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, mapping: t.Mapping[str, t.Any]) -> None:
+        for key, value in mapping.items():
+            await self.set(key, value)
+
+    async def cache_get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        return [await self.cache_get(key) for key in keys]
+
+    async def cache_set_many(
+        self, mapping: t.Mapping[str, t.Any], timeout: float
+    ) -> None:
+        for key, value in mapping.items():
+            await self.cache_set(key, value, timeout)
+
+    async def close(self) -> None:
+        pass
+
 
 DEFAULT_REDIS_URL: str = "redis://localhost:6379"
 
 
-class RedisStore(AbstractStore):
+def make_connection_pool(
+    client_module: types.ModuleType,
+    url: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    connect_timeout: t.Optional[float] = None,
+    max_connections: t.Optional[int] = None,
+    pool_timeout: t.Optional[float] = None,
+    socket_keepalive: bool = False,
+    health_check_interval: float = 0,
+    retry: t.Optional[Retry] = None,
+) -> t.Any:
+    """Create a connection pool of `redis` or `redis.asyncio` module.
+
+    The url may use `redis://`, `rediss://` (TLS) or `unix://` schemes and
+    contain a db index. With `pool_timeout` set, the pool is blocking:
+    a caller waits up to `pool_timeout` seconds for a free connection
+    instead of opening a new one above `max_connections`.
+    """
+    options = dict(
+        socket_timeout=timeout,
+        socket_connect_timeout=connect_timeout,
+        health_check_interval=health_check_interval,
+        retry=retry,
+    )
+    if urlparse(url).scheme != "unix":
+        options["socket_keepalive"] = socket_keepalive
+    if max_connections is not None:
+        options["max_connections"] = max_connections
+
+    if pool_timeout is not None:
+        return client_module.BlockingConnectionPool.from_url(
+            url, timeout=pool_timeout, **options
+        )
+    return client_module.ConnectionPool.from_url(url, **options)
+
+
+# namespace of the cache entries shared between processes through Redis
+CACHE_KEY_PREFIX: str = "cache:"
+
+
+def shared_cache_key(key: t.Union[str, bytes]) -> t.Union[str, bytes]:
+    if isinstance(key, bytes):
+        # binary keys of the packed storage format
+        return CACHE_KEY_PREFIX.encode() + key
+    return CACHE_KEY_PREFIX + key
+
+
+def queue_shared_get(pipe: t.Any, keys: t.Sequence[str]) -> None:
+    # the shared cache entry, its TTL and the persistent value of each key
+    for key in keys:
+        pipe.get(shared_cache_key(key))
+        pipe.pttl(shared_cache_key(key))
+        pipe.get(key)
+
+
+def queue_shared_set(
+    pipe: t.Any, items: t.Sequence[t.Tuple[str, t.Any]], timeout: float
+) -> None:
+    px = max(1, int(timeout * 1000))
+    for key, value in items:
+        pipe.set(shared_cache_key(key), value, px=px)
+
+
+def merge_shared_replies(
+    cache: LocalCache, keys: t.Sequence[str], replies: t.List[t.Any]
+) -> t.List[t.Any]:
+    """Pick values from replies to the `queue_shared_get` commands.
+
+    A shared cache entry is preferred over the persistent value and is put
+    into the local cache for the rest of its lifetime.
+    """
+    values = []
+    it = iter(replies)
+    for key, shared, ttl, persistent in zip(keys, it, it, it):
+        if shared is None:
+            values.append(persistent)
+            continue
+        if ttl > 0:
+            cache.set(key, shared, ttl / 1000)
+        values.append(shared)
+    return values
+
+
+def make_tracking_cache(
+    url: str,
+    prefixes: t.Sequence[str],
+    timeout: float = DEFAULT_TRACKING_TIMEOUT,
+    fallback_timeout: float = DEFAULT_FALLBACK_TIMEOUT,
+    max_entries: t.Optional[int] = DEFAULT_MAX_ENTRIES,
+    sweep_interval: t.Optional[float] = DEFAULT_SWEEP_INTERVAL,
+    socket_timeout: float = DEFAULT_TIMEOUT,
+    connect_timeout: t.Optional[float] = None,
+    socket_keepalive: bool = False,
+) -> t.Optional[TrackingCache]:
+    """Start a cache of the keys with `prefixes`, `None` without prefixes.
+
+    Invalidations are received through a dedicated connection, so the
+    same cache serves the sync and asyncio stores.
+    """
+    if not prefixes:
+        return None
+    pool = make_connection_pool(
+        redis,
+        url,
+        timeout=socket_timeout,
+        connect_timeout=connect_timeout,
+        socket_keepalive=socket_keepalive,
+    )
+    tracking = TrackingCache(
+        prefixes,
+        pool.make_connection,
+        timeout,
+        fallback_timeout,
+        max_entries,
+        sweep_interval,
+    )
+    tracking.start()
+    return tracking
+
+
+def merge_tracked(
+    keys: t.Sequence[str],
+    values: t.List[t.Any],
+    fetched: t.Mapping[str, t.Any],
+) -> t.List[t.Any]:
+    return [
+        fetched[key] if v is MISSING else v for key, v in zip(keys, values)
+    ]
+
+
+class BaseRedisStore:
+    """Local cache, circuit breaker and client shared by the Redis stores.
+
+    Subclasses set `client_module` to `redis` or `redis.asyncio`, and
+    derive from the abstract store of the same kind.
+    """
+
+    client_module: t.ClassVar[types.ModuleType]
+    _retry_attempts: int
+
     def __init__(
         self,
         url: str = DEFAULT_REDIS_URL,
         timeout: float = DEFAULT_TIMEOUT,
         retry_attempts: int = DEFAULT_RETRY_ATTEMPTS,
+        cache_max_entries: t.Optional[int] = DEFAULT_MAX_ENTRIES,
+        cache_max_bytes: t.Optional[int] = None,
+        cache_sweep_interval: t.Optional[float] = DEFAULT_SWEEP_INTERVAL,
+        connect_timeout: t.Optional[float] = None,
+        max_connections: t.Optional[int] = None,
+        pool_timeout: t.Optional[float] = None,
+        socket_keepalive: bool = False,
+        health_check_interval: float = 0,
+        breaker_failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        breaker_reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        breaker_slow_call_threshold: t.Optional[float] = None,
+        tracked_prefixes: t.Sequence[str] = (),
+        tracking_timeout: float = DEFAULT_TRACKING_TIMEOUT,
+        tracking_fallback_timeout: float = DEFAULT_FALLBACK_TIMEOUT,
+        tracking_max_entries: t.Optional[int] = DEFAULT_MAX_ENTRIES,
     ):
-        super(RedisStore, self).__init__(timeout, retry_attempts)
-        self._cache = {}
-        self._cache_expires = {}
-
-        self._url: ParseResult = urlparse(url)
-        self._redis = redis.Redis(
-            host=self._url.hostname,
-            port=self._url.port,
-            username=self._url.username,
-            password=self._url.password,
-            socket_timeout=timeout,
-            retry=Retry(ExponentialBackoff(), retries=self._retry_attempts),
+        super(BaseRedisStore, self).__init__(timeout, retry_attempts)
+        self._cache = LocalCache(cache_max_entries, cache_max_bytes)
+        if cache_sweep_interval:
+            self._cache.start_sweeper(cache_sweep_interval)
+        self._breaker = CircuitBreaker(
+            breaker_failure_threshold,
+            breaker_reset_timeout,
+            breaker_slow_call_threshold,
+            name="redis",
+        )
+        # values of the tracked keys read by `get` are cached locally
+        self._tracking = make_tracking_cache(
+            url,
+            tracked_prefixes,
+            tracking_timeout,
+            tracking_fallback_timeout,
+            tracking_max_entries,
+            cache_sweep_interval,
+            timeout,
+            connect_timeout,
+            socket_keepalive,
+        )
+
+        client = self.client_module
+        retry = client.retry.Retry(
+            ExponentialBackoff(), retries=self._retry_attempts
+        )
+        self._redis = client.Redis(
+            connection_pool=make_connection_pool(
+                client,
+                url,
+                timeout=timeout,
+                connect_timeout=connect_timeout,
+                max_connections=max_connections,
+                pool_timeout=pool_timeout,
+                socket_keepalive=socket_keepalive,
+                health_check_interval=health_check_interval,
+                retry=retry,
+            ),
+            retry=retry,
         )
 
     @property
     def redis(self):
         return self._redis
 
-    def get(self, key: str) -> t.Any:
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    @property
+    def tracking(self) -> t.Optional[TrackingCache]:
+        return self._tracking
+
+
+class RedisStore(BaseRedisStore, AbstractStore):
+    client_module = redis
+
+    def _call(self, func: t.Callable, *args, **kwargs) -> t.Any:
+        # perform a redis call guarded by the circuit breaker
+        if not self._breaker.allow():
+            raise StoreConnectionError("circuit breaker is open")
+        started = time.monotonic()
         try:
-            return self._redis.get(key)
-        except RedisConnectionError:
-            raise StoreConnectionError
-        except RedisError:
-            raise StoreError
+            result = func(*args, **kwargs)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            if is_pool_exhausted(e):
+                # back-pressure of the local pool, redis may be healthy
+                self._breaker.release()
+                observe_error(func, "pool")
+                raise_store_error(e)
+            self._breaker.record_failure()
+            observe_error(func, "connection")
+            raise_store_error(e)
+        except RedisError as e:
+            observe_error(func, "error")
+            # redis has replied, so the connection itself is fine
+            self._breaker.record_success()
+            raise_store_error(e)
+        except Exception:
+            # an unexpected error must not keep the probe slot taken
+            self._breaker.record_failure()
+            observe_error(func, "unexpected")
+            raise
+        except BaseException:
+            self._breaker.release()
+            raise
+        duration = time.monotonic() - started
+        self._breaker.record_success(duration)
+        metrics.store_latency.labels(command_name(func)).observe(duration)
+        return result
+
+    def get(self, key: str) -> t.Any:
+        if self._tracking is not None and self._tracking.tracks(key):
+            return self.get_many([key])[0]
+        return self._call(self._redis.get, key)
+
+    def get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        tracking = self._tracking
+        if tracking is None:
+            return self._get_many(keys)
+        values = tracking.get_many(keys)
+        missed = [key for key, v in zip(keys, values) if v is MISSING]
+        if not missed:
+            return values
+        epoch = tracking.epoch
+        fetched = dict(zip(missed, self._get_many(missed)))
+        tracking.set_many(fetched, epoch)
+        return merge_tracked(keys, values, fetched)
+
+    def _get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        values = []
+        for chunk in chunked(keys):
+            values.extend(self._call(self._redis.mget, chunk))
+        return values
 
     def set(self, key: str, value: t.Any) -> None:
         try:
-            self._redis.set(key, value)
-        except RedisConnectionError:
-            raise StoreConnectionError
-        except RedisError:
-            raise StoreError
+            self._call(self._redis.set, key, value)
+        finally:
+            # do not wait for the invalidation to read own writes
+            if self._tracking is not None:
+                self._tracking.invalidate([key])
+
+    def set_many(self, mapping: t.Mapping[str, t.Any]) -> None:
+        try:
+            for chunk in chunked(list(mapping.items())):
+                self._call(self._redis.mset, dict(chunk))
+        finally:
+            if self._tracking is not None:
+                self._tracking.invalidate(mapping)
+
+    @property
+    def cache(self) -> LocalCache:
+        return self._cache
 
     def cache_get(self, key: str) -> t.Any:
-        # remove from cache if expired
-        if key in self._cache and time.time() > self._cache_expires[key]:
-            self._cache.pop(key)
-            self._cache_expires.pop(key)
-
-        if key in self._cache:
-            return self._cache[key]
-        else:
-            try:
-                return self._redis.get(key)
-            except RedisError:
-                return None
+        value = self._cache.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        return self._fetch_shared([key])[0]
+
+    def cache_get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        values = self._cache.get_many(keys, MISSING)
+        missed = [key for key, v in zip(keys, values) if v is MISSING]
+        fetched = dict(zip(missed, self._fetch_shared(missed)))
+        return [
+            fetched.get(key) if v is MISSING else v
+            for key, v in zip(keys, values)
+        ]
+
+    def _fetch_shared(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        # fetch values missed in the local cache from Redis, errors are
+        # treated as cache misses
+        values = []
+        try:
+            for chunk in chunked(keys):
+                pipe = self._redis.pipeline(transaction=False)
+                queue_shared_get(pipe, chunk)
+                replies = self._call(pipe.execute)
+                values.extend(
+                    merge_shared_replies(self._cache, chunk, replies)
+                )
+        except StoreError:
+            return [None] * len(keys)
+        return values
 
     def cache_set(
         self, key: str, value: t.Any, timeout: float = DEFAULT_CACHE_TIMEOUT
     ) -> None:
-        self._cache[key] = value
-        self._cache_expires[key] = time.time() + timeout
+        self.cache_set_many({key: value}, timeout)
+
+    def cache_set_many(
+        self,
+        mapping: t.Mapping[str, t.Any],
+        timeout: float = DEFAULT_CACHE_TIMEOUT,
+    ) -> None:
+        self._cache.set_many(mapping, timeout)
+        if timeout <= 0:
+            return
+        try:
+            for chunk in chunked(list(mapping.items())):
+                pipe = self._redis.pipeline(transaction=False)
+                queue_shared_set(pipe, chunk, timeout)
+                self._call(pipe.execute)
+        except StoreError:
+            # the shared cache is best-effort, local one is already updated
+            pass
+
+    def make_pipeline(self, transaction: bool = False) -> StorePipeline:
+        return RedisStorePipeline(self, self._redis.pipeline(transaction))
+
+    def close(self) -> None:
+        if self._tracking is not None:
+            self._tracking.stop()
+
+
+class RedisStorePipeline(StorePipeline):
+    """Commands sent to Redis in one round-trip, optionally in MULTI/EXEC"""
+
+    _store: RedisStore
+
+    def __init__(self, store: RedisStore, pipe: redis.client.Pipeline):
+        super(RedisStorePipeline, self).__init__(store)
+        self._pipe = pipe
+
+    def __len__(self) -> int:
+        return len(self._pipe)
+
+    def get(self, key: str) -> StorePipeline:
+        self._pipe.get(key)
+        return self
+
+    def set(self, key: str, value: t.Any) -> StorePipeline:
+        self._pipe.set(key, value)
+        return self
+
+    def execute(self) -> t.List[t.Any]:
+        self.results = self._store._call(self._pipe.execute)
+        return self.results
+
+
+class AsyncRedisStore(BaseRedisStore, AbstractAsyncStore):
+    """Redis store using the redis-py asyncio client.
+
+    Instances must be created and used within the same running event loop.
+    """
+
+    client_module = redis.asyncio
+
+    async def _call(self, func: t.Callable, *args, **kwargs) -> t.Any:
+        if not self._breaker.allow():
+            raise StoreConnectionError("circuit breaker is open")
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            if is_pool_exhausted(e):
+                # back-pressure of the local pool, redis may be healthy
+                self._breaker.release()
+                observe_error(func, "pool")
+                raise_store_error(e)
+            self._breaker.record_failure()
+            observe_error(func, "connection")
+            raise_store_error(e)
+        except RedisError as e:
+            observe_error(func, "error")
+            self._breaker.record_success()
+            raise_store_error(e)
+        except Exception:
+            self._breaker.record_failure()
+            observe_error(func, "unexpected")
+            raise
+        except BaseException:
+            # e.g. the task is cancelled
+            self._breaker.release()
+            raise
+        duration = time.monotonic() - started
+        self._breaker.record_success(duration)
+        metrics.store_latency.labels(command_name(func)).observe(duration)
+        return result
+
+    async def get(self, key: str) -> t.Any:
+        if self._tracking is not None and self._tracking.tracks(key):
+            return (await self.get_many([key]))[0]
+        return await self._call(self._redis.get, key)
+
+    async def get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        tracking = self._tracking
+        if tracking is None:
+            return await self._get_many(keys)
+        values = tracking.get_many(keys)
+        missed = [key for key, v in zip(keys, values) if v is MISSING]
+        if not missed:
+            return values
+        epoch = tracking.epoch
+        fetched = dict(zip(missed, await self._get_many(missed)))
+        tracking.set_many(fetched, epoch)
+        return merge_tracked(keys, values, fetched)
+
+    async def _get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        values = []
+        for chunk in chunked(keys):
+            values.extend(await self._call(self._redis.mget, chunk))
+        return values
+
+    async def set(self, key: str, value: t.Any) -> None:
+        try:
+            await self._call(self._redis.set, key, value)
+        finally:
+            if self._tracking is not None:
+                self._tracking.invalidate([key])
+
+    async def set_many(self, mapping: t.Mapping[str, t.Any]) -> None:
+        try:
+            for chunk in chunked(list(mapping.items())):
+                await self._call(self._redis.mset, dict(chunk))
+        finally:
+            if self._tracking is not None:
+                self._tracking.invalidate(mapping)
+
+    @property
+    def cache(self) -> LocalCache:
+        return self._cache
+
+    async def cache_get(self, key: str) -> t.Any:
+        value = self._cache.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        return (await self._fetch_shared([key]))[0]
+
+    async def cache_get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        values = self._cache.get_many(keys, MISSING)
+        missed = [key for key, v in zip(keys, values) if v is MISSING]
+        fetched = dict(zip(missed, await self._fetch_shared(missed)))
+        return [
+            fetched.get(key) if v is MISSING else v
+            for key, v in zip(keys, values)
+        ]
+
+    async def _fetch_shared(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        values = []
+        try:
+            for chunk in chunked(keys):
+                pipe = self._redis.pipeline(transaction=False)
+                queue_shared_get(pipe, chunk)
+                replies = await self._call(pipe.execute)
+                values.extend(
+                    merge_shared_replies(self._cache, chunk, replies)
+                )
+        except StoreError:
+            return [None] * len(keys)
+        return values
+
+    async def cache_set(
+        self, key: str, value: t.Any, timeout: float = DEFAULT_CACHE_TIMEOUT
+    ) -> None:
+        await self.cache_set_many({key: value}, timeout)
+
+    async def cache_set_many(
+        self,
+        mapping: t.Mapping[str, t.Any],
+        timeout: float = DEFAULT_CACHE_TIMEOUT,
+    ) -> None:
+        self._cache.set_many(mapping, timeout)
+        if timeout <= 0:
+            return
+        try:
+            for chunk in chunked(list(mapping.items())):
+                pipe = self._redis.pipeline(transaction=False)
+                queue_shared_set(pipe, chunk, timeout)
+                await self._call(pipe.execute)
+        except StoreError:
+            pass
+
+    async def close(self) -> None:
+        if self._tracking is not None:
+            # joining the listener takes up to a poll interval
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._tracking.stop
+            )
+        await self._redis.aclose()
@@ -0,0 +1,108 @@
+"""Per-request phase timing and sampled profiling.
+
+`PhaseTimer` attributes the time passed since the previous mark to the
+named phase, so a request is split into consecutive phases with a single
+clock read per mark. The phases are sent to the client in the
+`Server-Timing` header and written to the access log.
+"""
+from __future__ import annotations
+
+import cProfile
+import itertools
+import logging
+import os
+import re
+import time
+import typing as t
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+# characters of request IDs kept in the names of profile dumps
+_unsafe_chars = re.compile(r"[^A-Za-z0-9_-]")
+MAX_REQUEST_ID_SIZE: int = 64
+
+
+class PhaseTimer:
+    __slots__ = ("phases", "started", "_last")
+
+    def __init__(self):
+        self.phases: t.Dict[str, float] = {}
+        self.started = self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """Attribute the time since the previous mark to `phase`"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def server_timing(self) -> str:
+        """Format the phases as the value of the `Server-Timing` header"""
+        metrics = [f"{k};dur={v * 1e3:.3f}" for k, v in self.phases.items()]
+        metrics.append(f"total;dur={self.total * 1e3:.3f}")
+        return ", ".join(metrics)
+
+
+class NullTimer:
+    """Timer of requests performed outside of the HTTP servers"""
+
+    __slots__ = ()
+
+    def mark(self, phase: str) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Profiler:
+    """Runs cProfile on every `every`-th request.
+
+    Stats are dumped into `directory` as `<uuid>-<request id>.prof`, to be
+    inspected with `pstats` or snakeviz. Request IDs come from clients, so
+    only letters, digits, `_` and `-` of them are kept in the names. A
+    request which starts while another one is being profiled by the
+    interpreter-wide profiler (Python 3.12+) is skipped.
+    """
+
+    def __init__(self, every: int, directory: str = "."):
+        if every < 1:
+            raise ValueError("every must be positive")
+        self.every = every
+        self.directory = directory
+        self._counter = itertools.count(1)
+
+    def start(self) -> t.Optional[cProfile.Profile]:
+        """Start profiling if the request is sampled"""
+        if next(self._counter) % self.every:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        return profile
+
+    def stop(
+        self, profile: t.Optional[cProfile.Profile], request_id: str
+    ) -> None:
+        if profile is None:
+            return
+        profile.disable()
+        try:
+            profile.dump_stats(self.dump_path(request_id))
+        except (OSError, ValueError) as e:
+            _logger.warning("Cannot dump profile: %s", e)
+
+    def dump_path(self, request_id: str) -> str:
+        safe_id = _unsafe_chars.sub("", request_id)[:MAX_REQUEST_ID_SIZE]
+        name = f"{uuid.uuid4().hex}-{safe_id}" if safe_id else uuid.uuid4().hex
+        directory = os.path.realpath(self.directory)
+        path = os.path.realpath(os.path.join(directory, f"{name}.prof"))
+        if os.path.dirname(path) != directory:
+            raise ValueError(f"profile dump {path} is out of {directory}")
+        return path
@@ -0,0 +1,206 @@
+"""Local cache of Redis values kept coherent by server-assisted invalidation.
+
+Values of the keys with the tracked prefixes are cached in the process.
+A listener thread holds a connection with `CLIENT TRACKING` enabled in the
+broadcasting mode for the prefixes and redirected to itself, subscribed to
+the `__redis__:invalidate` channel. Redis publishes there the names of the
+tracked keys modified by any client, and they are dropped from the cache.
+
+Entries also expire after `timeout`. While invalidations are unavailable
+(Redis older than 6.0, or the listener is disconnected) entries expire
+after `fallback_timeout` instead, which bounds the staleness. The cache is
+flushed whenever the listener connects or disconnects, as invalidations
+could be missed meanwhile.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import typing as t
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError, ResponseError
+
+from otus_scoring_api.cache import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_SWEEP_INTERVAL,
+    LocalCache,
+    MISSING,
+)
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TRACKING_TIMEOUT: float = 300.0
+DEFAULT_FALLBACK_TIMEOUT: float = 5.0
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+# seconds between checks of the stop flag while waiting for messages
+POLL_INTERVAL: float = 1.0
+# an idle listener pings Redis after this many seconds and reconnects if
+# there is no reply by the next ping
+PING_INTERVAL: float = 10.0
+RECONNECT_DELAY: float = 0.5
+MAX_RECONNECT_DELAY: float = 30.0
+
+
+def decode_key(key: t.Union[bytes, str]) -> str:
+    if isinstance(key, bytes):
+        return key.decode("utf-8", "replace")
+    return key
+
+
+class TrackingCache:
+    """Read-through cache of the keys starting with `prefixes`.
+
+    Readers take `epoch` before fetching missed values and pass it to
+    `set_many`: values fetched while an invalidation arrived are not
+    cached, since they may predate the modification.
+    """
+
+    def __init__(
+        self,
+        prefixes: t.Sequence[str],
+        connect: t.Optional[t.Callable[[], t.Any]] = None,
+        timeout: float = DEFAULT_TRACKING_TIMEOUT,
+        fallback_timeout: float = DEFAULT_FALLBACK_TIMEOUT,
+        max_entries: t.Optional[int] = DEFAULT_MAX_ENTRIES,
+        sweep_interval: t.Optional[float] = DEFAULT_SWEEP_INTERVAL,
+    ):
+        self.prefixes = tuple(prefixes)
+        self.timeout = timeout
+        self.fallback_timeout = fallback_timeout
+        self.active = False
+        self.invalidations = 0
+        self._connect = connect
+        self._cache = LocalCache(max_entries)
+        if sweep_interval:
+            self._cache.start_sweeper(sweep_interval)
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listener: t.Optional[threading.Thread] = None
+
+    @property
+    def cache(self) -> LocalCache:
+        return self._cache
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def tracks(self, key: t.Any) -> bool:
+        return type(key) is str and key.startswith(self.prefixes)
+
+    def get_many(self, keys: t.Sequence[t.Any]) -> t.List[t.Any]:
+        """Return cached values of `keys`, `MISSING` for the missed ones"""
+        return self._cache.get_many(keys, MISSING)
+
+    def set_many(self, mapping: t.Mapping[t.Any, t.Any], epoch: int) -> None:
+        """Cache values of the tracked keys fetched since `epoch`"""
+        items = {k: v for k, v in mapping.items() if self.tracks(k)}
+        if not items:
+            return
+        timeout = self.timeout if self.active else self.fallback_timeout
+        with self._lock:
+            if epoch == self._epoch:
+                self._cache.set_many(items, timeout)
+
+    def invalidate(self, keys: t.Optional[t.Iterable[t.Any]]) -> None:
+        """Drop `keys` from the cache, all the entries if `keys` is None"""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            if keys is None:
+                self._cache.clear()
+                return
+            for key in keys:
+                self._cache.delete(decode_key(key))
+
+    def stats(self) -> t.Dict[str, int]:
+        stats = self._cache.stats()
+        stats.update(active=int(self.active), invalidations=self.invalidations)
+        return stats
+
+    def start(self) -> None:
+        """Listen to invalidations in a daemon thread"""
+        if self._connect is None or self._listener is not None:
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(
+            target=self.listen, name="redis-tracking", daemon=True
+        )
+        self._listener.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+        self._cache.stop_sweeper()
+
+    def listen(self) -> None:
+        """Receive invalidations until stopped, reconnecting on errors"""
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            conn = self._connect()
+            try:
+                self._subscribe(conn)
+                delay = RECONNECT_DELAY
+                self._receive(conn)
+            except ResponseError as e:
+                _logger.warning(
+                    "Redis client tracking is unavailable, cached values "
+                    "expire in %s s: %s",
+                    self.fallback_timeout,
+                    e,
+                )
+                return
+            except (RedisError, OSError) as e:
+                _logger.warning(
+                    "Invalidations of cached values are not received, "
+                    "reconnecting in %s s: %s",
+                    delay,
+                    e,
+                )
+            finally:
+                self._set_active(False)
+                conn.disconnect()
+            self._stop.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _subscribe(self, conn: t.Any) -> None:
+        conn.send_command("CLIENT", "ID")
+        client_id = conn.read_response()
+        args: t.List[t.Any] = ["CLIENT", "TRACKING", "ON"]
+        args += ["REDIRECT", client_id, "BCAST"]
+        for prefix in self.prefixes:
+            args += ["PREFIX", prefix]
+        conn.send_command(*args)
+        conn.read_response()
+        conn.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+        conn.read_response()
+        self._set_active(True)
+
+    def _receive(self, conn: t.Any) -> None:
+        last_read = time.monotonic()
+        pinged = False
+        while not self._stop.is_set():
+            if not conn.can_read(timeout=POLL_INTERVAL):
+                if time.monotonic() - last_read < PING_INTERVAL:
+                    continue
+                if pinged:
+                    raise RedisConnectionError("no reply to PING")
+                conn.send_command("PING")
+                last_read, pinged = time.monotonic(), True
+                continue
+            message = conn.read_response()
+            last_read, pinged = time.monotonic(), False
+            # [b"message", channel, keys], keys are None on FLUSHALL
+            if message and message[0] == b"message":
+                self.invalidate(message[2])
+
+    def _set_active(self, active: bool) -> None:
+        with self._lock:
+            self.active = active
+            self._epoch += 1
+            self._cache.clear()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 import typing as t
 
 import pytest
@@ -7,9 +8,13 @@ import redis
 import redis.exceptions
 import requests
 
+from otus_scoring_api.api import MainHTTPHandler, ThreadPoolHTTPServer
+
 if t.TYPE_CHECKING:
     from pytest_docker.plugin import Services
 
+    from otus_scoring_api.store import AbstractStore
+
 
 @pytest.fixture(scope="session")
 def docker_compose_file(pytestconfig: pytest.Config):
@@ -59,3 +64,38 @@ def redis_instance(docker_ip: str, docker_services: Services) -> redis.Redis:
 @pytest.fixture
 def request_headers() -> dict:
     return {"Content-Type": "application/json"}
+
+
+@pytest.fixture
+def run_server(
+    mock_store: AbstractStore,
+) -> t.Iterator[t.Callable[..., str]]:
+    servers = []
+
+    def _func(
+        threads: int = 4,
+        store: t.Optional[AbstractStore] = None,
+        handler_attrs: t.Optional[t.Dict[str, t.Any]] = None,
+        **handler_options,
+    ) -> str:
+        handler_class = type(
+            "TestHTTPHandler",
+            (MainHTTPHandler,),
+            {
+                "store": store if store is not None else mock_store,
+                "handler_options": dict(
+                    MainHTTPHandler.handler_options, **handler_options
+                ),
+                **(handler_attrs or {}),
+            },
+        )
+        server = ThreadPoolHTTPServer(("127.0.0.1", 0), handler_class, threads)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/method"
+
+    yield _func
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import typing as t
 from datetime import datetime
@@ -7,10 +8,10 @@ from datetime import datetime
 import pytest
 
 from otus_scoring_api.constants import ADMIN_LOGIN, ADMIN_SALT, SALT
-from otus_scoring_api.handlers import method_handler
+from otus_scoring_api.handlers import async_method_handler, method_handler
 
 if t.TYPE_CHECKING:
-    from otus_scoring_api.store import AbstractStore
+    from otus_scoring_api.store import AbstractAsyncStore, AbstractStore
 
 
 @pytest.fixture
@@ -34,6 +35,29 @@ def get_response(
     return _func
 
 
+@pytest.fixture
+def get_async_response(
+    mock_async_store: AbstractAsyncStore,
+) -> t.Callable[..., t.Tuple[t.Union[t.Dict, str, None], t.Optional[int]]]:
+    def _func(
+        req: t.Dict,
+        headers: t.Optional[t.Dict] = None,
+        context: t.Optional[t.Dict] = None,
+    ) -> t.Tuple[t.Union[t.Dict, str, None], t.Optional[int]]:
+        return asyncio.run(
+            async_method_handler(
+                request={
+                    "body": req,
+                    "headers": headers if headers is not None else {},
+                },
+                ctx=context if context is not None else {},
+                store=mock_async_store,
+            )
+        )
+
+    return _func
+
+
 @pytest.fixture
 def set_valid_auth() -> t.Callable[[t.Dict], None]:
     def _func(req_body: t.Dict) -> None:
@@ -1,11 +1,31 @@
 import json
 import random
+import time
 import typing as t
 
 import pytest
 import redis
 
-from otus_scoring_api.store import AbstractStore, RedisStore
+from otus_scoring_api.store import (
+    AbstractAsyncStore,
+    AbstractStore,
+    AsyncRedisStore,
+    RedisStore,
+)
+
+INTERESTS = [
+    "cars",
+    "pets",
+    "travel",
+    "hi-tech",
+    "sport",
+    "music",
+    "books",
+    "tv",
+    "cinema",
+    "geek",
+    "otus",
+]
 
 
 @pytest.fixture
@@ -14,20 +34,7 @@ def mock_store() -> AbstractStore:
         connected = True
 
         def get(self, key: str) -> t.Any:
-            interests = [
-                "cars",
-                "pets",
-                "travel",
-                "hi-tech",
-                "sport",
-                "music",
-                "books",
-                "tv",
-                "cinema",
-                "geek",
-                "otus",
-            ]
-            return json.dumps(random.sample(interests, 2))
+            return json.dumps(random.sample(INTERESTS, 2))
 
         def set(self, key: str, value: t.Any) -> None:
             pass
@@ -41,29 +48,128 @@ def mock_store() -> AbstractStore:
     return MockStore()
 
 
+@pytest.fixture
+def mock_async_store() -> AbstractAsyncStore:
+    class MockAsyncStore(AbstractAsyncStore):
+        async def get(self, key: str) -> t.Any:
+            return json.dumps(random.sample(INTERESTS, 2))
+
+        async def set(self, key: str, value: t.Any) -> None:
+            pass
+
+        async def cache_get(self, key: str) -> t.Any:
+            pass
+
+        async def cache_set(
+            self, key: str, value: t.Any, timeout: int
+        ) -> None:
+            pass
+
+    return MockAsyncStore()
+
+
 @pytest.fixture(autouse=True)
 def monkeypatch_redis(monkeypatch):
     class MockRedis:
         connected = True
 
         def __init__(self, *args, **kwargs):
+            self.kwargs = kwargs
             self.data = {}
+            self.expires = {}
 
-        def get(self, key, *args, **kwargs):
+        def _check(self, key=None):
             if not self.connected:
                 raise redis.ConnectionError
+            if key in self.expires and self.expires[key] <= time.monotonic():
+                self.data.pop(key)
+                self.expires.pop(key)
+
+        def get(self, key, *args, **kwargs):
+            self._check(key)
             if key in self.data:
                 return self.data[key]
             return None
 
-        def set(self, key, value, *args, **kwargs):
-            if not self.connected:
-                raise redis.ConnectionError
+        def set(self, key, value, *args, px=None, **kwargs):
+            self._check()
             self.data[key] = value
+            self.expires.pop(key, None)
+            if px is not None:
+                self.expires[key] = time.monotonic() + px / 1000
+
+        def pttl(self, key):
+            self._check(key)
+            if key not in self.data:
+                return -2
+            if key not in self.expires:
+                return -1
+            return int((self.expires[key] - time.monotonic()) * 1000)
+
+        def mget(self, keys, *args):
+            return [MockRedis.get(self, key) for key in keys]
+
+        def mset(self, mapping):
+            for key, value in mapping.items():
+                MockRedis.set(self, key, value)
+
+        def pipeline(self, transaction=True):
+            return MockPipeline(self)
+
+    class MockPipeline:
+        def __init__(self, client):
+            self.client = client
+            self.commands = []
+
+        def __len__(self):
+            return len(self.commands)
+
+        def __getattr__(self, name):
+            def _queue(*args, **kwargs):
+                self.commands.append((name, args, kwargs))
+                return self
+
+            return _queue
+
+        def execute(self):
+            commands, self.commands = self.commands, []
+            return [
+                getattr(MockRedis, name)(self.client, *args, **kwargs)
+                for name, args, kwargs in commands
+            ]
+
+    class MockAsyncPipeline(MockPipeline):
+        async def execute(self):
+            return MockPipeline.execute(self)
+
+    class MockAsyncRedis(MockRedis):
+        async def get(self, key, *args, **kwargs):
+            return MockRedis.get(self, key, *args, **kwargs)
+
+        async def set(self, key, value, *args, **kwargs):
+            MockRedis.set(self, key, value, *args, **kwargs)
+
+        async def mget(self, keys, *args):
+            return MockRedis.mget(self, keys, *args)
+
+        async def mset(self, mapping):
+            MockRedis.mset(self, mapping)
+
+        def pipeline(self, transaction=True):
+            return MockAsyncPipeline(self)
+
+        async def aclose(self):
+            pass
 
     monkeypatch.setattr("redis.Redis", MockRedis)
+    monkeypatch.setattr("redis.asyncio.Redis", MockAsyncRedis)
 
 
 @pytest.fixture
 def store_with_mocked_redis() -> RedisStore:
     return RedisStore()
+
+
+@pytest.fixture
+def async_store_with_mocked_redis() -> AsyncRedisStore:
+    return AsyncRedisStore()
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import typing as t
+
+import pytest
+
+from otus_scoring_api.aio import AsyncHTTPServer
+from otus_scoring_api.constants import (
+    BAD_REQUEST,
+    INTERNAL_ERROR,
+    INVALID_REQUEST,
+    NOT_FOUND,
+    OK,
+)
+
+if t.TYPE_CHECKING:
+    from otus_scoring_api.store import AbstractAsyncStore
+
+
+def dechunk(payload: bytes) -> bytes:
+    body = b""
+    while True:
+        size, _, payload = payload.partition(b"\r\n")
+        end = int(size, 16)
+        if not end:
+            return body
+        body, payload = body + payload[:end], payload[end:]
+        payload = payload[2:]
+
+
+def post_raw(
+    store: AbstractAsyncStore,
+    path: str,
+    body: bytes,
+    version: str = "HTTP/1.1",
+    **server_options,
+) -> t.Tuple[bytes, bytes]:
+    """Send a request, return the head and body of the response"""
+
+    async def scenario():
+        server = await AsyncHTTPServer(store, **server_options).start(
+            "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                f"POST {path} {version}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+        head, _, payload = data.partition(b"\r\n\r\n")
+        return head, payload
+
+    return asyncio.run(scenario())
+
+
+def post(
+    store: AbstractAsyncStore, path: str, body: bytes, **server_options
+) -> t.Tuple:
+    head, payload = post_raw(store, path, body, **server_options)
+    if b"Transfer-Encoding: chunked" in head:
+        payload = dechunk(payload)
+    return int(head.split(b" ")[1]), json.loads(payload)
+
+
+def test_async_server_ok(
+    mock_async_store: AbstractAsyncStore, set_valid_auth: t.Callable
+):
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1, 2, 3]},
+    }
+    set_valid_auth(req_body)
+    code, body = post(
+        mock_async_store, "/method/", json.dumps(req_body).encode()
+    )
+    assert code == OK
+    assert body["code"] == OK
+    assert len(body["response"]) == 3
+
+
+def test_async_server_bad_request(mock_async_store: AbstractAsyncStore):
+    code, body = post(mock_async_store, "/method/", b"{not a json")
+    assert code == BAD_REQUEST
+    assert body == {"error": "Bad Request", "code": BAD_REQUEST}
+
+
+@pytest.mark.parametrize("path", ["/batch", "/method"])
+def test_async_server_empty_request(
+    mock_async_store: AbstractAsyncStore, path: str
+):
+    code, body = post(mock_async_store, path, b"[]")
+    assert code == INVALID_REQUEST
+    assert body["code"] == INVALID_REQUEST
+
+
+def test_async_server_not_found(mock_async_store: AbstractAsyncStore):
+    code, body = post(mock_async_store, "/unknown/", b'{"a": 1}')
+    assert code == NOT_FOUND
+    assert body["code"] == NOT_FOUND
+
+
+def test_async_server_stream(
+    monkeypatch, mock_async_store: AbstractAsyncStore, set_valid_auth
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1, 2, 3, 4, 5]},
+    }
+    set_valid_auth(req_body)
+    code, body = post(
+        mock_async_store,
+        "/method/",
+        json.dumps(req_body).encode(),
+        stream_threshold=3,
+    )
+    assert code == OK
+    assert body["code"] == OK
+    assert list(body["response"]) == ["1", "2", "3", "4", "5"]
+
+
+def test_async_server_stream_http10(
+    monkeypatch, mock_async_store: AbstractAsyncStore, set_valid_auth
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1, 2, 3, 4, 5]},
+    }
+    set_valid_auth(req_body)
+    head, payload = post_raw(
+        mock_async_store,
+        "/method/",
+        json.dumps(req_body).encode(),
+        "HTTP/1.0",
+        stream_threshold=3,
+    )
+    assert b"Transfer-Encoding" not in head
+    assert b"Content-Length: %d" % len(payload) in head
+    body = json.loads(payload)
+    assert body["code"] == OK
+    assert list(body["response"]) == ["1", "2", "3", "4", "5"]
+
+
+def test_async_server_stream_http10_error(
+    monkeypatch, mock_async_store: AbstractAsyncStore, set_valid_auth
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    calls = []
+    store_get_many = mock_async_store.get_many
+
+    async def get_many(keys):
+        # the first batch is fetched before the response starts
+        calls.append(keys)
+        if len(calls) > 1:
+            raise RuntimeError("unexpected")
+        return await store_get_many(keys)
+
+    monkeypatch.setattr(mock_async_store, "get_many", get_many)
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1, 2, 3, 4, 5]},
+    }
+    set_valid_auth(req_body)
+    code, body = post(
+        mock_async_store,
+        "/method/",
+        json.dumps(req_body).encode(),
+        version="HTTP/1.0",
+        stream_threshold=3,
+    )
+    assert code == body["code"] == INTERNAL_ERROR
+
+
+def test_async_server_keep_alive(mock_async_store: AbstractAsyncStore):
+    async def scenario():
+        server = await AsyncHTTPServer(mock_async_store, max_requests=2).start(
+            "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            # pipelined requests, the server closes after the second one
+            writer.write(
+                b"POST /unknown/ HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}" * 3
+            )
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+        return data
+
+    data = asyncio.run(scenario())
+    assert data.count(b"HTTP/1.1 ") == 2
+    assert b"Connection: keep-alive" in data
+    assert data.count(b"Connection: close") == 1
+
+
+def test_async_server_body_timeout(mock_async_store: AbstractAsyncStore):
+    async def scenario():
+        server = await AsyncHTTPServer(
+            mock_async_store, keepalive_timeout=5, request_timeout=0.2
+        ).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                b"POST /method HTTP/1.1\r\nContent-Length: 10\r\n\r\n{"
+            )
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+        return data
+
+    assert asyncio.run(scenario()) == b""
+
+
+def test_async_server_expect_continue(mock_async_store: AbstractAsyncStore):
+    async def scenario():
+        server = await AsyncHTTPServer(mock_async_store).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                b"POST /unknown HTTP/1.1\r\nContent-Length: 8\r\n"
+                b"Expect: 100-continue\r\nConnection: close\r\n\r\n"
+            )
+            await writer.drain()
+            interim = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 2)
+            writer.write(b'{"a": 1}')
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+        return interim, data
+
+    interim, data = asyncio.run(scenario())
+    assert interim == b"HTTP/1.1 100 Continue\r\n\r\n"
+    assert data.startswith(b"HTTP/1.1 404 ")
+
+
+def test_async_server_metrics(mock_async_store: AbstractAsyncStore):
+    async def scenario():
+        server = await AsyncHTTPServer(mock_async_store).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+        return data.partition(b"\r\n\r\n")
+
+    head, _, payload = asyncio.run(scenario())
+    assert head.startswith(b"HTTP/1.1 200 ")
+    assert b"Content-Type: text/plain" in head
+    assert b"# TYPE scoring_api_method_requests_total counter" in payload
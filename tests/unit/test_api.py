@@ -0,0 +1,327 @@
+import http.client
+import json
+import socket
+import threading
+import time
+import typing as t
+
+import pytest
+import requests
+
+from otus_scoring_api.constants import INTERNAL_ERROR, INVALID_REQUEST, OK
+from otus_scoring_api.store import AbstractStore, StoreError
+
+
+class SlowStore(AbstractStore):
+    delay = 1.0
+
+    def get(self, key: str) -> t.Any:
+        time.sleep(self.delay)
+        return json.dumps(["books"])
+
+    def set(self, key: str, value: t.Any) -> None:
+        pass
+
+    def cache_get(self, key: str) -> t.Any:
+        pass
+
+    def cache_set(self, key: str, value: t.Any, timeout: int) -> None:
+        pass
+
+
+@pytest.fixture
+def score_request(set_valid_auth: t.Callable) -> t.Dict:
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+    }
+    set_valid_auth(req_body)
+    return req_body
+
+
+@pytest.fixture
+def interests_request(set_valid_auth: t.Callable) -> t.Dict:
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1]},
+    }
+    set_valid_auth(req_body)
+    return req_body
+
+
+def test_threaded_server(run_server: t.Callable, score_request: t.Dict):
+    url = run_server(threads=2)
+    resp = requests.post(url, json=score_request)
+    assert resp.status_code == OK
+    assert resp.json()["response"]["score"] == 3.0
+    phases = [
+        m.split(";")[0] for m in resp.headers["Server-Timing"].split(", ")
+    ]
+    assert phases == [
+        "read",
+        "parse",
+        "request",
+        "auth",
+        "arguments",
+        "store",
+        "serialize",
+        "total",
+    ]
+
+
+def test_slow_store_does_not_block_server(
+    run_server: t.Callable, score_request: t.Dict, interests_request: t.Dict
+):
+    url = run_server(threads=2, store=SlowStore())
+    slow = threading.Thread(
+        target=requests.post, args=(url,), kwargs={"json": interests_request}
+    )
+    slow.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    resp = requests.post(url, json=score_request)
+    assert resp.status_code == OK
+    assert time.monotonic() - started < SlowStore.delay / 2
+
+    slow.join()
+
+
+def test_interests_passthrough(
+    run_server: t.Callable, interests_request: t.Dict
+):
+    interests_request["arguments"]["client_ids"] = [1, 2]
+    store = SlowStore()
+    store.delay = 0
+    url = run_server(store=store)
+    resp = requests.post(url, json=interests_request)
+    assert resp.status_code == OK
+    assert resp.content == (
+        b'{"response":{"1":["books"],"2":["books"]},"code":200}'
+    )
+
+
+class BatchStore(SlowStore):
+    delay = 0
+    fail_after: t.Optional[int] = None
+    error: t.Type[Exception] = StoreError
+
+    def __init__(self):
+        self.batches = 0
+
+    def get_many(self, keys: t.Sequence[str]) -> t.List[t.Any]:
+        self.batches += 1
+        if self.fail_after is not None and self.batches > self.fail_after:
+            raise self.error("connection lost")
+        return [json.dumps([key]) for key in keys]
+
+
+def test_interests_stream(
+    monkeypatch, run_server: t.Callable, interests_request: t.Dict
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    interests_request["arguments"]["client_ids"] = [1, 2, 3, 4, 5]
+    store = BatchStore()
+    url = run_server(store=store, stream_threshold=5)
+
+    resp = requests.post(url, json=interests_request)
+    assert resp.status_code == OK
+    assert resp.headers["Transfer-Encoding"] == "chunked"
+    assert resp.json()["response"] == {
+        str(cid): [f"i:{cid}"] for cid in range(1, 6)
+    }
+    assert store.batches == 3
+
+    # under the threshold the response is sent at once
+    interests_request["arguments"]["client_ids"] = [1, 2, 3, 4]
+    resp = requests.post(url, json=interests_request)
+    assert resp.status_code == OK
+    assert "Transfer-Encoding" not in resp.headers
+    assert len(resp.json()["response"]) == 4
+
+
+@pytest.mark.parametrize(
+    "fail_after,code", [(0, INTERNAL_ERROR), (1, None)], ids=str
+)
+def test_interests_stream_error(
+    monkeypatch,
+    run_server: t.Callable,
+    interests_request: t.Dict,
+    fail_after: int,
+    code: t.Optional[int],
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    interests_request["arguments"]["client_ids"] = [1, 2, 3, 4, 5]
+    store = BatchStore()
+    store.fail_after = fail_after
+    url = run_server(store=store, stream_threshold=1)
+
+    if code is not None:
+        resp = requests.post(url, json=interests_request)
+        assert resp.status_code == code
+    else:
+        # the transfer is broken after the first batch
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            requests.post(url, json=interests_request)
+
+
+def post_http10(url: str, body: t.Dict) -> t.Tuple[int, bytes, bytes]:
+    """Send a request over HTTP/1.0, return the code, headers and body"""
+    host, port = url.split("/")[2].split(":")
+    data = json.dumps(body).encode()
+    with socket.create_connection((host, int(port))) as sock:
+        sock.sendall(
+            b"POST /method HTTP/1.0\r\nContent-Length: %d\r\n\r\n%s"
+            % (len(data), data)
+        )
+        response = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), head, payload
+
+
+@pytest.mark.parametrize(
+    "fail_after,error,code",
+    [
+        (None, StoreError, OK),
+        (1, StoreError, INTERNAL_ERROR),
+        (1, RuntimeError, INTERNAL_ERROR),
+    ],
+    ids=str,
+)
+def test_interests_stream_http10(
+    monkeypatch,
+    run_server: t.Callable,
+    interests_request: t.Dict,
+    fail_after: t.Optional[int],
+    error: t.Type[Exception],
+    code: int,
+):
+    monkeypatch.setattr("otus_scoring_api.store.DEFAULT_BATCH_SIZE", 2)
+    interests_request["arguments"]["client_ids"] = [1, 2, 3, 4, 5]
+    store = BatchStore()
+    store.fail_after, store.error = fail_after, error
+    url = run_server(store=store, stream_threshold=1)
+
+    status, head, payload = post_http10(url, interests_request)
+    assert status == code
+    assert b"Transfer-Encoding" not in head
+    assert b"Content-Length: %d" % len(payload) in head
+    body = json.loads(payload)
+    assert body["code"] == code
+    if code == OK:
+        assert list(body["response"]) == ["1", "2", "3", "4", "5"]
+
+
+def test_batch_endpoint(
+    run_server: t.Callable, score_request: t.Dict, interests_request: t.Dict
+):
+    url = run_server(store=BatchStore()).replace("/method", "/batch")
+    resp = requests.post(url, json=[score_request, interests_request])
+    assert resp.status_code == OK
+    assert resp.json() == {
+        "response": [
+            {"response": {"score": 3.0}, "code": OK},
+            {"response": {"1": ["i:1"]}, "code": OK},
+        ],
+        "code": OK,
+    }
+
+
+@pytest.mark.parametrize(
+    "path,body", [("/batch", []), ("/method", []), ("/method", None)]
+)
+def test_empty_request_is_invalid(
+    run_server: t.Callable, path: str, body: t.Any
+):
+    url = run_server().replace("/method", path)
+    resp = requests.post(url, data=json.dumps(body))
+    assert resp.status_code == INVALID_REQUEST
+    assert resp.json()["code"] == INVALID_REQUEST
+
+
+def test_keep_alive(run_server: t.Callable, score_request: t.Dict):
+    url = run_server(handler_attrs={"max_requests": 3})
+    host, port = url.split("/")[2].split(":")
+    body = json.dumps(score_request)
+    conn = http.client.HTTPConnection(host, int(port))
+    sockets, headers = set(), []
+    for _ in range(3):
+        conn.request("POST", "/method", body)
+        sockets.add(id(conn.sock))
+        resp = conn.getresponse()
+        assert resp.status == OK
+        assert json.loads(resp.read())["code"] == OK
+        headers.append(resp.getheader("Connection"))
+    conn.close()
+    assert len(sockets) == 1
+    assert headers == ["keep-alive", "keep-alive", "close"]
+
+
+def test_keep_alive_saturated_pool(
+    run_server: t.Callable, score_request: t.Dict
+):
+    url = run_server(threads=2, handler_attrs={"keepalive_timeout": 1.0})
+    host, port = url.split("/")[2].split(":")
+    body = json.dumps(score_request)
+    idle = http.client.HTTPConnection(host, int(port))
+    idle.request("POST", "/method", body)
+    resp = idle.getresponse()
+    resp.read()
+    assert resp.getheader("Connection") == "keep-alive"
+    assert resp.getheader("Keep-Alive").startswith("timeout=1,")
+    # the idle connection holds a worker, the last one is not kept
+    conn = http.client.HTTPConnection(host, int(port))
+    conn.request("POST", "/method", body)
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.getheader("Connection") == "close"
+    conn.close()
+    # the idle connection is closed after the keep-alive timeout
+    started = time.monotonic()
+    assert idle.sock.recv(1) == b""
+    assert time.monotonic() - started < 3
+    idle.close()
+
+
+def test_pipelined_requests(run_server: t.Callable, score_request: t.Dict):
+    url = run_server()
+    host, port = url.split("/")[2].split(":")
+    body = json.dumps(score_request).encode()
+    request = b"POST /method HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (
+        len(body),
+        body,
+    )
+    with socket.create_connection((host, int(port))) as sock:
+        sock.sendall(request * 2 + request.replace(b"HTTP/1.1", b"HTTP/1.0"))
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    assert data.count(b"HTTP/1.1 200 OK") == 3
+    assert data.count(b'"score":3.0') == 3
+
+
+def test_metrics_endpoint(run_server: t.Callable, score_request: t.Dict):
+    url = run_server()
+    requests.post(url, json=score_request)
+    resp = requests.get(url.replace("/method", "/metrics"))
+    assert resp.status_code == OK
+    assert resp.headers["Content-Type"].startswith("text/plain")
+    assert (
+        'scoring_api_method_requests_total{method="online_score",code="200"}'
+        in resp.text
+    )
+    assert "scoring_api_score_cache_total" in resp.text
+
+    assert requests.get(url).status_code == 404
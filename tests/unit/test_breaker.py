@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from otus_scoring_api.breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_threshold=0.5)
+    breaker.record_success(1.0)
+    breaker.record_success(1.0)
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize("probe_ok,state", [(True, CLOSED), (False, OPEN)])
+def test_half_open_probe(probe_ok: bool, state: str):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # only a single probe call is let through
+    assert not breaker.allow()
+    if probe_ok:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    assert breaker.state == state
+
+
+def test_released_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from otus_scoring_api.cache import entry_size, LocalCache, MISSING
+
+
+def test_set_and_get():
+    cache = LocalCache()
+    cache.set("key", "value", 60)
+    assert cache.get("key") == "value"
+    assert cache.get("unexistent") is None
+    assert cache.get("unexistent", MISSING) is MISSING
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_expired_entry_is_removed():
+    cache = LocalCache()
+    cache.set("key", "value", -1)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert cache.expirations == 1
+
+
+def test_lru_eviction_by_entries():
+    cache = LocalCache(max_entries=2)
+    cache.set("k1", 1, 60)
+    cache.set("k2", 2, 60)
+    assert cache.get("k1") == 1  # k2 is the least recently used now
+    cache.set("k3", 3, 60)
+    assert cache.get_many(["k1", "k2", "k3"]) == [1, None, 3]
+    assert cache.evictions == 1
+
+
+def test_eviction_by_bytes():
+    max_bytes = entry_size("k1", "value") * 2
+    cache = LocalCache(max_entries=None, max_bytes=max_bytes)
+    cache.set_many({"k1": "value", "k2": "value", "k3": "value"}, 60)
+    assert len(cache) == 2
+    assert cache.size <= max_bytes
+    assert "k1" not in cache
+
+
+def test_sweep():
+    cache = LocalCache()
+    cache.set_many({"k1": 1, "k2": 2}, -1)
+    cache.set("k3", 3, 60)
+    assert cache.sweep() == 2
+    assert len(cache) == 1
+    assert cache.size == entry_size("k3", 3)
+
+
+def test_sweeper_thread():
+    cache = LocalCache()
+    cache.set("key", "value", 0.01)
+    cache.start_sweeper(0.01)
+    try:
+        deadline = time.monotonic() + 2
+        while len(cache) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(cache) == 0
+    finally:
+        cache.stop_sweeper()
+
+
+@pytest.mark.parametrize("kwargs", [{"max_entries": 0}, {"max_bytes": 0}])
+def test_invalid_limits(kwargs: dict):
+    with pytest.raises(ValueError):
+        LocalCache(**kwargs)
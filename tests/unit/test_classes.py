@@ -1,5 +1,6 @@
 import typing as t
 from contextlib import nullcontext as does_not_raise
+from datetime import datetime
 
 import pytest
 
@@ -12,7 +13,10 @@ from otus_scoring_api.classes import (
     DateField,
     EmailField,
     GenderField,
+    is_phone,
+    MethodRequest,
     OnlineScoreRequest,
+    parse_date,
     PhoneField,
     ValidationError,
 )
@@ -112,3 +116,85 @@ def test_init_req(req_class: t.Type, data: t.Dict, expectation):
         req = req_class(**data)
         for k, v in data.items():
             assert getattr(req, k) == v
+
+
+@pytest.mark.parametrize(
+    "req_class,data,error",
+    [
+        (
+            MethodRequest,
+            dict(login="h&f", token="", arguments={}),
+            "The value of the mandatory field 'method' is missing",
+        ),
+        (
+            MethodRequest,
+            dict(login="h&f", token="", arguments={}, method="m", x=1),
+            "Unknown field 'x'",
+        ),
+        (
+            OnlineScoreRequest,
+            dict(gender=5, phone="89175002040"),
+            "gender field must have value 0, 1 or 2",
+        ),
+        (
+            OnlineScoreRequest,
+            dict(first_name="Alexey", email="a@b"),
+            "request must contain at least on of the following",
+        ),
+    ],
+)
+def test_compiled_validation_errors(
+    req_class: t.Type, data: t.Dict, error: str
+):
+    with pytest.raises(ValidationError, match=error):
+        req_class(**data)
+
+
+def test_request_slots():
+    req = ClientsInterestsRequest(client_ids=[1])
+    assert not hasattr(req, "__dict__")
+    assert req.date is None
+    assert req.as_dict() == {"client_ids": [1], "date": None}
+    assert req.non_empty_fields_lst == ["client_ids"]
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("79175002040", True),
+        (79175002040, True),
+        ("+79175002040", True),
+        ("7917500204", False),
+        ("89175002040", False),
+        (-79175002040, False),
+    ],
+)
+def test_is_phone(value: t.Union[str, int], expected: bool):
+    assert is_phone(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("05.01.1960", datetime(1960, 1, 5)),
+        ("5.1.1960", datetime(1960, 1, 5)),
+        ("29.02.2000", datetime(2000, 2, 29)),
+    ],
+)
+def test_parse_date(value: str, expected: datetime):
+    assert parse_date(value) == expected
+
+
+@pytest.mark.parametrize("value", ["29.02.2001", "05-01-1960", "5.01.19600"])
+def test_parse_wrong_date(value: str):
+    with pytest.raises(ValueError):
+        parse_date(value)
+
+
+def test_parsed_birthday():
+    req = OnlineScoreRequest(gender=1, birthday="05.01.1960")
+    assert req.birthday == "05.01.1960"
+    assert req.parsed["birthday"] == datetime(1960, 1, 5)
+    assert OnlineScoreRequest(first_name="a", last_name="b").parsed == {
+        "birthday": None
+    }
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from otus_scoring_api import codec
+from otus_scoring_api.classes import ClientsInterestsRequest, ValidationError
+
+PAYLOADS = [
+    {"response": {"1": ["cars", "pets"], "2": []}, "code": 200},
+    {"response": {"score": 3.5}, "code": 200},
+    {"error": "Wrong arguments: 'имя/фамилия'", "code": 422},
+    {1: [2**70, -1, 0.1, True, None]},
+]
+
+
+@pytest.mark.parametrize("backend", list(codec.BACKENDS))
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_identical_output(backend: str, payload: dict):
+    dumps, loads = codec.BACKENDS[backend]
+    data = dumps(payload)
+    assert data == codec.json_dumps(payload)
+    assert loads(data) == json.loads(data)
+
+
+@pytest.mark.parametrize("backend", list(codec.BACKENDS))
+@pytest.mark.parametrize("data", [b"[NaN]", b"[1e400]", b"[-Infinity]"])
+def test_loads_accepts_json_documents(backend: str, data: bytes):
+    _, loads = codec.BACKENDS[backend]
+    assert repr(loads(data)) == repr(json.loads(data))
+
+
+@pytest.mark.parametrize("backend", list(codec.BACKENDS))
+@pytest.mark.parametrize(
+    "client_id,valid",
+    [
+        (2**63 - 1, True),
+        (-(2**63), True),
+        (2**63, False),
+        (2**64, False),
+    ],
+)
+def test_client_ids_validation(backend: str, client_id: int, valid: bool):
+    _, loads = codec.BACKENDS[backend]
+    arguments = loads(b'{"client_ids": [%d]}' % client_id)
+    if valid:
+        assert ClientsInterestsRequest(**arguments).client_ids == [client_id]
+    else:
+        with pytest.raises(ValidationError):
+            ClientsInterestsRequest(**arguments)
+
+
+def test_use_backend(monkeypatch):
+    monkeypatch.setattr(codec, "dumps", codec.dumps)
+    monkeypatch.setattr(codec, "loads", codec.loads)
+    monkeypatch.setattr(codec, "backend", codec.backend)
+    codec.use("json")
+    assert codec.backend == "json"
+    assert codec.dumps({"a": "б"}) == '{"a":"б"}'.encode("utf-8")
+    with pytest.raises(ValueError):
+        codec.use("simplejson")
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_dumps_raw_without_raw_values(payload: dict):
+    assert codec.dumps_raw(payload) == codec.dumps(payload)
+
+
+def test_dumps_raw():
+    payload = {
+        "response": {"1": codec.RawJSON(b'["cars", "pets"]'), "2": []},
+        "code": 200,
+    }
+    assert codec.dumps_raw(payload) == (
+        b'{"response":{"1":["cars", "pets"],"2":[]},"code":200}'
+    )
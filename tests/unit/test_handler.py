@@ -1,9 +1,18 @@
+import asyncio
 import datetime
+import hashlib
+import time
 import typing as t
 
 import pytest
 
-from otus_scoring_api.constants import FORBIDDEN, INVALID_REQUEST, OK
+from otus_scoring_api import handlers, metrics
+from otus_scoring_api.constants import (
+    FORBIDDEN,
+    INTERNAL_ERROR,
+    INVALID_REQUEST,
+    OK,
+)
 
 
 def test_empty_request(get_response: t.Callable):
@@ -35,6 +44,21 @@ def test_empty_request(get_response: t.Callable):
             "token": "",
             "arguments": {},
         },
+        # a lone surrogate, as decoded from "\\ud800" in JSON
+        {
+            "account": "horns&hoofs",
+            "login": "admin",
+            "method": "online_score",
+            "token": "\ud800",
+            "arguments": {},
+        },
+        {
+            "account": "horns\ud800",
+            "login": "h&f",
+            "method": "online_score",
+            "token": "\ud800",
+            "arguments": {},
+        },
     ],
 )
 def test_bad_auth(get_response: t.Callable, req_body: t.Dict):
@@ -252,3 +276,235 @@ def test_ok_interests_request(
         for v in response.values()
     )
     assert context.get("nclients") == len(arguments["client_ids"])
+
+
+def test_async_handler_bad_auth(get_async_response: t.Callable):
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "token": "",
+        "arguments": {},
+    }
+    _, code = get_async_response(req_body)
+    assert code == FORBIDDEN
+
+
+def test_async_handler_ok_score_request(
+    get_async_response: t.Callable, set_valid_auth: t.Callable
+):
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+    }
+    set_valid_auth(req_body)
+    context = {}
+    response, code = get_async_response(req_body, context=context)
+    assert code == OK
+    assert response == {"score": 3.0}
+    assert sorted(context["has"]) == ["email", "phone"]
+
+
+def test_async_handler_ok_interests_request(
+    get_async_response: t.Callable, set_valid_auth: t.Callable
+):
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "clients_interests",
+        "arguments": {"client_ids": [1, 2]},
+    }
+    set_valid_auth(req_body)
+    response, code = get_async_response(req_body)
+    assert code == OK
+    assert sorted(response.keys()) == ["1", "2"]
+    assert all(isinstance(v, list) and len(v) == 2 for v in response.values())
+
+
+def test_auth_is_memoized(
+    monkeypatch, get_response: t.Callable, set_valid_auth: t.Callable
+):
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+    }
+    set_valid_auth(req_body)
+    _, code = get_response(req_body)
+    assert code == OK
+
+    calls = []
+    sha512 = hashlib.sha512
+    monkeypatch.setattr(
+        "otus_scoring_api.handlers.hashlib.sha512",
+        lambda data: calls.append(data) or sha512(data),
+    )
+    _, code = get_response(req_body)
+    assert code == OK
+    assert not calls
+
+    req_body["token"] = "0" * len(req_body["token"])
+    _, code = get_response(req_body)
+    assert code == FORBIDDEN
+    assert len(calls) == 1
+
+
+def test_admin_digest_refreshed(monkeypatch, set_valid_auth: t.Callable):
+    monkeypatch.setattr(handlers, "_admin_digest", (0.0, b"stale"))
+    req_body = {"login": "admin"}
+    set_valid_auth(req_body)
+    assert handlers.admin_digest() == req_body["token"].encode()
+    expires, _ = handlers._admin_digest
+    assert time.time() < expires <= time.time() + 3600
+
+
+@pytest.fixture
+def batch_request(set_valid_auth: t.Callable) -> t.List[t.Dict]:
+    bodies = [
+        {
+            "account": "horns&hoofs",
+            "login": "h&f",
+            "method": "online_score",
+            "arguments": {"phone": "79175002040", "email": "a@otus.ru"},
+        },
+        {
+            "account": "horns&hoofs",
+            "login": "h&f",
+            "method": "online_score",
+            "arguments": {"first_name": "a", "last_name": "b"},
+        },
+        {
+            "account": "horns&hoofs",
+            "login": "h&f",
+            "method": "clients_interests",
+            "arguments": {"client_ids": [1, 2]},
+        },
+        {
+            "account": "horns&hoofs",
+            "login": "h&f",
+            "method": "clients_interests",
+            "arguments": {"client_ids": [2, 3]},
+        },
+        {
+            "login": "admin",
+            "method": "online_score",
+            "arguments": {"first_name": "a", "last_name": "b"},
+        },
+    ]
+    for body in bodies:
+        set_valid_auth(body)
+    bodies.append(
+        {
+            "login": "h&f",
+            "method": "online_score",
+            "token": "x",
+            "arguments": {},
+        }
+    )
+    return bodies
+
+
+def test_batch_request(
+    monkeypatch, batch_request: t.List[t.Dict], store_with_mocked_redis
+):
+    store = store_with_mocked_redis
+    store.set("i:2", '["cars"]')
+    calls = []
+    for name in ("get_many", "cache_get_many", "check_auth"):
+        target = store if name != "check_auth" else handlers
+        func = getattr(target, name)
+        monkeypatch.setattr(
+            target,
+            name,
+            lambda *args, func=func, name=name: calls.append(name)
+            or func(*args),
+        )
+
+    response, code = handlers.batch_handler(
+        {"body": batch_request, "headers": {}}, {}, store
+    )
+    assert code == OK
+    assert response == [
+        {"response": {"score": 3.0}, "code": OK},
+        {"response": {"score": 0.5}, "code": OK},
+        {"response": {"1": [], "2": ["cars"]}, "code": OK},
+        {"response": {"2": ["cars"], "3": []}, "code": OK},
+        {"response": {"score": 42}, "code": OK},
+        {"error": "Forbidden", "code": FORBIDDEN},
+    ]
+    assert sorted(calls) == [
+        "cache_get_many",
+        "check_auth",
+        "check_auth",
+        "check_auth",
+        "get_many",
+    ]
+
+
+def test_batch_items_fail_separately(
+    monkeypatch, batch_request: t.List[t.Dict], store_with_mocked_redis
+):
+    null_ids = dict(batch_request[2], arguments={"client_ids": None})
+    body = batch_request[:2] + [null_ids, batch_request[2]]
+    response, code = handlers.batch_handler(
+        {"body": body, "headers": {}}, {}, store_with_mocked_redis
+    )
+    assert code == OK
+    assert [r["code"] for r in response] == [OK, OK, INVALID_REQUEST, OK]
+
+    def broken(*args):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(handlers, "score_arguments", broken)
+    response, code = handlers.batch_handler(
+        {"body": body, "headers": {}}, {}, store_with_mocked_redis
+    )
+    assert code == OK
+    assert [r["code"] for r in response] == [
+        INTERNAL_ERROR,
+        INTERNAL_ERROR,
+        INVALID_REQUEST,
+        OK,
+    ]
+
+
+def test_batch_items_counted_by_method(
+    batch_request: t.List[t.Dict], store_with_mocked_redis
+):
+    def count(method: str, code: int) -> float:
+        return metrics.method_requests.labels(method, code).value
+
+    null_ids = dict(batch_request[2], arguments={"client_ids": None})
+    body = batch_request[:3] + [null_ids]
+    before = [count("online_score", OK), count("clients_interests", OK)]
+    invalid = count("clients_interests", INVALID_REQUEST)
+    handlers.batch_handler(
+        {"body": body, "headers": {}}, {}, store_with_mocked_redis
+    )
+    after = [count("online_score", OK), count("clients_interests", OK)]
+    assert [a - b for a, b in zip(after, before)] == [2, 1]
+    assert count("clients_interests", INVALID_REQUEST) == invalid + 1
+
+
+@pytest.mark.parametrize("body", [{}, [], [{}] * 1001])
+def test_invalid_batch_request(body: t.Any, mock_store):
+    response, code = handlers.batch_handler({"body": body}, {}, mock_store)
+    assert code == INVALID_REQUEST
+    assert response
+
+
+def test_async_batch_request(
+    batch_request: t.List[t.Dict], async_store_with_mocked_redis
+):
+    response, code = asyncio.run(
+        handlers.async_batch_handler(
+            {"body": batch_request, "headers": {}},
+            {},
+            async_store_with_mocked_redis,
+        )
+    )
+    assert code == OK
+    assert [r["code"] for r in response] == [OK] * 5 + [FORBIDDEN]
@@ -0,0 +1,89 @@
+import itertools
+import json
+import typing as t
+
+import pytest
+
+from otus_scoring_api import loadgen
+from otus_scoring_api.classes import MethodRequest
+from otus_scoring_api.handlers import check_auth
+
+
+def test_synthetic_requests():
+    requests = list(
+        itertools.islice(
+            loadgen.synthetic_requests(
+                score_ratio=0.3,
+                min_clients=2,
+                max_clients=5,
+                admin_share=0.1,
+                seed=1,
+            ),
+            1000,
+        )
+    )
+    methods = [method for _, _, method in requests]
+    assert 200 < methods.count("online_score") < 400
+    for path, body, method in requests:
+        request = MethodRequest(**json.loads(body))
+        assert path == "/method" and request.method == method
+        assert check_auth(request)
+        if method == "clients_interests":
+            assert 2 <= len(request.arguments["client_ids"]) <= 5
+    assert 50 < sum(b'"login": "admin"' in body for _, body, _ in requests)
+
+
+def test_replay_requests(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    path.write_text(
+        '{"method": "online_score", "arguments": {}}\n'
+        "\n"
+        '{"path": "/batch", "body": [{"method": "online_score"}]}\n'
+    )
+    requests = loadgen.replay_requests(str(path), loop=False)
+    assert [(p, m) for p, _, m in requests] == [
+        ("/method", "online_score"),
+        ("/batch", "batch"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "p,expected",
+    [(0, 1), (20, 1), (21, 2), (50, 3), (90, 5), (99, 5), (100, 5)],
+)
+def test_percentile(p: float, expected: float):
+    assert loadgen.percentile([1, 2, 3, 4, 5], p) == expected
+
+
+def test_load_generator(run_server: t.Callable):
+    url = run_server()
+    generator = loadgen.LoadGenerator(
+        url,
+        loadgen.synthetic_requests(seed=1),
+        concurrency=2,
+        total=20,
+    )
+    results, elapsed = generator.run()
+    summary = loadgen.summarize(results, elapsed)
+    assert summary["requests"] == 20
+    assert {row["status"] for row in summary["results"]} == {200}
+    assert {row["method"] for row in summary["results"]} == {
+        "clients_interests",
+        "online_score",
+    }
+    row = summary["results"][0]
+    assert row["p50"] <= row["p95"] <= row["p99"] <= row["max"]
+    assert "online_score" in loadgen.format_report(summary)
+
+
+def test_load_generator_rate(run_server: t.Callable):
+    generator = loadgen.LoadGenerator(
+        run_server(),
+        loadgen.synthetic_requests(seed=1),
+        concurrency=2,
+        rate=100,
+        duration=0.2,
+    )
+    results, elapsed = generator.run()
+    assert 15 <= results.count <= 20
+    assert elapsed >= 0.15
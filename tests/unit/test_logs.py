@@ -0,0 +1,73 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from otus_scoring_api import logs
+
+
+@pytest.fixture
+def access_log(caplog) -> logs.AccessLog:
+    caplog.set_level(logging.INFO, logger="otus_scoring_api.access")
+    return logs.AccessLog()
+
+
+def records(caplog) -> list:
+    return [json.loads(r.getMessage()) for r in caplog.records]
+
+
+def test_access_record(caplog, access_log: logs.AccessLog):
+    access_log.log({"request_id": "1"}, 200, 0.0015, b'{"a":1}', b"{}")
+    (record,) = records(caplog)
+    assert record == {
+        "request_id": "1",
+        "code": 200,
+        "duration": 1.5,
+        "request_size": 7,
+        "response_size": 2,
+    }
+    assert "\n" not in caplog.records[0].getMessage()
+
+
+def test_access_log_bodies(caplog, access_log: logs.AccessLog):
+    access_log.log_bodies = True
+    access_log.max_body_size = 4
+    access_log.log({}, 422, 0.0, b'{"login":"\n"}', b'{"code":422}')
+    (record,) = records(caplog)
+    assert record["request"] == '{"lo...(13 bytes)'
+    assert record["response"] == '{"co...(12 bytes)'
+    assert "\n" not in caplog.records[0].getMessage()
+
+
+def test_access_log_sampling(caplog, access_log: logs.AccessLog):
+    access_log.sample_rate = 0.0
+    access_log.log({}, 200, 0.0)
+    access_log.log({}, 500, 0.0)
+    assert [r["code"] for r in records(caplog)] == [500]
+
+
+def test_records_written_by_listener(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    path = tmp_path / "api.log"
+    formatted_in = []
+
+    class Message:
+        def __str__(self):
+            formatted_in.append(threading.current_thread())
+            return "message"
+
+    listener = logs.setup_logging(str(path))
+    try:
+        logging.info("%s", Message())
+    finally:
+        listener.stop()
+        for h in root.handlers[:]:
+            root.removeHandler(h)
+        for h in handlers:
+            root.addHandler(h)
+        root.setLevel(level)
+
+    assert path.read_text().endswith(" I message\n")
+    assert formatted_in and threading.current_thread() not in formatted_in
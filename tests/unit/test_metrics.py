@@ -0,0 +1,62 @@
+import pytest
+
+from otus_scoring_api import metrics
+
+
+def test_counter():
+    counter = metrics.Counter("test_events_total", "Events", ("kind",))
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    counter.labels('b"').inc()
+    lines = list(counter.collect())
+    assert lines == [
+        "# HELP scoring_api_test_events_total Events",
+        "# TYPE scoring_api_test_events_total counter",
+        'scoring_api_test_events_total{kind="a"} 3',
+        'scoring_api_test_events_total{kind="b\\""} 1',
+    ]
+    with pytest.raises(ValueError):
+        counter.labels()
+
+
+def test_histogram():
+    histogram = metrics.Histogram(
+        "test_duration_seconds", "Duration", buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.labels().observe(value)
+    samples = list(histogram.collect())[2:]
+    assert samples == [
+        'scoring_api_test_duration_seconds_bucket{le="0.1"} 2',
+        'scoring_api_test_duration_seconds_bucket{le="1"} 3',
+        'scoring_api_test_duration_seconds_bucket{le="+Inf"} 4',
+        "scoring_api_test_duration_seconds_sum 2.65",
+        "scoring_api_test_duration_seconds_count 4",
+    ]
+
+
+def test_metric_without_samples_is_abstract():
+    class Gauge(metrics.Metric):
+        def make_value(self) -> float:
+            return 0.0
+
+    with pytest.raises(TypeError):
+        Gauge("test_gauge", "Gauge")
+
+
+def test_render_store_stats(store_with_mocked_redis):
+    store_with_mocked_redis.cache_get("k1")
+    text = metrics.render(store_with_mocked_redis).decode("utf-8")
+    assert 'scoring_api_breaker_state{state="closed"} 1' in text
+    assert 'scoring_api_local_cache{stat="misses"} 1' in text
+    assert (
+        'scoring_api_store_call_duration_seconds_count{command="pipeline"}'
+        in text
+    )
+    assert text.endswith("\n")
+
+
+def test_render_without_store_stats():
+    text = metrics.render(object()).decode("utf-8")
+    assert "breaker" not in text
+    assert "local_cache" not in text
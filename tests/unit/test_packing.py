@@ -0,0 +1,93 @@
+import json
+import math
+
+import pytest
+
+from otus_scoring_api import codec, packing
+
+
+@pytest.mark.parametrize("score", [0, 0.5, 3.5, 5.0, 127.5, 3.21, -1.5, 1e9])
+def test_score_round_trip(score: float):
+    packed = packing.pack_score(score)
+    assert packing.is_packed(packed)
+    assert math.isclose(packing.unpack_score(packed), score)
+
+
+def test_pack_score_size():
+    assert len(packing.pack_score(3.5)) == 2
+    assert len(packing.pack_score(3.21)) == 9
+
+
+@pytest.mark.parametrize("value", [b"3.21", "3.21", 3.21])
+def test_unpack_old_score(value):
+    assert math.isclose(packing.unpack_score(value), 3.21)
+
+
+@pytest.mark.parametrize(
+    "interests",
+    [
+        [],
+        ["cars", "pets"],
+        ["otus", "кино", "cars"],
+        ["x" * packing.MAX_NAME_SIZE],
+    ],
+)
+def test_interests_round_trip(interests: list):
+    packed = packing.pack_interests(interests)
+    assert packing.is_packed(packed)
+    assert packing.unpack_interests(packed) == interests
+    assert packing.interests_json(packed) == codec.dumps(interests)
+
+
+def test_pack_interests_size():
+    interests = ["cars", "pets", "travel"]
+    assert len(packing.pack_interests(interests)) == 4
+    assert len(json.dumps(interests)) == 26
+
+
+@pytest.mark.parametrize(
+    "interests", [["x" * (packing.MAX_NAME_SIZE + 1)], [1, "cars"], {"a": 1}]
+)
+def test_pack_interests_fallback_to_json(interests):
+    packed = packing.pack_interests(interests)
+    assert not packing.is_packed(packed)
+    assert packing.unpack_interests(packed) == interests
+
+
+@pytest.mark.parametrize(
+    "value,result",
+    [
+        (None, []),
+        (b"", []),
+        ('["cars"]', ["cars"]),
+        (b' ["cars", "pets"]\n', ["cars", "pets"]),
+    ],
+)
+def test_unpack_old_interests(value, result: list):
+    assert packing.unpack_interests(value) == result
+
+
+def test_repack_interests():
+    packed = packing.pack_interests(["cars"])
+    assert packing.repack_interests(b'["cars"]') == packed
+    assert packing.repack_interests(packed) is None
+    assert packing.repack_interests(None) is None
+    assert packing.repack_interests('[1, "cars"]') is None
+    with pytest.raises(ValueError):
+        packing.repack_interests(b"[cars")
+
+
+@pytest.mark.parametrize(
+    "value,error",
+    [
+        (bytes((packing.INTERESTS, len(packing.VOCABULARY))), "unknown"),
+        (bytes((packing.INTERESTS, 0, 0xFE)), "unknown"),
+        (bytes((packing.INTERESTS, packing.ESCAPE)), "truncated"),
+        (bytes((packing.INTERESTS, packing.ESCAPE, 3)) + b"ab", "truncated"),
+    ],
+)
+def test_unpack_malformed_interests(value: bytes, error: str):
+    with pytest.raises(ValueError, match=error):
+        packing.unpack_interests(value)
+    with pytest.raises(ValueError, match=error):
+        packing.interests_json(value)
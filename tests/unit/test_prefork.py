@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import gc
+import os
+import signal
+import threading
+import time
+import typing as t
+
+import pytest
+import requests
+
+from otus_scoring_api.api import MainHTTPHandler, make_server
+from otus_scoring_api.constants import OK
+from otus_scoring_api.prefork import PreforkServer
+
+if t.TYPE_CHECKING:
+    import socket
+
+    from otus_scoring_api.store import AbstractStore
+
+
+def serve(sock: socket.socket):
+    server = make_server(0, threads=2, sock=sock)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def wait_for(condition: t.Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def is_ok(url: str, req_body: t.Dict) -> bool:
+    try:
+        return requests.post(url, json=req_body).status_code == OK
+    except requests.ConnectionError:
+        return False
+
+
+@pytest.mark.parametrize("reuse_port", [False, True])
+def test_prefork_restarts_workers(
+    monkeypatch,
+    mock_store: AbstractStore,
+    set_valid_auth: t.Callable,
+    reuse_port: bool,
+):
+    monkeypatch.setattr(MainHTTPHandler, "store", mock_store)
+    supervisor = PreforkServer(
+        serve, "127.0.0.1", 0, workers=2, reuse_port=reuse_port
+    )
+    supervisor.bind()
+    url = "http://%s:%s/method" % supervisor.address
+    thread = threading.Thread(target=supervisor.supervise)
+    thread.start()
+
+    req_body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "arguments": {"first_name": "a", "last_name": "b"},
+    }
+    set_valid_auth(req_body)
+    try:
+        assert wait_for(lambda: len(supervisor.children) == 2)
+        assert wait_for(lambda: is_ok(url, req_body))
+
+        killed = supervisor.children[0]
+        os.kill(killed, signal.SIGKILL)
+        assert wait_for(
+            lambda: killed not in supervisor.children
+            and len(supervisor.children) == 2
+        )
+        assert requests.post(url, json=req_body).status_code == OK
+    finally:
+        supervisor.stop()
+        thread.join()
+        gc.unfreeze()
+
+    assert supervisor.children == []
+
+
+def serve_stuck(sock: socket.socket):
+    # e.g. blocked in a store call which ignores the interruption
+    while True:
+        try:
+            time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+
+
+def test_prefork_kills_stuck_workers():
+    supervisor = PreforkServer(
+        serve_stuck, "127.0.0.1", 0, workers=2, shutdown_timeout=0.5
+    )
+    thread = threading.Thread(target=supervisor.supervise)
+    thread.start()
+    try:
+        assert wait_for(lambda: len(supervisor.children) == 2)
+        children = supervisor.children
+    finally:
+        supervisor.stop()
+        thread.join(5)
+        gc.unfreeze()
+
+    assert not thread.is_alive()
+    assert supervisor.children == []
+    for pid in children:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
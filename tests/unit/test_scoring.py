@@ -7,13 +7,20 @@ from datetime import datetime
 
 import pytest
 
+from otus_scoring_api import codec, packing
 from otus_scoring_api.scoring import (
     get_interests,
+    get_interests_many,
     get_score,
+    get_scores_many,
     interests_key_in_store,
+    migrate_interests,
+    raw_interests,
     score_key_in_store,
     ScoringError,
+    set_interests,
 )
+from otus_scoring_api.store import shared_cache_key
 
 if t.TYPE_CHECKING:
     from otus_scoring_api.store import RedisStore
@@ -117,3 +124,132 @@ def test_get_interests_error(store_with_mocked_redis: RedisStore):
     setattr(store_with_mocked_redis.redis, "connected", False)
     with pytest.raises(ScoringError):
         get_interests(store_with_mocked_redis, "sample_cid")
+
+
+def test_get_interests_many(store_with_mocked_redis: RedisStore):
+    value = ["cars", "pets"]
+    store_with_mocked_redis.set(interests_key_in_store("1"), json.dumps(value))
+
+    result = get_interests_many(store_with_mocked_redis, ["1", "2", "1"])
+    assert result == {"1": value, "2": []}
+
+
+def test_get_interests_many_error(store_with_mocked_redis: RedisStore):
+    setattr(store_with_mocked_redis.redis, "connected", False)
+    with pytest.raises(ScoringError):
+        get_interests_many(store_with_mocked_redis, ["1", "2"])
+
+
+def test_get_score_from_shared_cache(store_with_mocked_redis: RedisStore):
+    data = dict(phone="79311234567", first_name="Ivan", last_name="Ivanov")
+    key = score_key_in_store(**data)
+    store_with_mocked_redis.cache_set(key, 3.21, 60)
+    store_with_mocked_redis.cache.clear()
+    # simulate the reply of a real Redis
+    store_with_mocked_redis.redis.data[shared_cache_key(key)] = b"3.21"
+
+    result = get_score(store=store_with_mocked_redis, email=None, **data)
+    assert math.isclose(result, 3.21)
+
+
+@pytest.mark.parametrize(
+    "value,raw",
+    [
+        (None, b"[]"),
+        (b' ["cars", "pets"]\n', b'["cars","pets"]'),
+        ('["кино"]', '["кино"]'.encode("utf-8")),
+        (b'{"a": 1}', b'{"a":1}'),
+        (packing.pack_interests(["cars", "кино"]), '["cars","кино"]'.encode()),
+    ],
+)
+def test_raw_interests(value: t.Union[bytes, str, None], raw: bytes):
+    assert raw_interests(value) == raw
+
+
+def test_get_raw_interests_many(store_with_mocked_redis: RedisStore):
+    store_with_mocked_redis.set(interests_key_in_store("1"), '["cars"]')
+    result = get_interests_many(store_with_mocked_redis, ["1", "2"], raw=True)
+    assert result == codec.RawJSON(b'{"1":["cars"],"2":[]}')
+
+
+def test_score_key_in_store():
+    key = score_key_in_store("79311234567", first_name="Ivan")
+    assert key.startswith(b"s:") and len(key) == 18
+    assert key != score_key_in_store("79311234567", first_name="Petr")
+
+
+def test_get_scores_many_caches_packed_scores(
+    store_with_mocked_redis: RedisStore,
+):
+    arguments = [dict(phone="79311234567", email="123@123.ru")]
+    assert get_scores_many(store_with_mocked_redis, arguments) == [3.0]
+
+    key = shared_cache_key(score_key_in_store("79311234567"))
+    assert store_with_mocked_redis.redis.data[key] == packing.pack_score(3)
+    store_with_mocked_redis.cache.clear()
+    assert get_scores_many(store_with_mocked_redis, arguments) == [3.0]
+
+
+def test_get_packed_interests(store_with_mocked_redis: RedisStore):
+    set_interests(store_with_mocked_redis, "1", ["cars", "pets"])
+    store_with_mocked_redis.set(interests_key_in_store("2"), '["otus"]')
+
+    assert get_interests(store_with_mocked_redis, "1") == ["cars", "pets"]
+    result = get_interests_many(store_with_mocked_redis, ["1", "2"])
+    assert result == {"1": ["cars", "pets"], "2": ["otus"]}
+    result = get_interests_many(store_with_mocked_redis, ["1", "2"], raw=True)
+    assert result == codec.RawJSON(b'{"1":["cars","pets"],"2":["otus"]}')
+
+
+def test_migrate_interests(store_with_mocked_redis: RedisStore):
+    store = store_with_mocked_redis
+    store.set(interests_key_in_store("1"), b'["cars", "pets"]')
+    set_interests(store, "2", ["otus"])
+    store.set(interests_key_in_store("3"), b"[cars")
+
+    assert migrate_interests(store, ["1", "2", "3", "4"], batch_size=2) == 1
+    assert store.get(interests_key_in_store("1")) == packing.pack_interests(
+        ["cars", "pets"]
+    )
+    assert store.get(interests_key_in_store("3")) == b"[cars"
+    assert get_interests_many(store, ["1", "2"]) == {
+        "1": ["cars", "pets"],
+        "2": ["otus"],
+    }
+
+
+@pytest.mark.parametrize("value", [b"[cars]", b'["a"],"3":["x"]', b"[1]]"])
+def test_raw_interests_malformed(value: bytes):
+    with pytest.raises(ValueError):
+        raw_interests(value)
+
+
+@pytest.mark.parametrize("raw", [False, True])
+@pytest.mark.parametrize(
+    "value",
+    [
+        b"[cars]",
+        # written by a release with a longer vocabulary
+        bytes((packing.INTERESTS, len(packing.VOCABULARY))),
+    ],
+)
+def test_get_interests_many_malformed(
+    store_with_mocked_redis: RedisStore, raw: bool, value: bytes
+):
+    store_with_mocked_redis.set(interests_key_in_store("1"), value)
+    with pytest.raises(ScoringError, match="Malformed interests of 1"):
+        get_interests_many(store_with_mocked_redis, ["1"], raw=raw)
+
+
+def test_raw_interests_cannot_inject_clients(
+    store_with_mocked_redis: RedisStore,
+):
+    # a valid JSON string which looks like a list to a bracket check
+    store_with_mocked_redis.set(interests_key_in_store("1"), b'["a", "]"]')
+    store_with_mocked_redis.set(
+        interests_key_in_store("2"), b'["a"],"3":["x"]'
+    )
+    result = get_interests_many(store_with_mocked_redis, ["1"], raw=True)
+    assert codec.loads(result.data) == {"1": ["a", "]"]}
+    with pytest.raises(ScoringError):
+        get_interests_many(store_with_mocked_redis, ["1", "2"], raw=True)
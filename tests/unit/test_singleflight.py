@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+import typing as t
+
+import pytest
+
+from otus_scoring_api.scoring import get_score
+from otus_scoring_api.singleflight import (
+    AsyncSingleFlight,
+    FlightTimeout,
+    SingleFlight,
+)
+from otus_scoring_api.store import AbstractStore
+
+
+def run_concurrently(func: t.Callable, n: int = 8) -> t.List:
+    results: t.List = [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i: int):
+        barrier.wait()
+        try:
+            results[i] = func()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_coalesced():
+    flights, calls = SingleFlight(), []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    assert run_concurrently(lambda: flights.do("k", fetch)) == ["value"] * 8
+    assert len(calls) == 1
+    assert len(flights) == 0
+
+
+def test_error_propagated_to_waiters():
+    flights = SingleFlight()
+
+    def fetch():
+        time.sleep(0.1)
+        raise KeyError("k")
+
+    results = run_concurrently(lambda: flights.do("k", fetch))
+    assert all(isinstance(r, KeyError) for r in results)
+    # the failed call is not remembered
+    assert flights.do("k", lambda: 1) == 1
+
+
+def test_waiter_timeout():
+    flights = SingleFlight(timeout=0.05)
+    started = threading.Event()
+
+    def fetch():
+        started.set()
+        time.sleep(0.3)
+        return 1
+
+    leader = threading.Thread(target=flights.do, args=("k", fetch))
+    leader.start()
+    started.wait()
+    with pytest.raises(FlightTimeout):
+        flights.do("k", fetch)
+    leader.join()
+
+
+def test_do_many_shares_keys_in_flight():
+    flights, requested = SingleFlight(), []
+    started = threading.Event()
+
+    def fetch(keys):
+        requested.append(keys)
+        started.set()
+        time.sleep(0.1)
+        return [k.upper() for k in keys]
+
+    leader = threading.Thread(target=flights.do_many, args=(["a", "b"], fetch))
+    leader.start()
+    started.wait()
+    assert flights.do_many(["b", "c", "c", "a"], fetch) == ["B", "C", "C", "A"]
+    leader.join()
+    assert requested == [["a", "b"], ["c"]]
+
+
+def test_async_calls_coalesced():
+    flights, calls = AsyncSingleFlight(), []
+
+    async def fetch(keys):
+        calls.append(keys)
+        await asyncio.sleep(0.05)
+        return [k * 2 for k in keys]
+
+    async def scenario():
+        return await asyncio.gather(
+            flights.do_many(["a", "b"], fetch),
+            flights.do_many(["b"], fetch),
+            flights.do_many(["a", "c"], fetch),
+        )
+
+    assert asyncio.run(scenario()) == [["aa", "bb"], ["bb"], ["aa", "cc"]]
+    assert calls == [["a", "b"], ["c"]]
+
+
+def test_async_timeout_and_error():
+    flights = AsyncSingleFlight(timeout=0.01)
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise KeyError("k")
+
+    async def scenario():
+        return await asyncio.gather(
+            flights.do("k", fail),
+            flights.do("k", fail),
+            return_exceptions=True,
+        )
+
+    leader, waiter = asyncio.run(scenario())
+    assert isinstance(leader, KeyError)
+    assert isinstance(waiter, FlightTimeout)
+
+
+def test_async_leader_cancelled():
+    flights, calls = AsyncSingleFlight(), []
+
+    async def fetch(keys):
+        calls.append(keys)
+        await asyncio.sleep(0.05)
+        return [k * 2 for k in keys]
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do_many(["a"], fetch))
+        await asyncio.sleep(0)
+        waiters = asyncio.gather(
+            flights.do_many(["a", "b"], fetch),
+            flights.do_many(["a"], fetch),
+        )
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiters, leader.cancelled()
+
+    results, cancelled = asyncio.run(scenario())
+    assert cancelled
+    assert results == [["aa", "bb"], ["aa"]]
+    # the first waiter loads the key again, the second one waits for it
+    assert calls == [["a"], ["b"], ["a"]]
+    assert not flights
+
+
+def test_score_stampede():
+    class SlowCacheStore(AbstractStore):
+        def __init__(self):
+            super().__init__()
+            self.cached = []
+
+        def get(self, key):
+            pass
+
+        def set(self, key, value):
+            pass
+
+        def cache_get(self, key):
+            pass
+
+        def cache_set(self, key, value, timeout):
+            time.sleep(0.1)
+            self.cached.append(key)
+
+    store = SlowCacheStore()
+    scores = run_concurrently(
+        lambda: get_score(store, "79175002040", "stupnikov@otus.ru")
+    )
+    assert scores == [3.0] * 8
+    assert len(store.cached) == 1
@@ -0,0 +1,57 @@
+import pstats
+import typing as t
+
+import pytest
+
+from otus_scoring_api.handlers import method_handler
+from otus_scoring_api.timing import PhaseTimer, Profiler
+
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    timer.mark("read")
+    timer.mark("store")
+    timer.mark("read")
+    assert list(timer.phases) == ["read", "store"]
+    assert abs(sum(timer.phases.values()) - timer.total) < 1e-9
+
+    metrics = timer.server_timing().split(", ")
+    assert [m.split(";")[0] for m in metrics] == ["read", "store", "total"]
+    assert all(m.split(";")[1].startswith("dur=") for m in metrics)
+
+
+def test_method_phases(mock_store, set_valid_auth: t.Callable):
+    body = {
+        "account": "horns&hoofs",
+        "login": "h&f",
+        "method": "online_score",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+    }
+    set_valid_auth(body)
+    timer = PhaseTimer()
+    method_handler(
+        {"body": body, "headers": {}, "timer": timer}, {}, mock_store
+    )
+    assert list(timer.phases) == ["request", "auth", "arguments", "store"]
+
+
+def test_profiler_samples_requests(tmp_path):
+    profiler = Profiler(every=2, directory=str(tmp_path))
+    profiles = [profiler.start() for _ in range(4)]
+    assert [p is not None for p in profiles] == [False, True, False, True]
+    for n, profile in enumerate(profiles):
+        profiler.stop(profile, f"request{n}")
+    names = sorted(p.name.split("-", 1)[1] for p in tmp_path.iterdir())
+    assert names == ["request1.prof", "request3.prof"]
+    pstats.Stats(str(next(tmp_path.iterdir())))
+
+
+@pytest.mark.parametrize(
+    "request_id", ["../../pwned", "/tmp/pwned", "..", "", "a/../../b\\c"]
+)
+def test_profiler_dumps_stay_in_directory(tmp_path, request_id):
+    directory = tmp_path / "profiles"
+    directory.mkdir()
+    profiler = Profiler(every=1, directory=str(directory))
+    profiler.stop(profiler.start(), request_id)
+    assert [p.parent for p in tmp_path.rglob("*.prof")] == [directory]
@@ -0,0 +1,172 @@
+import asyncio
+import queue
+import time
+import typing as t
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import ResponseError
+
+from otus_scoring_api.cache import MISSING
+from otus_scoring_api.store import AsyncRedisStore, RedisStore
+from otus_scoring_api.tracking import INVALIDATE_CHANNEL, TrackingCache
+
+
+class FakeConnection:
+    """Connection replying with the pushed responses"""
+
+    def __init__(self):
+        self.commands: t.List[tuple] = []
+        self.replies: queue.Queue = queue.Queue()
+        self.next: t.Any = MISSING
+
+    def push(self, *replies: t.Any) -> None:
+        for reply in replies:
+            self.replies.put(reply)
+
+    def send_command(self, *args: t.Any) -> None:
+        self.commands.append(args)
+
+    def can_read(self, timeout: float = 0) -> bool:
+        if self.next is MISSING:
+            try:
+                self.next = self.replies.get(timeout=timeout)
+            except queue.Empty:
+                return False
+        return True
+
+    def read_response(self) -> t.Any:
+        if not self.can_read(timeout=1):
+            raise RedisConnectionError("no reply")
+        reply, self.next = self.next, MISSING
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def disconnect(self) -> None:
+        pass
+
+
+def wait_for(condition: t.Callable[[], bool], timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition is not met"
+        time.sleep(0.001)
+
+
+SUBSCRIBED = [b"subscribe", INVALIDATE_CHANNEL.encode(), 1]
+
+
+def test_listener_invalidates_keys():
+    conn = FakeConnection()
+    conn.push(7, b"OK", SUBSCRIBED)
+    tracking = TrackingCache(["i:"], lambda: conn, sweep_interval=None)
+    tracking.start()
+    try:
+        wait_for(lambda: tracking.active)
+        assert conn.commands == [
+            ("CLIENT", "ID"),
+            ("CLIENT", "TRACKING", "ON", "REDIRECT", 7, "BCAST")
+            + ("PREFIX", "i:"),
+            ("SUBSCRIBE", INVALIDATE_CHANNEL),
+        ]
+
+        tracking.set_many(
+            {"i:1": b"1", "i:2": b"2", "x": b"x"}, tracking.epoch
+        )
+        conn.push([b"message", INVALIDATE_CHANNEL.encode(), [b"i:1"]])
+        wait_for(lambda: tracking.invalidations == 1)
+        assert tracking.get_many(["i:1", "i:2", "x"]) == [
+            MISSING,
+            b"2",
+            MISSING,
+        ]
+
+        conn.push([b"message", INVALIDATE_CHANNEL.encode(), None])
+        wait_for(lambda: tracking.invalidations == 2)
+        assert tracking.get_many(["i:2"]) == [MISSING]
+
+        tracking.set_many({"i:2": b"2"}, tracking.epoch)
+        conn.push(RedisConnectionError("connection reset"))
+        wait_for(lambda: not tracking.active)
+        assert tracking.get_many(["i:2"]) == [MISSING]
+    finally:
+        tracking.stop()
+
+
+def test_tracking_unsupported():
+    conn = FakeConnection()
+    conn.push(7, ResponseError("unknown subcommand 'TRACKING'"))
+    tracking = TrackingCache(
+        ["i:"], lambda: conn, fallback_timeout=0.05, sweep_interval=None
+    )
+    tracking.start()
+    tracking._listener.join(timeout=2)
+    assert not tracking._listener.is_alive()
+    assert not tracking.active
+
+    # values expire after the fallback timeout
+    tracking.set_many({"i:1": b"1"}, tracking.epoch)
+    assert tracking.get_many(["i:1"]) == [b"1"]
+    time.sleep(0.06)
+    assert tracking.get_many(["i:1"]) == [MISSING]
+    tracking.stop()
+
+
+def test_values_fetched_before_invalidation_are_not_cached():
+    tracking = TrackingCache(["i:"], sweep_interval=None)
+    epoch = tracking.epoch
+    tracking.invalidate(["i:1"])
+    tracking.set_many({"i:1": b"old"}, epoch)
+    assert tracking.get_many(["i:1"]) == [MISSING]
+
+
+@pytest.fixture
+def tracked_store(monkeypatch) -> t.Iterator[RedisStore]:
+    # invalidations are sent by the tests instead of a listener
+    monkeypatch.setattr(TrackingCache, "start", lambda self: None)
+    store = RedisStore(tracked_prefixes=("i:",), cache_sweep_interval=None)
+    yield store
+    store.close()
+
+
+def test_store_reads_tracked_keys_through_cache(tracked_store: RedisStore):
+    store = tracked_store
+    store.set("i:1", b"1")
+    store.set("k", b"k")
+    assert store.get_many(["i:1", "i:2"]) == [b"1", None]
+
+    # written by another client
+    store.redis.data.update({"i:1": b"new", "i:2": b"2", "k": b"new"})
+    assert store.get("i:1") == b"1"
+    assert store.get_many(["i:1", "i:2"]) == [b"1", None]
+    assert store.get("k") == b"new"
+
+    store.tracking.invalidate([b"i:1", b"i:2"])
+    assert store.get_many(["i:1", "i:2"]) == [b"new", b"2"]
+
+
+def test_store_reads_own_writes(tracked_store: RedisStore):
+    store = tracked_store
+    assert store.get("i:1") is None
+    store.set("i:1", b"1")
+    assert store.get("i:1") == b"1"
+    store.set_many({"i:1": b"2"})
+    assert store.get("i:1") == b"2"
+
+
+def test_async_store_reads_tracked_keys_through_cache(monkeypatch):
+    monkeypatch.setattr(TrackingCache, "start", lambda self: None)
+
+    async def scenario():
+        store = AsyncRedisStore(tracked_prefixes=("i:",))
+        await store.set("i:1", b"1")
+        await store.get("i:1")
+        store.redis.data["i:1"] = b"new"
+        cached = await store.get("i:1")
+        store.tracking.invalidate([b"i:1"])
+        invalidated = await store.get_many(["i:1"])
+        await store.close()
+        return cached, invalidated
+
+    assert asyncio.run(scenario()) == (b"1", [b"new"])